@@ -0,0 +1,55 @@
+"""empty message
+
+Revision ID: ea9514c0f8b7
+Revises: d1f84a6c2e07
+Create Date: 2025-05-13 11:42:09.318204
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "ea9514c0f8b7"
+down_revision: Union[str, None] = "d1f84a6c2e07"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Ближайший выход токена из периода 7д/30д для кошельков, посчитанных до появления next_period_expiry_at
+# (calculations.calculate_next_period_expiry). Считается от last_stats_check, а не от текущего времени:
+# если токен уже вышел из периода после последнего пересчета, срок в прошлом и кошелек сразу попадет в пересчет
+BACKFILL_NEXT_PERIOD_EXPIRY_AT = """
+    UPDATE wallet
+    SET next_period_expiry_at = expiry.next_period_expiry_at
+    FROM (
+      SELECT
+        w.id AS wallet_id,
+        min(
+          CASE
+            WHEN coalesce(wt.first_sell_timestamp, wt.first_buy_timestamp) + interval '7 days 1 microsecond'
+              > w.last_stats_check
+            THEN coalesce(wt.first_sell_timestamp, wt.first_buy_timestamp) + interval '7 days 1 microsecond'
+            ELSE coalesce(wt.first_sell_timestamp, wt.first_buy_timestamp) + interval '30 days 1 microsecond'
+          END
+        ) AS next_period_expiry_at
+      FROM wallet w
+      JOIN wallet_token wt ON wt.wallet_id = w.id
+      WHERE w.last_stats_check IS NOT NULL
+        AND w.next_period_expiry_at IS NULL
+        AND coalesce(wt.first_sell_timestamp, wt.first_buy_timestamp) + interval '30 days 1 microsecond'
+          > w.last_stats_check
+      GROUP BY w.id
+    ) AS expiry
+    WHERE wallet.id = expiry.wallet_id
+"""
+
+
+def upgrade() -> None:
+    op.execute(sa.text(BACKFILL_NEXT_PERIOD_EXPIRY_AT))
+
+
+def downgrade() -> None:
+    pass
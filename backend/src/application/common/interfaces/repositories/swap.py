@@ -1,5 +1,6 @@
 from abc import ABC
 from typing import List, Optional
+from uuid import UUID
 
 from src.domain.entities.swap import Swap, SwapEventType
 
@@ -29,3 +30,16 @@ class SwapRepositoryInterface(GenericRepositoryInterface[Swap], ABC):
     ) -> List[Swap]:
         """Возвращает соседние сделки (buy/sell) по токену в заданном диапазоне блоков"""
         raise NotImplementedError
+
+    async def get_first_trades_neighbors(
+        self,
+        wallet_ids: List[UUID],
+        blocks_before: int = 3,
+        blocks_after: int = 3,
+        max_tokens: int = 1000,
+    ) -> List[dict]:
+        """
+        Первые покупка и продажа каждого из кошельков по его токенам и первые сделки того же типа других кошельков
+        в диапазоне блоков вокруг них - одним запросом по всем кошелькам и токенам
+        """
+        raise NotImplementedError
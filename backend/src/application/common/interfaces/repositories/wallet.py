@@ -92,6 +92,11 @@ class WalletRepositoryInterface(GenericRepositoryInterface[Wallet], ABC):
     async def get_wallets_for_buygt15k_statistic(self) -> list[Wallet]:
         raise NotImplementedError
 
+    @abstractmethod
+    async def get_related_wallets(self, wallet_id: UUID) -> list[dict]:
+        """Связанные кошельки из wallet_relation со статистикой, по убыванию времени последней общей сделки"""
+        raise NotImplementedError
+
     @abstractmethod
     async def get_wallets_by_token_addresses(
         self,
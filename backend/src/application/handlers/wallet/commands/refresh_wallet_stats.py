@@ -1,6 +1,9 @@
 from pydantic import BaseModel
+from redis.asyncio import Redis
 
-from src.infra.celery.tasks import update_single_wallet_statistics_task
+from src.infra.celery.tasks import update_wallets_statistics_batch_task
+from src.infra.redis.wallet_refresh_queue import RedisWalletRefreshQueue
+from src.settings import config
 
 
 class RefreshWalletStatsResponse(BaseModel):
@@ -8,9 +11,20 @@ class RefreshWalletStatsResponse(BaseModel):
 
 
 class RefreshWalletStatsCommandHandler:
-    def __init__(self) -> None:
-        pass
+    def __init__(self, redis: Redis) -> None:
+        self._refresh_queue = RedisWalletRefreshQueue(
+            redis,
+            window_seconds=config.wallet_statistic_updater.refresh_batch_window_seconds,
+            pending_ttl_seconds=config.wallet_statistic_updater.refresh_pending_ttl_seconds,
+        )
 
     async def __call__(self, address) -> RefreshWalletStatsResponse:
-        task = update_single_wallet_statistics_task.apply_async(kwargs={"address": address})
-        return RefreshWalletStatsResponse(task_id=task.id)
+        # Запросы за окно объединяются в один батч, id задачи - id батча
+        task_id, new_batch_id = await self._refresh_queue.add(address)
+        if new_batch_id:
+            update_wallets_statistics_batch_task.apply_async(
+                kwargs={"batch_id": new_batch_id},
+                task_id=new_batch_id,
+                countdown=self._refresh_queue.window_seconds + 1,  # С запасом на запросы, успевшие войти в окно
+            )
+        return RefreshWalletStatsResponse(task_id=task_id)
@@ -1,13 +1,7 @@
-import asyncio
-from collections import Counter, defaultdict
-from typing import Dict, List, Optional
+from typing import Dict, Optional
 
 from src.application.common.exceptions import WalletNotFoundException
-from src.application.common.interfaces.repositories.swap import SwapRepositoryInterface
-from src.application.common.interfaces.repositories.wallet import (
-    WalletRepositoryInterface,
-    WalletTokenRepositoryInterface,
-)
+from src.application.common.interfaces.repositories.wallet import WalletRepositoryInterface
 from src.application.handlers.wallet.dto import (
     CopiedByWalletDTO,
     CopyingWalletDTO,
@@ -15,19 +9,19 @@ from src.application.handlers.wallet.dto import (
     WalletRelatedWalletsDTO,
 )
 from src.application.handlers.wallet.dto.wallet_related_wallet import UndeterminedRelatedWalletDTO
-from src.domain.entities.swap import SwapEventType
 
 
 class GetWalletRelatedWalletsHandler:
+    """
+    Связанные кошельки из wallet_relation (пересчитывается пакетно по новым свапам, см. wallet_relations_updater).
+    Статус связи определяется при чтении - он зависит от текущей статистики связанного кошелька
+    """
+
     def __init__(
         self,
         wallet_repository: WalletRepositoryInterface,
-        wallet_token_repository: WalletTokenRepositoryInterface,
-        swap_repository: SwapRepositoryInterface,
     ) -> None:
         self._wallet_repository = wallet_repository
-        self._wallet_token_repository = wallet_token_repository
-        self._swap_repository = swap_repository
 
     async def __call__(self, address: str) -> WalletRelatedWalletsDTO:
         wallet = await self._wallet_repository.get_by_address(address=address)
@@ -63,56 +57,41 @@ class GetWalletRelatedWalletsHandler:
         )
 
     async def _get_wallet_related_wallets(self, wallet) -> list[dict]:
-        wallet_tokens = await self._get_wallet_tokens(wallet)
-
-        related_wallets_map = defaultdict(dict)
-
-        # Обрабатываем каждый токен асинхронно для ускорения
-        sem = asyncio.Semaphore(10)
-        results = await asyncio.gather(
-            *(self._process_token(wallet_token, related_wallets_map, sem) for wallet_token in wallet_tokens)
-        )
-        # print(dict(related_wallets_map))
-
-        # Получаем необходимые кошельки из БД
-        wallet_ids = [w_id for w_id, tokens in related_wallets_map.items() if len(tokens) >= 3]
-        wallets = await self._wallet_repository.get_list(
-            filters={
-                "id__in": wallet_ids,
-                "is_bot": False,
-            },
-            include=["stats_all", "stats_30d"],
-        )
+        # Связанные кошельки уже отсортированы по времени последней общей сделки
+        related_wallets = await self._wallet_repository.get_related_wallets(wallet.id)
 
         result = []
-        for wallet in wallets:
-            wallet_tokens = related_wallets_map.get(wallet.id, {})
-            wallet_data = self._get_related_wallet_data_if_suitable(wallet, wallet_tokens)
+        for related_wallet in related_wallets:
+            wallet_data = self._get_related_wallet_data_if_suitable(related_wallet)
             if wallet_data is None:
                 continue
             result.append(wallet_data)
 
-        return sorted(
-            result,
-            key=lambda x: x["last_intersected_tokens_trade_timestamp"],
-            reverse=True,
-        )
+        return result
 
-    def _get_related_wallet_data_if_suitable(self, wallet, tokens: Dict) -> Optional[Dict]:
+    def _get_related_wallet_data_if_suitable(self, related_wallet: Dict) -> Optional[Dict]:
         """Определяем подходит ли кошелек и вычисляем информацию для него"""
 
-        total_token_count = wallet.stats_all.total_token if wallet.stats_all else 0
+        total_token_count = related_wallet["total_token_count"] or 0
 
         if total_token_count and total_token_count >= 20000:
             return None
 
-        status_counts, statuses, last_trade_ts = self._extract_intersected_token_stats(tokens)
-
-        mixed_count = status_counts.get("mixed", 0)
-        same_count = status_counts.get("same", 0)
-        after_count = status_counts.get("after", 0)
-        before_count = status_counts.get("before", 0)
+        mixed_count = related_wallet["mixed_count"]
+        same_count = related_wallet["same_count"]
+        after_count = related_wallet["after_count"]
+        before_count = related_wallet["before_count"]
         intersected_tokens_count = mixed_count + same_count + after_count + before_count
+        statuses = {
+            status
+            for status, count in (
+                ("mixed", mixed_count),
+                ("same", same_count),
+                ("after", after_count),
+                ("before", before_count),
+            )
+            if count
+        }
 
         intersected_tokens_percent = (
             round(intersected_tokens_count / total_token_count * 100, 2)
@@ -129,11 +108,11 @@ class GetWalletRelatedWalletsHandler:
         )
 
         return {
-            "address": wallet.address,
-            "last_activity_timestamp": wallet.last_activity_timestamp,
-            "last_intersected_tokens_trade_timestamp": last_trade_ts,
-            "total_profit_usd_30d": wallet.stats_30d.total_profit_usd,
-            "total_profit_multiplier_30d": wallet.stats_30d.total_profit_multiplier,
+            "address": related_wallet["address"],
+            "last_activity_timestamp": related_wallet["last_activity_timestamp"],
+            "last_intersected_tokens_trade_timestamp": related_wallet["last_intersected_tokens_trade_timestamp"],
+            "total_profit_usd_30d": related_wallet["total_profit_usd_30d"],
+            "total_profit_multiplier_30d": related_wallet["total_profit_multiplier_30d"],
             "total_token_count": total_token_count,
             "intersected_tokens_count": intersected_tokens_count,
             "intersected_tokens_percent": intersected_tokens_percent,
@@ -145,143 +124,6 @@ class GetWalletRelatedWalletsHandler:
             "wallet_status": wallet_status,
         }
 
-    def _extract_intersected_token_stats(self, tokens: Dict) -> (Counter, set, Optional[int]):
-        """Получаем метрики по пересекающимся токенам"""
-        status_counts = Counter()
-        statuses = set()
-        last_trade_ts = None
-
-        for token in tokens.values():
-            status = token["status"]
-            status_counts[status] += 1
-            statuses.add(status)
-            token_trade_ts = token.get("sell_timestamp")
-            if token_trade_ts:
-                last_trade_ts = max(last_trade_ts or token_trade_ts, token_trade_ts)
-
-        return status_counts, statuses, last_trade_ts
-
-    async def _get_wallet_tokens(self, wallet):
-        """Получаем токены кошелька по которым будем проводить поиск копитрейдеров"""
-        return await self._wallet_token_repository.get_list(
-            filters={
-                "wallet_id": wallet.id,
-                "total_buys_count__gt": 0,
-                "total_sales_count__gt": 0,
-            },
-            sorting=["-last_activity_timestamp"],
-            limit=1000,
-        )
-
-    async def _process_token(self, wallet_token, related_wallets_map, sem):
-        async with sem:
-            wallet_id, token_id = wallet_token.wallet_id, wallet_token.token_id
-            # Находим первую покупку и продажу токена
-            (
-                first_buy_activity,
-                first_sell_activity,
-            ) = await asyncio.gather(
-                self._swap_repository.get_first_by_wallet_and_token(
-                    wallet_id,
-                    token_id,
-                    event_type=SwapEventType.BUY,
-                ),
-                self._swap_repository.get_first_by_wallet_and_token(
-                    wallet_id,
-                    token_id,
-                    event_type=SwapEventType.SELL,
-                ),
-            )
-            if (not first_buy_activity or not (first_buy_block_id := first_buy_activity.block_id)) or (
-                not first_sell_activity or not (first_sell_block_id := first_sell_activity.block_id)
-            ):
-                return
-
-            # print(first_sell_activity)
-            # print(first_buy_activity)
-
-            # Находим соседние покупки\продажи токена
-            neighbor_buy_activities = await self._swap_repository.get_neighbors_by_token(
-                token_id=token_id,
-                block_id=first_buy_block_id,
-                event_type=SwapEventType.BUY,
-                exclude_wallets=[wallet_id],
-            )
-            # print(neighbor_buy_activities)
-            neighbor_sell_activities = await self._swap_repository.get_neighbors_by_token(
-                token_id=token_id,
-                block_id=first_sell_block_id,
-                event_type=SwapEventType.SELL,
-                exclude_wallets=[wallet_id],
-            )
-            # print(neighbor_sell_activities)
-
-            # Маппинг по кошелькам, с первыми покупками\продажами
-            wallets_map = defaultdict(lambda: {"buy": None, "sell": None})
-
-            for activity in neighbor_buy_activities:
-                current_buy = wallets_map[activity.wallet_id]["buy"]
-                if current_buy is None or activity.block_id < current_buy.block_id:
-                    wallets_map[activity.wallet_id]["buy"] = activity
-
-            for activity in neighbor_sell_activities:
-                current_sell = wallets_map[activity.wallet_id]["sell"]
-                if current_sell is None or activity.block_id < current_sell.block_id:
-                    wallets_map[activity.wallet_id]["sell"] = activity
-
-            for wallet_id, wallet_data in wallets_map.items():
-                if not ((fb := wallet_data["buy"]) and (fs := wallet_data["sell"])):
-                    continue
-
-                buy_status = compare_transaction_blocks(fb.block_id, first_buy_block_id)
-                sell_status = compare_transaction_blocks(fs.block_id, first_sell_block_id)
-
-                status = classify_token_trade_status(buy_status, sell_status)
-
-                related_wallets_map[wallet_id][token_id] = {
-                    "buy_status": buy_status,
-                    "sell_status": sell_status,
-                    "status": status,
-                    "sell_timestamp": fs.timestamp,
-                }
-
-
-def compare_transaction_blocks(event_block: int, reference_block: int) -> str:
-    """Определяем порядок транзакций"""
-    if event_block < reference_block:
-        return "before"
-    elif event_block > reference_block:
-        return "after"
-    return "same"
-
-
-def classify_token_trade_status(buy_status: str, sell_status: str):
-    """Определяем статус позиции кошелька в трейде конкретного токена"""
-    if (buy_status, sell_status) in [
-        ("after", "after"),
-        ("same", "after"),
-        ("after", "same"),
-    ]:
-        status = "after"
-    elif (buy_status, sell_status) in [
-        ("same", "before"),
-        ("before", "before"),
-        ("before", "same"),
-    ]:
-        status = "before"
-    elif (buy_status, sell_status) == (
-        "same",
-        "same",
-    ):
-        status = "same"
-    else:
-        # Остаются случаи
-        # ("before", "after"),
-        # ("after", "before"),
-        status = "mixed"
-
-    return status
-
 
 def classify_related_wallet_status(
     statuses: set,
@@ -0,0 +1,471 @@
+import gc
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import List, Tuple
+from uuid import UUID
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pytz
+
+from src.domain.constants import OKX_WALLET_ADDRESS, SOL_ADDRESS
+from src.domain.entities.swap import Swap, SwapEventType
+from src.domain.entities.token import Token
+from src.domain.entities.wallet import Wallet, WalletToken
+
+from .common import calculations
+from .transformer import build_wallet_relations
+
+logger = logging.getLogger(__name__)
+
+SWAP_COLUMNS = (
+    "tx_id",
+    "block_id",
+    "swapper",
+    "swap_from_mint",
+    "swap_to_mint",
+    "swap_from_amount",
+    "swap_to_amount",
+    "block_timestamp",
+)
+SWAP_SCHEMA = pa.schema(
+    [
+        ("tx_id", pa.string()),
+        ("block_id", pa.int64()),
+        ("swapper", pa.string()),
+        ("swap_from_mint", pa.string()),
+        ("swap_to_mint", pa.string()),
+        ("swap_from_amount", pa.float64()),
+        ("swap_to_amount", pa.float64()),
+        ("block_timestamp", pa.string()),
+    ]
+)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+NO_BLOCK = np.iinfo(np.int64).max  # Свап без номера блока не участвует в first_*_block_id
+RECORD_BATCH_SIZE = 100_000  # Записей Flipside на один RecordBatch при переводе в Arrow
+
+
+def transform_data_vectorized(swaps, sol_prices):
+    """
+    Векторизованный вариант transformer.transform_data.
+    Группировка по транзакциям, классификация buy/sell, привязка к минутной цене SOL,
+    дедупликация кошельков/токенов и агрегация WalletToken выполняются операциями над массивами.
+    Кол-ва хранятся как float64 до создания сущностей, id выдаются пачкой, одинаковые timestamp - одним объектом.
+    Возвращает тот же набор wallets, tokens, activities, wallet_tokens.
+    """
+    columns = records_to_columns(swaps)
+    if not len(columns["tx_id"]):
+        return [], [], [], []
+
+    populate_swaps_columns(columns)
+    with _gc_paused():
+        return builds_objects_from_columns(columns, sol_prices)
+
+
+def records_to_columns(swaps) -> dict[str, np.ndarray]:
+    """
+    Преобразует записи Flipside (список dict), колонки (dict) или pa.Table в колонки numpy через Arrow.
+    Строки - object-массивы (None сохраняется), block_id - int64 (NO_BLOCK вместо None), кол-ва - float64 (None -> 0)
+    """
+    if isinstance(swaps, pa.Table):
+        table = swaps.select(list(SWAP_COLUMNS)).cast(SWAP_SCHEMA)
+    elif isinstance(swaps, dict):
+        table = pa.table({name: swaps[name] for name in SWAP_COLUMNS}, schema=SWAP_SCHEMA)
+    else:
+        # По батчам: промежуточные списки значений колонок создаются только для одного батча, а не для всего окна
+        table = pa.Table.from_batches(
+            [
+                pa.RecordBatch.from_pylist(swaps[start : start + RECORD_BATCH_SIZE], schema=SWAP_SCHEMA)
+                for start in range(0, len(swaps), RECORD_BATCH_SIZE)
+            ],
+            schema=SWAP_SCHEMA,
+        )
+
+    columns = {
+        name: table[name].to_numpy()
+        for name in ("tx_id", "swapper", "swap_from_mint", "swap_to_mint", "block_timestamp")
+    }
+    columns["block_id"] = pc.fill_null(table["block_id"], NO_BLOCK).to_numpy()
+    columns["swap_from_amount"] = pc.fill_null(table["swap_from_amount"], 0.0).to_numpy()
+    columns["swap_to_amount"] = pc.fill_null(table["swap_to_amount"], 0.0).to_numpy()
+    return columns
+
+
+def _encode(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Уникальные значения в порядке первого появления и код каждого элемента (хеширование в Arrow, без сортировки)"""
+    encoded = pc.dictionary_encode(pa.array(values, type=pa.string()), null_encoding="encode")
+    return encoded.dictionary.to_numpy(zero_copy_only=False), encoded.indices.to_numpy()
+
+
+def populate_swaps_columns(columns: dict[str, np.ndarray]) -> None:
+    """Колоночный аналог transformer.populate_swaps_data"""
+    tx_ids, tx_codes = _encode(columns["tx_id"])
+    swappers, swapper_codes = _encode(columns["swapper"])
+    # Токен и тип события определяются так же, как в populate_swaps_data
+    is_sell = columns["swap_to_mint"] == SOL_ADDRESS
+    tokens, token_codes = _encode(np.where(is_sell, columns["swap_from_mint"], columns["swap_to_mint"]))
+    n_tx, n_swappers, n_tokens = len(tx_ids), len(swappers), len(tokens)
+
+    tx_swaps_count = np.bincount(tx_codes, minlength=n_tx)
+
+    # Уникальные пары (транзакция, трейдер)
+    tx_swapper_keys = np.unique(tx_codes.astype(np.int64) * n_swappers + swapper_codes)
+    pair_tx, pair_swapper = np.divmod(tx_swapper_keys, n_swappers)
+    tx_swappers_count = np.bincount(pair_tx, minlength=n_tx)
+    multi_swap_tx = tx_swaps_count >= 2
+
+    # Одна транзакция, один трейдер, по одному токену есть и покупка и продажа - арбитраж
+    tx_token_keys, tx_token_codes = np.unique(
+        tx_codes.astype(np.int64) * n_tokens + token_codes,
+        return_inverse=True,
+    )
+    has_buy = np.bincount(tx_token_codes, weights=~is_sell, minlength=len(tx_token_keys)) > 0
+    has_sell = np.bincount(tx_token_codes, weights=is_sell, minlength=len(tx_token_keys)) > 0
+    arbitrage_tx = np.zeros(n_tx, dtype=bool)
+    arbitrage_tx[tx_token_keys[has_buy & has_sell] // n_tokens] = True
+    arbitrage_tx &= multi_swap_tx & (tx_swappers_count == 1)
+
+    mt_3_swappers_tx = multi_swap_tx & (tx_swappers_count >= 3)
+
+    # Два трейдера, один из которых OKX - подменяем трейдера на реального
+    okx_indexes = np.flatnonzero(swappers == OKX_WALLET_ADDRESS)
+    if len(okx_indexes):
+        okx_idx = okx_indexes[0]
+        has_okx = np.zeros(n_tx, dtype=bool)
+        has_okx[pair_tx[pair_swapper == okx_idx]] = True
+        okx_tx = multi_swap_tx & (tx_swappers_count == 2) & has_okx
+        real_swapper = np.full(n_tx, -1, dtype=np.int64)
+        not_okx = pair_swapper != okx_idx
+        real_swapper[pair_tx[not_okx]] = pair_swapper[not_okx]
+        replace = okx_tx[tx_codes]
+        swapper_codes = np.where(replace, real_swapper[tx_codes], swapper_codes)
+        columns["swapper"] = np.where(replace, swappers[swapper_codes], columns["swapper"])
+
+    columns["is_part_of_arbitrage_swap_event"] = arbitrage_tx[tx_codes]
+    columns["is_part_of_transaction_with_mt_3_swappers"] = mt_3_swappers_tx[tx_codes]
+
+
+def _parse_timestamps(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """ISO-строки Flipside -> datetime64[us] (UTC) + маска валидных значений"""
+    is_valid = values != None  # noqa: E711
+    strings = np.where(is_valid, values, "1970-01-01T00:00:00").astype(str)
+    strings = np.char.replace(np.char.replace(strings, "Z", ""), "+00:00", "")
+    return strings.astype("datetime64[us]"), is_valid
+
+
+def _map_sol_prices(minutes: np.ndarray, sol_prices: dict) -> Tuple[np.ndarray, np.ndarray]:
+    """Привязка каждой строки к минутной цене SOL. Возвращает цены (Decimal) и маску найденных"""
+    if not sol_prices:
+        return np.empty(len(minutes), dtype=object), np.zeros(len(minutes), dtype=bool)
+    keys = np.array(
+        [minute.astimezone(timezone.utc).replace(tzinfo=None) for minute in sol_prices.keys()],
+        dtype="datetime64[m]",
+    )
+    prices = np.array([Decimal(price) for price in sol_prices.values()], dtype=object)
+    order = np.argsort(keys)
+    keys, prices = keys[order], prices[order]
+    idx = np.clip(np.searchsorted(keys, minutes), 0, len(keys) - 1)
+    found = keys[idx] == minutes
+    return prices[idx], found
+
+
+def _to_datetime(microseconds: int) -> datetime:
+    return EPOCH + timedelta(microseconds=microseconds)
+
+
+def _to_datetimes(microseconds: np.ndarray) -> np.ndarray:
+    """Микросекунды UTC -> datetime (object-массив). Одинаковые значения (свапы одного блока) - один объект"""
+    uniques, inverse = np.unique(microseconds, return_inverse=True)
+    datetimes = np.empty(len(uniques), dtype=object)
+    datetimes[:] = [_to_datetime(us) for us in uniques.tolist()]
+    return datetimes[inverse]
+
+
+def _to_decimals(values: np.ndarray) -> np.ndarray:
+    """
+    float64 -> Decimal (object-массив). Arrow форматирует float кратчайшей точной записью, как str(float),
+    поэтому значения совпадают с Decimal(str(v)) построчного преобразования
+    """
+    decimals = np.empty(len(values), dtype=object)
+    decimals[:] = list(map(Decimal, pc.cast(pa.array(values), pa.string()).to_pylist()))
+    return decimals
+
+
+def uuid7_batch(count: int) -> list[UUID]:
+    """
+    count UUIDv7 (RFC 9562) за один вызов вместо count вызовов uuid7(): общий timestamp в мс,
+    случайные части отсортированы, поэтому id возрастают в порядке выдачи
+    """
+    random = np.frombuffer(os.urandom(count * 16), dtype=np.uint64).reshape(count, 2)
+    rand_a = random[:, 0] & np.uint64(0xFFF)
+    rand_b = random[:, 1] & np.uint64(0x3FFF_FFFF_FFFF_FFFF)
+    order = np.lexsort((rand_b, rand_a))
+    high = (np.uint64(time.time_ns() // 1_000_000) << np.uint64(16)) | np.uint64(0x7000) | rand_a[order]
+    low = np.uint64(0x8000_0000_0000_0000) | rand_b[order]
+    return [UUID(int=h << 64 | l) for h, l in zip(high.tolist(), low.tolist())]
+
+
+@contextmanager
+def _gc_paused():
+    """
+    Отключает циклический сборщик мусора на время массового создания сущностей: объекты не образуют циклов,
+    а частые проходы сборщика по сотням тысяч новых объектов занимают до трети времени преобразования
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def builds_objects_from_columns(
+    columns: dict[str, np.ndarray],
+    sol_prices: dict,
+) -> Tuple[List[Wallet], List[Token], List[Swap], List[WalletToken]]:
+    """Колоночный аналог transformer.builds_objects + calculations.calculate_wallet_tokens"""
+    created_at = datetime.now(timezone.utc)
+
+    timestamps, is_valid_ts = _parse_timestamps(columns["block_timestamp"])
+    minutes = timestamps.astype("datetime64[m]")
+    price_usd, has_price = _map_sol_prices(minutes, sol_prices)
+
+    is_valid = (columns["swapper"] != None) & (columns["swapper"] != "")  # noqa: E711
+    is_valid &= (columns["tx_id"] != None) & (columns["tx_id"] != "")  # noqa: E711
+    is_valid &= is_valid_ts
+    skipped = is_valid & ~has_price
+    if skipped.any():
+        missing_minutes = np.unique(minutes[skipped]).tolist()
+        logger.error(f"Нет цены SOL для минут {missing_minutes}, пропущено свапов: {int(skipped.sum())}")
+    rows = np.flatnonzero(is_valid & has_price)
+    if not len(rows):
+        return [], [], [], []
+    n_rows = len(rows)
+
+    is_buy = columns["swap_from_mint"][rows] == SOL_ADDRESS
+    token_addresses = np.where(is_buy, columns["swap_to_mint"][rows], columns["swap_from_mint"][rows])
+    quote_amounts = np.where(is_buy, columns["swap_from_amount"][rows], columns["swap_to_amount"][rows])
+    token_amounts = np.where(is_buy, columns["swap_to_amount"][rows], columns["swap_from_amount"][rows])
+    quote_decimals, token_decimals = _to_decimals(quote_amounts), _to_decimals(token_amounts)
+    price_usd = price_usd[rows]
+    ts = timestamps[rows].astype(np.int64)
+    blocks = columns["block_id"][rows]
+    is_mt_3 = columns["is_part_of_transaction_with_mt_3_swappers"][rows]
+    is_arbitrage = columns["is_part_of_arbitrage_swap_event"][rows]
+
+    # Дедупликация кошельков и токенов в порядке первого появления
+    wallet_uniques, wallet_codes = _encode(columns["swapper"][rows])
+    token_uniques, token_codes = _encode(token_addresses)
+    n_wallets = len(wallet_uniques)
+
+    wallet_first_ts = np.full(n_wallets, np.iinfo(np.int64).max)
+    wallet_last_ts = np.full(n_wallets, np.iinfo(np.int64).min)
+    np.minimum.at(wallet_first_ts, wallet_codes, ts)
+    np.maximum.at(wallet_last_ts, wallet_codes, ts)
+
+    wallets_list = []
+    for wallet_id, address, first_activity, last_activity in zip(
+        uuid7_batch(n_wallets),  # fake temp id
+        wallet_uniques.tolist(),
+        _to_datetimes(wallet_first_ts).tolist(),
+        _to_datetimes(wallet_last_ts).tolist(),
+    ):
+        wallet = Wallet(
+            id=wallet_id,
+            address=address,
+            created_at=created_at,
+            updated_at=created_at,
+            first_activity_timestamp=first_activity,
+            last_activity_timestamp=last_activity,
+        )
+        build_wallet_relations(wallet, created_at)
+        wallets_list.append(wallet)
+
+    tokens_list = [
+        Token(
+            id=token_id,  # fake temp id
+            address=address,
+            is_metadata_parsed=False,
+            created_at=created_at,
+            updated_at=created_at,
+        )
+        for token_id, address in zip(uuid7_batch(len(token_uniques)), token_uniques.tolist())
+    ]
+
+    activities_list = []
+    buy_event, sell_event = SwapEventType.BUY, SwapEventType.SELL
+    for swap_id, wallet_code, token_code, tx_hash, block_id, timestamp, buy, quote, amount, price, mt_3, arb in zip(
+        uuid7_batch(n_rows),
+        wallet_codes.tolist(),
+        token_codes.tolist(),
+        columns["tx_id"][rows].tolist(),
+        np.where(blocks == NO_BLOCK, None, blocks).tolist(),
+        _to_datetimes(ts).tolist(),
+        is_buy.tolist(),
+        quote_decimals.tolist(),
+        token_decimals.tolist(),
+        price_usd.tolist(),
+        is_mt_3.tolist(),
+        is_arbitrage.tolist(),
+    ):
+        wallet, token = wallets_list[wallet_code], tokens_list[token_code]
+        activity = Swap(
+            id=swap_id,
+            wallet_id=wallet.id,
+            token_id=token.id,
+            created_at=created_at,
+            updated_at=created_at,
+            tx_hash=tx_hash,
+            block_id=block_id,
+            timestamp=timestamp,
+            event_type=buy_event if buy else sell_event,
+            quote_amount=quote,
+            token_amount=amount,
+            price_usd=price,
+            is_part_of_transaction_with_mt_3_swappers=mt_3,
+            is_part_of_arbitrage_swap_event=arb,
+        )
+        activity.wallet_address = wallet.address  # Для идентификации ибо ID из БД еще нету
+        activity.token_address = token.address  # Для идентификации ибо ID из БД еще нету
+        activities_list.append(activity)
+
+    wallet_tokens_list = _build_wallet_tokens(
+        wallets_list,
+        tokens_list,
+        wallet_codes.astype(np.int64) * len(tokens_list) + token_codes,
+        is_buy,
+        ts,
+        np.unique(columns["tx_id"][rows], return_inverse=True)[1],
+        blocks,
+        price_usd * quote_decimals,
+        token_decimals,
+        token_amounts > float(calculations.MIN_TOKEN_AMOUNT),
+        is_mt_3,
+        is_arbitrage,
+        created_at,
+    )
+    return wallets_list, tokens_list, activities_list, wallet_tokens_list
+
+
+def _build_wallet_tokens(
+    wallets_by_code,
+    tokens_by_code,
+    pair_keys,
+    is_buy,
+    ts,
+    tx_ranks,
+    blocks,
+    amounts_usd,
+    token_amounts,
+    has_price_amount,
+    is_mt_3,
+    is_arbitrage,
+    created_at,
+) -> List[WalletToken]:
+    """
+    Сгруппированный пересчет WalletToken, повторяющий calculations.calculate_wallet_token.
+    tx_ranks - номера tx_id в порядке сортировки (для выбора цены при равном времени, как calculate_first_prices),
+    has_price_amount - кол-во токенов больше MIN_TOKEN_AMOUNT (сравнение float равносильно сравнению Decimal,
+    т.к. Decimal получен из кратчайшей записи float)
+    """
+    n_tokens = len(tokens_by_code)
+    pair_uniques, pair_first, pair_codes = np.unique(pair_keys, return_index=True, return_inverse=True)
+    n_pairs = len(pair_uniques)
+
+    # Стабильная сортировка по группе сохраняет исходный порядок свапов внутри группы
+    order = np.argsort(pair_codes, kind="stable")
+    group_starts = np.searchsorted(pair_codes[order], np.arange(n_pairs))
+    sorted_buy, sorted_ts = is_buy[order], ts[order]
+    sorted_usd, sorted_token = amounts_usd[order], token_amounts[order]
+
+    zero = Decimal(0)
+    buy_usd = np.add.reduceat(np.where(sorted_buy, sorted_usd, zero), group_starts)
+    sell_usd = np.add.reduceat(np.where(sorted_buy, zero, sorted_usd), group_starts)
+    buy_token = np.add.reduceat(np.where(sorted_buy, sorted_token, zero), group_starts)
+    sell_token = np.add.reduceat(np.where(sorted_buy, zero, sorted_token), group_starts)
+
+    buys_count = np.bincount(pair_codes, weights=is_buy, minlength=n_pairs).astype(int)
+    sales_count = np.bincount(pair_codes, minlength=n_pairs) - buys_count
+    mt_3_count = np.bincount(pair_codes, weights=is_mt_3, minlength=n_pairs).astype(int)
+    arbitrage_count = np.bincount(pair_codes, weights=is_arbitrage, minlength=n_pairs).astype(int)
+    last_ts = np.maximum.reduceat(sorted_ts, group_starts)
+    no_event = np.iinfo(np.int64).max
+
+    def first_event(mask):
+        first_ts = np.full(n_pairs, no_event)
+        np.minimum.at(first_ts, pair_codes[mask], ts[mask])
+        first_block = np.full(n_pairs, NO_BLOCK, dtype=np.int64)
+        np.minimum.at(first_block, pair_codes[mask], blocks[mask])
+        # Цена первой покупки/продажи - из первой строки пары по (время, tx_id, порядок) среди строк с ценой
+        price_rows = np.flatnonzero(mask & has_price_amount)
+        price_rows = price_rows[np.lexsort((price_rows, tx_ranks[price_rows], ts[price_rows], pair_codes[price_rows]))]
+        price_pairs, first_rows = np.unique(pair_codes[price_rows], return_index=True)
+        price_rows = price_rows[first_rows]
+        prices = np.full(n_pairs, None, dtype=object)
+        prices[price_pairs] = amounts_usd[price_rows] / token_amounts[price_rows]
+        datetimes = np.full(n_pairs, None, dtype=object)
+        has_event = first_ts != no_event
+        datetimes[has_event] = _to_datetimes(first_ts[has_event])
+        return first_ts, datetimes, prices, np.where(first_block == NO_BLOCK, None, first_block)
+
+    first_buy_ts, first_buy_datetimes, first_buy_prices, first_buy_blocks = first_event(is_buy)
+    first_sell_ts, first_sell_datetimes, first_sell_prices, first_sell_blocks = first_event(~is_buy)
+    has_duration = (first_buy_ts != no_event) & (first_sell_ts != no_event) & (first_buy_ts <= first_sell_ts)
+    durations = np.where(has_duration, (first_sell_ts - first_buy_ts) // 1_000_000, None)
+    profit_usd = sell_usd - buy_usd
+    has_buy_amount = buy_usd != 0
+    profit_percent = np.full(n_pairs, None, dtype=object)
+    profit_percent[has_buy_amount] = [
+        round(percent, 2) for percent in profit_usd[has_buy_amount] / buy_usd[has_buy_amount] * 100
+    ]
+
+    # Значения полей раскладываются в списки в порядке первого появления пары
+    output_order = np.argsort(pair_first, kind="stable")
+    fields = {
+        "id": uuid7_batch(n_pairs),
+        "total_buys_count": buys_count,
+        "total_buy_amount_usd": buy_usd,
+        "total_buy_amount_token": buy_token,
+        "first_buy_price_usd": first_buy_prices,
+        "first_buy_timestamp": first_buy_datetimes,
+        "total_sales_count": sales_count,
+        "total_sell_amount_usd": sell_usd,
+        "total_sell_amount_token": sell_token,
+        "first_sell_price_usd": first_sell_prices,
+        "first_sell_timestamp": first_sell_datetimes,
+        "last_activity_timestamp": _to_datetimes(last_ts),
+        "first_buy_block_id": first_buy_blocks,
+        "first_sell_block_id": first_sell_blocks,
+        "total_profit_usd": profit_usd,
+        "total_profit_percent": profit_percent,
+        "first_buy_sell_duration": durations,
+        "total_swaps_from_txs_with_mt_3_swappers": mt_3_count,
+        "total_swaps_from_arbitrage_swap_events": arbitrage_count,
+    }
+    names = list(fields)
+    values = [fields["id"]] + [column[output_order].tolist() for column in list(fields.values())[1:]]
+    wallet_codes, token_codes = np.divmod(pair_uniques[output_order], n_tokens)
+
+    updated_at = datetime.now(pytz.timezone("Europe/Moscow"))
+    wallet_tokens_list = []
+    for wallet_code, token_code, row in zip(wallet_codes.tolist(), token_codes.tolist(), zip(*values)):
+        wallet, token = wallets_by_code[wallet_code], tokens_by_code[token_code]
+        wt = WalletToken(
+            **dict(zip(names, row)),
+            wallet_id=wallet.id,
+            token_id=token.id,
+            created_at=created_at,
+            updated_at=updated_at,
+        )
+        wt.wallet_address = wallet.address  # Для идентификации ибо ID из БД еще нету
+        wt.token_address = token.address  # Для идентификации ибо ID из БД еще нету
+        wallet_tokens_list.append(wt)
+
+    return wallet_tokens_list
@@ -7,14 +7,14 @@ import pytz
 from src.domain.entities.swap import Swap, SwapEventType
 from src.domain.entities.wallet import WalletToken
 
+MIN_TOKEN_AMOUNT = Decimal("1e-16")  # Для проверки, на слишком маленькие числа
+
 
 def calculate_wallet_token(wt: WalletToken, activities: list[Swap]) -> None:
     """
     Пересчитывает статистику для связки кошелька с токеном
     """
 
-    MIN_TOKEN_AMOUNT = Decimal("1e-16")  # Для проверки, на слишком маленькие числа
-
     for activity in activities:
         if activity.event_type == SwapEventType.BUY:
             wt.total_buys_count += 1
@@ -22,16 +22,20 @@ def calculate_wallet_token(wt: WalletToken, activities: list[Swap]) -> None:
             wt.total_buy_amount_token += activity.token_amount if activity.token_amount else 0
             if not wt.first_buy_timestamp or (activity.timestamp < wt.first_buy_timestamp):
                 wt.first_buy_timestamp = activity.timestamp
-                if activity.token_amount and activity.token_amount > MIN_TOKEN_AMOUNT:
-                    wt.first_buy_price_usd = activity.price_usd * activity.quote_amount / activity.token_amount
+            if activity.block_id is not None and (
+                wt.first_buy_block_id is None or activity.block_id < wt.first_buy_block_id
+            ):
+                wt.first_buy_block_id = activity.block_id
         elif activity.event_type == SwapEventType.SELL:
             wt.total_sales_count += 1
             wt.total_sell_amount_usd += activity.price_usd * activity.quote_amount
             wt.total_sell_amount_token += activity.token_amount if activity.token_amount else 0
             if not wt.first_sell_timestamp or (activity.timestamp < wt.first_sell_timestamp):
                 wt.first_sell_timestamp = activity.timestamp
-                if activity.token_amount and activity.token_amount > MIN_TOKEN_AMOUNT:
-                    wt.first_sell_price_usd = activity.price_usd * activity.quote_amount / activity.token_amount
+            if activity.block_id is not None and (
+                wt.first_sell_block_id is None or activity.block_id < wt.first_sell_block_id
+            ):
+                wt.first_sell_block_id = activity.block_id
         else:
             continue
         if not wt.last_activity_timestamp or (activity.timestamp > wt.last_activity_timestamp):
@@ -42,6 +46,8 @@ def calculate_wallet_token(wt: WalletToken, activities: list[Swap]) -> None:
         if activity.is_part_of_arbitrage_swap_event:
             wt.total_swaps_from_arbitrage_swap_events += 1
 
+    calculate_first_prices(wt, activities)
+
     if wt.first_buy_timestamp and wt.first_sell_timestamp and (wt.first_buy_timestamp <= wt.first_sell_timestamp):
         wt.first_buy_sell_duration = int((wt.first_sell_timestamp - wt.first_buy_timestamp).total_seconds())
 
@@ -59,6 +65,30 @@ def calculate_wallet_token(wt: WalletToken, activities: list[Swap]) -> None:
     wt.updated_at = datetime.now(pytz.timezone("Europe/Moscow"))
 
 
+def calculate_first_prices(wt: WalletToken, activities: list[Swap]) -> None:
+    """
+    Цена первой покупки/продажи - по самому раннему свапу с ценой (кол-во токенов больше MIN_TOKEN_AMOUNT).
+    При равном времени раньше свап с меньшим tx_hash, в одной транзакции - свап, идущий первым,
+    поэтому цена не зависит от порядка транзакций и от того, на какие части разбиты свапы
+    """
+    wt.first_buy_price_usd = None
+    wt.first_sell_price_usd = None
+    first_price_keys = {}
+    for activity in activities:
+        if not (activity.token_amount and activity.token_amount > MIN_TOKEN_AMOUNT):
+            continue
+        key = (activity.timestamp, activity.tx_hash)
+        first_price_key = first_price_keys.get(activity.event_type)
+        if first_price_key is not None and not key < first_price_key:
+            continue
+        first_price_keys[activity.event_type] = key
+        price_usd = activity.price_usd * activity.quote_amount / activity.token_amount
+        if activity.event_type == SwapEventType.BUY:
+            wt.first_buy_price_usd = price_usd
+        elif activity.event_type == SwapEventType.SELL:
+            wt.first_sell_price_usd = price_usd
+
+
 def calculate_wallet_tokens(wallet_tokens: list[WalletToken], activities: list[Swap]):
     activity_map = defaultdict(list)
     for act in activities:
@@ -67,3 +97,56 @@ def calculate_wallet_tokens(wallet_tokens: list[WalletToken], activities: list[S
         key = (wt.wallet_id, wt.token_id)
         activities = activity_map[key]
         calculate_wallet_token(wt, activities)
+
+
+def _min_block_id(block_id: int | None, other: int | None) -> int | None:
+    """Минимальный из известных блоков (как least() в БД - NULL игнорируется)"""
+    if block_id is None:
+        return other
+    if other is None:
+        return block_id
+    return min(block_id, other)
+
+
+def merge_wallet_tokens(wt: WalletToken, other: WalletToken) -> None:
+    """
+    Сливает статистику other в wt (для одной связки кошелек-токен, посчитанной по разным частям свапов).
+    Цену первой покупки/продажи по частям не выбрать (у частей нет времени их свапов с ценой) -
+    ее пересчитывает calculate_first_prices по свапам всех частей
+    """
+    wt.total_buys_count += other.total_buys_count
+    wt.total_buy_amount_usd += other.total_buy_amount_usd
+    wt.total_buy_amount_token += other.total_buy_amount_token
+    wt.total_sales_count += other.total_sales_count
+    wt.total_sell_amount_usd += other.total_sell_amount_usd
+    wt.total_sell_amount_token += other.total_sell_amount_token
+    wt.total_swaps_from_txs_with_mt_3_swappers += other.total_swaps_from_txs_with_mt_3_swappers
+    wt.total_swaps_from_arbitrage_swap_events += other.total_swaps_from_arbitrage_swap_events
+
+    if other.first_buy_timestamp and (not wt.first_buy_timestamp or other.first_buy_timestamp < wt.first_buy_timestamp):
+        wt.first_buy_timestamp = other.first_buy_timestamp
+    if other.first_sell_timestamp and (
+        not wt.first_sell_timestamp or other.first_sell_timestamp < wt.first_sell_timestamp
+    ):
+        wt.first_sell_timestamp = other.first_sell_timestamp
+    if other.last_activity_timestamp and (
+        not wt.last_activity_timestamp or other.last_activity_timestamp > wt.last_activity_timestamp
+    ):
+        wt.last_activity_timestamp = other.last_activity_timestamp
+    wt.first_buy_block_id = _min_block_id(wt.first_buy_block_id, other.first_buy_block_id)
+    wt.first_sell_block_id = _min_block_id(wt.first_sell_block_id, other.first_sell_block_id)
+
+    wt.first_buy_sell_duration = None
+    if wt.first_buy_timestamp and wt.first_sell_timestamp and (wt.first_buy_timestamp <= wt.first_sell_timestamp):
+        wt.first_buy_sell_duration = int((wt.first_sell_timestamp - wt.first_buy_timestamp).total_seconds())
+
+    wt.total_profit_usd = wt.total_sell_amount_usd - wt.total_buy_amount_usd
+
+    wt.total_profit_percent = (
+        round(
+            wt.total_profit_usd / wt.total_buy_amount_usd * 100,
+            2,
+        )
+        if not wt.total_buy_amount_usd == 0
+        else None
+    )
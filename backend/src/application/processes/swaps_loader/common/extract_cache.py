@@ -0,0 +1,61 @@
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractCache:
+    """
+    Локальный кеш собранных с Flipside свапов: одно окно [start, end) - один parquet-файл (zstd).
+    Версия запроса входит в имя файла, поэтому после изменения запроса старые файлы не используются.
+    Суммарный размер ограничен max_size_bytes, вытесняются давно не использованные файлы
+    """
+
+    def __init__(self, directory: str | Path, max_size_bytes: int, query_version: str):
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._max_size_bytes = max_size_bytes
+        self._query_version = query_version
+
+    def _path(self, start_time: datetime, end_time: datetime) -> Path:
+        return (
+            self._directory
+            / f"swaps_{self._query_version}_{int(start_time.timestamp())}_{int(end_time.timestamp())}.parquet"
+        )
+
+    def get(self, start_time: datetime, end_time: datetime) -> list[dict] | None:
+        path = self._path(start_time, end_time)
+        if not path.exists():
+            return None
+        try:
+            records = pq.read_table(path).to_pylist()
+        except (OSError, pa.ArrowException) as e:
+            logger.error(f"Не удалось прочитать кеш {path}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+        os.utime(path)  # Отмечаем использование для вытеснения
+        return records
+
+    def put(self, start_time: datetime, end_time: datetime, records: list[dict]) -> None:
+        path = self._path(start_time, end_time)
+        tmp_path = path.with_suffix(".tmp")
+        columns = dict.fromkeys(key for record in records for key in record)  # Схема по всем записям, а не по первой
+        table = pa.table({column: [record.get(column) for record in records] for column in columns})
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, path)  # Чтобы не оставить недописанный файл
+        self.evict()
+
+    def evict(self) -> None:
+        files = sorted(self._directory.glob("swaps_*.parquet"), key=lambda p: p.stat().st_mtime)
+        total_size = sum(p.stat().st_size for p in files)
+        for path in files:
+            if total_size <= self._max_size_bytes:
+                break
+            total_size -= path.stat().st_size
+            path.unlink(missing_ok=True)
+            logger.info(f"Удален файл кеша {path.name}")
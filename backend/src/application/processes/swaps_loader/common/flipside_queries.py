@@ -1,4 +1,5 @@
 import datetime
+import hashlib
 
 from src.domain.constants import SOL_ADDRESS
 
@@ -9,12 +10,31 @@ def sql_get_swaps(
     blacklisted_tokens: set,
     offset: int = 0,
     limit: int | None = None,
+    keyset: bool = False,
+    after: tuple[str, str] | None = None,
 ):
-    """SQL-запрос для получения swaps с Flipside-crypto"""
+    """
+    SQL-запрос для получения swaps с Flipside-crypto.
+    keyset - постраничное чтение по ключу (block_timestamp, row_id) вместо OFFSET, after - ключ последней
+    полученной записи: каждая страница читает только данные после ключа и стоит одинаково
+    """
     if limit is None:
         limit = 100000
     blacklisted_tokens.add(SOL_ADDRESS)  # Добавляем SOL_ADDRESS чтобы исключить свапы WSOL -> WSOL
     blacklist_tokens_values = ",".join(f"'{token}'" for token in blacklisted_tokens)
+    order_by = "BLOCK_TIMESTAMP ASC, row_id ASC" if keyset else "row_id ASC"
+    jupiter_after_condition = ez_after_condition = keyset_condition = ""
+    if keyset and after:
+        offset = 0
+        after_timestamp, after_row_id = after
+        # Свапы одной транзакции имеют одинаковый BLOCK_TIMESTAMP, поэтому отсечение по времени в CTE
+        # не влияет на исключение транзакций Jupiter из ez_dex_swaps
+        jupiter_after_condition = f"AND BLOCK_TIMESTAMP >= '{after_timestamp}'"
+        ez_after_condition = f"AND ez.BLOCK_TIMESTAMP >= '{after_timestamp}'"
+        keyset_condition = (
+            f"AND (BLOCK_TIMESTAMP > '{after_timestamp}' "
+            f"OR (BLOCK_TIMESTAMP = '{after_timestamp}' AND row_id > '{after_row_id}'))"
+        )
     query = f"""
         WITH jupiter_swaps AS (
             SELECT
@@ -33,6 +53,7 @@ def sql_get_swaps(
                 BLOCK_TIMESTAMP >= '{start_time}'
                 AND BLOCK_TIMESTAMP < '{end_time}'
                 AND swapper IS NOT NULL
+                {jupiter_after_condition}
         ),
         ez_swaps AS (
             SELECT
@@ -52,6 +73,7 @@ def sql_get_swaps(
                 ez.BLOCK_TIMESTAMP >= '{start_time}'
                 AND ez.BLOCK_TIMESTAMP < '{end_time}'
                 AND js.tx_id IS NULL -- Исключаем те tx_id, которые есть в Jupiter
+                {ez_after_condition}
         )
         SELECT *
         FROM (
@@ -65,7 +87,16 @@ def sql_get_swaps(
             OR
             (SWAP_TO_MINT = '{SOL_ADDRESS}' AND SWAP_FROM_MINT NOT IN ({blacklist_tokens_values}))
           )
-        ORDER BY row_id ASC
+          {keyset_condition}
+        ORDER BY {order_by}
         LIMIT {limit} OFFSET {offset};
     """
     return query
+
+
+def get_swaps_query_version(blacklisted_tokens: set) -> str:
+    """Версия запроса свапов - хеш текста запроса (меняется при изменении запроса или черного списка токенов)"""
+    query = sql_get_swaps(datetime.datetime.min, datetime.datetime.max, blacklisted_tokens=set(), keyset=True)
+    # Порядок токенов в запросе зависит от порядка обхода set, поэтому черный список учитываем отсортированным
+    query += ",".join(sorted(blacklisted_tokens))
+    return hashlib.sha1(query.encode()).hexdigest()[:12]
@@ -0,0 +1,73 @@
+import logging
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable
+from uuid import UUID
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+
+class AddressIdCache:
+    """
+    Ограниченный по размеру LRU-кеш адрес -> id в БД (для кошельков и токенов).
+    Если задан path - кеш можно сохранять на диск и загружать при следующем запуске
+    """
+
+    def __init__(self, max_size: int, path: str | Path | None = None):
+        self._max_size = max_size
+        self._path = Path(path) if path else None
+        self._ids: OrderedDict[str, UUID] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def split_known(self, addresses: Iterable[str]) -> tuple[dict[str, UUID], list[str]]:
+        """Возвращает известные адреса с их id и список неизвестных адресов"""
+        known = {}
+        unknown = []
+        for address in addresses:
+            id_ = self._ids.get(address)
+            if id_ is None:
+                unknown.append(address)
+                continue
+            self._ids.move_to_end(address)
+            known[address] = id_
+        return known, unknown
+
+    def update(self, ids: dict[str, UUID]) -> None:
+        for address, id_ in ids.items():
+            self._ids[address] = id_
+            self._ids.move_to_end(address)
+        while len(self._ids) > self._max_size:
+            self._ids.popitem(last=False)
+
+    def load(self) -> None:
+        if not self._path or not self._path.exists():
+            return
+        try:
+            table = pq.read_table(self._path)
+        except (OSError, pa.ArrowException) as e:
+            logger.error(f"Не удалось прочитать кеш адресов {self._path}: {e}")
+            return
+        addresses = table.column("address").to_pylist()
+        ids = table.column("id").to_pylist()
+        self.update({address: UUID(bytes=id_) for address, id_ in zip(addresses, ids)})
+        logger.info(f"Загружено {len(addresses)} адресов из кеша {self._path}")
+
+    def dump(self) -> None:
+        if not self._path:
+            return
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        table = pa.table(
+            {
+                "address": pa.array(list(self._ids.keys()), pa.string()),
+                "id": pa.array([id_.bytes for id_ in self._ids.values()], pa.binary(16)),
+            }
+        )
+        tmp_path = self._path.with_suffix(".tmp")
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, self._path)
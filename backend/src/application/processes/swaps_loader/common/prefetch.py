@@ -0,0 +1,41 @@
+import asyncio
+
+
+class PrefetchLimiter:
+    """
+    Ограничивает опережающий сбор свапов: кол-во окон, собираемых/ожидающих загрузчика,
+    и суммарный размер собранных, но еще не загруженных в БД данных
+    """
+
+    def __init__(self, max_windows: int, max_bytes: int):
+        self._max_windows = max(max_windows, 1)
+        self._max_bytes = max_bytes
+        self._windows = 0
+        self._bytes = 0
+        self._condition = asyncio.Condition()
+
+    @property
+    def queued_bytes(self) -> int:
+        return self._bytes
+
+    async def acquire_window(self) -> None:
+        """Ждет, пока можно будет начать сбор следующего окна"""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._windows < self._max_windows and self._bytes < self._max_bytes)
+            self._windows += 1
+
+    async def add_size(self, size: int) -> None:
+        async with self._condition:
+            self._bytes += size
+
+    async def release_window(self) -> None:
+        """Окно забрано загрузчиком"""
+        async with self._condition:
+            self._windows -= 1
+            self._condition.notify_all()
+
+    async def release_size(self, size: int) -> None:
+        """Данные окна загружены в БД"""
+        async with self._condition:
+            self._bytes -= size
+            self._condition.notify_all()
@@ -1,3 +1,4 @@
+import sys
 from datetime import datetime
 
 from src.domain.constants import SOL_ADDRESS
@@ -30,6 +31,15 @@ def split_time_range(start_time, end_time, parts):
     return intervals
 
 
+def estimate_records_size(records: list[dict], sample_size: int = 100) -> int:
+    """Примерный размер списка словарей в памяти (в байтах), оценивается по выборке записей"""
+    if not records:
+        return 0
+    sample = records[:: max(len(records) // sample_size, 1)][:sample_size]
+    sample_bytes = sum(sys.getsizeof(record) + sum(sys.getsizeof(v) for v in record.values()) for record in sample)
+    return sys.getsizeof(records) + sample_bytes * len(records) // len(sample)
+
+
 async def get_flipside_account() -> FlipsideAccount:
     async with AsyncSessionMaker() as session:
         repo = SQLAlchemyFlipsideAccountRepositoryInterface(session)
@@ -0,0 +1,60 @@
+import math
+from datetime import datetime, timedelta
+
+
+class ExtractWindowSizer:
+    """
+    Подбирает размер окон сбора свапов и кол-во запросов на окно по плотности свапов (свапов в минуту)
+    в последних собранных окнах, чтобы один запрос к Flipside возвращал около target_rows_per_query строк.
+    Если adaptive=False - окна фиксированного размера, каждое делится на parallel_workers частей
+    """
+
+    def __init__(
+        self,
+        adaptive: bool,
+        period_interval_minutes: int,
+        parallel_workers: int,
+        target_rows_per_query: int,
+        min_period_interval_minutes: int,
+        max_period_interval_minutes: int,
+        smoothing: float = 0.5,
+    ):
+        self._adaptive = adaptive
+        self._period_interval_minutes = period_interval_minutes
+        self._parallel_workers = parallel_workers
+        self._target_rows_per_query = target_rows_per_query
+        self._min_minutes = min_period_interval_minutes
+        self._max_minutes = max(max_period_interval_minutes, min_period_interval_minutes)
+        self._smoothing = smoothing
+        self._rows_per_minute: float | None = None
+
+    @property
+    def rows_per_minute(self) -> float | None:
+        return self._rows_per_minute
+
+    def observe(self, rows_count: int, start_time: datetime, end_time: datetime) -> None:
+        """Учитывает кол-во свапов в собранном окне (экспоненциальное сглаживание)"""
+        minutes = (end_time - start_time).total_seconds() / 60
+        if minutes <= 0:
+            return
+        rows_per_minute = rows_count / minutes
+        if self._rows_per_minute is None:
+            self._rows_per_minute = rows_per_minute
+        else:
+            self._rows_per_minute = self._smoothing * rows_per_minute + (1 - self._smoothing) * self._rows_per_minute
+
+    def next_window(self) -> timedelta:
+        """Размер следующего окна: столько, чтобы все запросы окна, выполняемые параллельно, шли в один заход"""
+        if not self._adaptive or not self._rows_per_minute:
+            return timedelta(minutes=self._period_interval_minutes)
+        target_rows = self._target_rows_per_query * self._parallel_workers
+        minutes = int(target_rows / self._rows_per_minute)
+        return timedelta(minutes=min(max(minutes, self._min_minutes), self._max_minutes))
+
+    def parts_count(self, start_time: datetime, end_time: datetime) -> int:
+        """На сколько запросов разбить окно"""
+        if not self._adaptive or not self._rows_per_minute:
+            return self._parallel_workers
+        minutes = (end_time - start_time).total_seconds() / 60
+        expected_rows = self._rows_per_minute * minutes
+        return max(math.ceil(expected_rows / self._target_rows_per_query), 1)
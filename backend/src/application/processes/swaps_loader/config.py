@@ -7,7 +7,26 @@ from src.settings.config import config
 
 EXTRACTOR_PARALLEL_WORKERS = config.swaps_loader.extractor_parallel_workers
 EXTRACTOR_PERIOD_INTERVAL_MINUTES = config.swaps_loader.extractor_period_interval_minutes
+EXTRACTOR_ADAPTIVE_WINDOWS = config.swaps_loader.extractor_adaptive_windows
+EXTRACTOR_TARGET_ROWS_PER_QUERY = config.swaps_loader.extractor_target_rows_per_query
+EXTRACTOR_MIN_PERIOD_INTERVAL_MINUTES = config.swaps_loader.extractor_min_period_interval_minutes
+EXTRACTOR_MAX_PERIOD_INTERVAL_MINUTES = config.swaps_loader.extractor_max_period_interval_minutes
+EXTRACTOR_PREFETCH_WINDOWS = config.swaps_loader.extractor_prefetch_windows
+EXTRACTOR_PREFETCH_MAX_MB = config.swaps_loader.extractor_prefetch_max_mb
+EXTRACT_CACHE_DIR = config.swaps_loader.extract_cache_dir
+EXTRACT_CACHE_MAX_MB = config.swaps_loader.extract_cache_max_mb
 PROCESS_INTERVAL_SECONDS = config.swaps_loader.process_interval_seconds
+TRANSFORMER_VECTORIZED = config.swaps_loader.transformer_vectorized
+TRANSFORMER_WORKERS = config.swaps_loader.transformer_workers
+ADDRESS_ID_CACHE_MAX_SIZE = config.swaps_loader.address_id_cache_max_size
+ADDRESS_ID_CACHE_DIR = config.swaps_loader.address_id_cache_dir
+LOADER_RETURNING_IDS = config.swaps_loader.loader_returning_ids
+LOADER_COPY_SWAPS = config.swaps_loader.loader_copy_swaps
+LOADER_STAGING_WALLET_TOKENS = config.swaps_loader.loader_staging_wallet_tokens
+LOADER_MARK_DIRTY_WALLETS = config.swaps_loader.loader_mark_dirty_wallets
+LOADER_INVALIDATE_API_CACHE = config.swaps_loader.loader_invalidate_api_cache
+WALLET_LOCK_PARTITIONS = config.db.wallet_lock_partitions
+REDIS_URL = config.redis.url
 PERSISTENT_MODE = config.swaps_loader.persistent_mode
 # Константы для фиксированного периода UTC
 CONFIG_PERIOD_START_TIME = config.swaps_loader.config_period_start_time
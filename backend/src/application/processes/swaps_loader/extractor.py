@@ -7,13 +7,18 @@ warnings.filterwarnings(
     category=UserWarning,
 )
 
+import time
+
 from flipside import Flipside
+from flipside.errors.query_run_errors import QueryRunExecutionError, QueryRunTimeoutError
 
 from .common import flipside_queries
 from .config import BLACKLISTED_TOKENS
 
 logger = logging.getLogger(__name__)
 
+PAGE_RETRIES = 3  # Кол-во попыток запроса одной страницы при постраничном чтении по ключу
+
 
 class FlipsideClientException(Exception):
     pass
@@ -24,35 +29,61 @@ def fetch_data_for_period(
     end_time,
     flipside_apikey,
 ):
-    offset = 0
+    """Собирает свапы за период постранично по ключу (block_timestamp, row_id)"""
     limit = 100000
     all_swaps = []
-    stop = False
-    while not stop:
-        logger.debug(f"Собираем данные за {start_time} - {end_time} | offset: {offset}")
-        swaps, count = get_swaps(
+    after = None
+    while True:
+        logger.debug(f"Собираем данные за {start_time} - {end_time} | после: {after}")
+        swaps, count = get_swaps_page_with_retries(
             flipside_apikey,
             start_time,
             end_time,
-            offset=offset,
             limit=limit,
+            after=after,
         )
 
         all_swaps.extend(swaps)
         if count < limit:
-            stop = True
-        else:
-            offset += limit
+            break
+        after = (swaps[-1]["block_timestamp"], swaps[-1]["row_id"])
 
     return all_swaps
 
 
+def get_swaps_page_with_retries(
+    flipside_apikey,
+    start_time,
+    end_time,
+    limit,
+    after=None,
+):
+    """Страница определяется только ключом, поэтому при ошибке повторяется только она"""
+    for attempt in range(1, PAGE_RETRIES + 1):
+        try:
+            return get_swaps(
+                flipside_apikey,
+                start_time,
+                end_time,
+                limit=limit,
+                keyset=True,
+                after=after,
+            )
+        except (QueryRunExecutionError, QueryRunTimeoutError) as e:
+            if attempt == PAGE_RETRIES:
+                raise
+            logger.warning(f"Ошибка запроса страницы {start_time} - {end_time} после {after}: {e}. Повторяем")
+            time.sleep(attempt * 5)
+
+
 def get_swaps(
     flipside_apikey,
     start_time,
     end_time,
     offset=0,
     limit=None,
+    keyset=False,
+    after=None,
 ):
     flipside = Flipside(
         flipside_apikey,
@@ -64,6 +95,8 @@ def get_swaps(
         blacklisted_tokens=BLACKLISTED_TOKENS,
         offset=offset,
         limit=limit,
+        keyset=keyset,
+        after=after,
     )
 
     query_result_set = flipside.query(query)
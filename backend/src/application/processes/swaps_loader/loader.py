@@ -2,7 +2,9 @@ import asyncio
 import logging
 import random
 from datetime import datetime
+from pathlib import Path
 from typing import List
+from uuid import UUID
 
 import numpy as np
 from sqlalchemy import update
@@ -11,40 +13,94 @@ from sqlalchemy.exc import DBAPIError
 from src.domain.entities.swap import Swap
 from src.domain.entities.token import Token
 from src.domain.entities.wallet import Wallet, WalletToken
+from src.infra.db.sqlalchemy.locks import gather_partitions, lock_wallets_partition, partition_by_wallet_address
 from src.infra.db.sqlalchemy.models import FlipsideConfig
 from src.infra.db.sqlalchemy.repositories import (
     SQLAlchemySwapRepository,
     SQLAlchemyTokenRepository,
+    SQLAlchemyWalletRelationsDirtyBlocksRepository,
     SQLAlchemyWalletRepository,
     SQLAlchemyWalletStatistic7dRepository,
     SQLAlchemyWalletStatistic30dRepository,
     SQLAlchemyWalletStatisticAllRepository,
+    SQLAlchemyWalletStatsDirtyRepository,
     SQLAlchemyWalletTokenRepository,
 )
 from src.infra.db.sqlalchemy.repositories.flipside import SQLAlchemyFlipsideConfigRepositoryInterface
-from src.infra.db.sqlalchemy.setup import AsyncSessionMaker
+from src.infra.db.sqlalchemy.setup import AsyncSessionMaker, partition_sessions_semaphore
+from src.infra.redis.cache_service import RedisCacheService
+from src.infra.redis.related_wallets_cache import invalidate_related_wallets_cache
 
 from . import config
 from .common import utils
+from .common.id_cache import AddressIdCache
 
 logger = logging.getLogger(__name__)
 
-
-async def load_data_to_db(wallets, tokens, activities, wallet_tokens, end_time) -> None:
-    created_wallets_map, created_tokens_map = await asyncio.gather(
-        import_wallets_data(wallets),
-        import_tokens(tokens),
+# Кеши адрес -> id, чтобы не запрашивать id уже известных кошельков и токенов
+wallets_id_cache = (
+    AddressIdCache(
+        config.ADDRESS_ID_CACHE_MAX_SIZE,
+        path=Path(config.ADDRESS_ID_CACHE_DIR) / "wallets.parquet" if config.ADDRESS_ID_CACHE_DIR else None,
+    )
+    if config.ADDRESS_ID_CACHE_MAX_SIZE
+    else None
+)
+tokens_id_cache = (
+    AddressIdCache(
+        config.ADDRESS_ID_CACHE_MAX_SIZE,
+        path=Path(config.ADDRESS_ID_CACHE_DIR) / "tokens.parquet" if config.ADDRESS_ID_CACHE_DIR else None,
     )
+    if config.ADDRESS_ID_CACHE_MAX_SIZE
+    else None
+)
+
+
+def load_address_id_caches() -> None:
+    if wallets_id_cache:
+        wallets_id_cache.load()
+        tokens_id_cache.load()
+
+
+def dump_address_id_caches() -> None:
+    if wallets_id_cache:
+        wallets_id_cache.dump()
+        tokens_id_cache.dump()
+
+
+async def load_data_to_db(
+    wallets,
+    tokens,
+    activities,
+    wallet_tokens,
+    end_time,
+    cache_service: RedisCacheService | None = None,
+) -> None:
+    """cache_service - кеш API, записи которого устаревают после загрузки свапов (None - не сбрасывается)"""
+    if wallets_id_cache:
+        wallets_ids_map, tokens_ids_map = await asyncio.gather(
+            import_wallets_data_with_cache(wallets),
+            import_tokens_with_cache(tokens),
+        )
+    else:
+        created_wallets_map, created_tokens_map = await asyncio.gather(
+            import_wallets_data(wallets),
+            import_tokens(tokens),
+        )
+        wallets_ids_map = {address: wallet.id for address, wallet in created_wallets_map.items()}
+        tokens_ids_map = {address: token.id for address, token in created_tokens_map.items()}
 
     for activity in activities:
-        activity.wallet_id = created_wallets_map[activity.wallet_address].id
-        activity.token_id = created_tokens_map[activity.token_address].id
+        activity.wallet_id = wallets_ids_map[activity.wallet_address]
+        activity.token_id = tokens_ids_map[activity.token_address]
     for wallet_token in wallet_tokens:
-        wallet_token.wallet_id = created_wallets_map[wallet_token.wallet_address].id
-        wallet_token.token_id = created_tokens_map[wallet_token.token_address].id
+        wallet_token.wallet_id = wallets_ids_map[wallet_token.wallet_address]
+        wallet_token.token_id = tokens_ids_map[wallet_token.token_address]
 
     # Импортируем активности и статистики обязательно в транзакции!
     await import_activities_and_wallet_tokens(activities, wallet_tokens, end_time)
+    if cache_service:
+        await invalidate_related_wallets_cache(cache_service, (wallet.address for wallet in wallets))
 
     logger.info(f"Свапов: {len(activities)}")
     logger.info(f"Кошельков: {len(wallets)}")
@@ -52,16 +108,97 @@ async def load_data_to_db(wallets, tokens, activities, wallet_tokens, end_time)
     logger.info(f"Кошелек-токен: {len(wallet_tokens)}")
 
 
+async def import_wallets_data_with_cache(wallets: list[Wallet]) -> dict[str, UUID]:
+    """Через upsert + select идут только новые кошельки, у известных только обновляется метка активности"""
+    known_ids, unknown_addresses = wallets_id_cache.split_known(wallet.address for wallet in wallets)
+    unknown_addresses = set(unknown_addresses)
+    new_wallets = [wallet for wallet in wallets if wallet.address in unknown_addresses]
+    known_wallets = [wallet for wallet in wallets if wallet.address not in unknown_addresses]
+    for wallet in known_wallets:
+        wallet.id = known_ids[wallet.address]
+
+    if new_wallets:
+        created_wallets_map, _ = await asyncio.gather(
+            import_wallets_data(new_wallets),
+            update_wallets_activity(known_wallets),
+        )
+    else:
+        created_wallets_map = {}
+        await update_wallets_activity(known_wallets)
+    created_ids = {address: wallet.id for address, wallet in created_wallets_map.items()}
+    wallets_id_cache.update(created_ids)
+    logger.info(f"Кошельков из кеша: {len(known_wallets)}, новых: {len(new_wallets)}")
+    return known_ids | created_ids
+
+
+async def update_wallets_activity(wallets: list[Wallet]) -> None:
+    """Обновляет метку последней активности у уже существующих кошельков (id должны быть реальными)"""
+    if not wallets:
+        return
+    if config.WALLET_LOCK_PARTITIONS:
+        partitions = partition_by_wallet_address(wallets, config.WALLET_LOCK_PARTITIONS)
+        await gather_partitions(
+            [
+                _update_wallets_activity_chunk(partition_wallets, partition=partition)
+                for partition, partition_wallets in partitions.items()
+            ],
+            partition_sessions_semaphore,
+        )
+        return
+    for i in range(5):
+        try:
+            await _update_wallets_activity_chunk(wallets)
+            break
+        except DBAPIError as e:
+            logger.error(f"Deadlock при обновлении кошельков: {e}")
+            await asyncio.sleep(random.randint(1, 3))
+    else:
+        raise ValueError("Не удалось обновить кошельки после 5 попыток")
+
+
+async def _update_wallets_activity_chunk(wallets: list[Wallet], partition: int | None = None) -> None:
+    # !!!Сортируем по адресу, чтобы избежать дедлоков при массовом апдейте
+    wallets.sort(key=lambda w: w.address)
+    async with AsyncSessionMaker() as session:
+        if partition is not None:
+            await lock_wallets_partition(session, partition)
+        await SQLAlchemyWalletRepository(session).bulk_update(
+            wallets,
+            fields=["last_activity_timestamp", "updated_at"],
+        )
+        await session.commit()
+
+
 async def import_wallets_data(wallets, chunks_count=10) -> dict[str, Wallet]:
     """Создаем кошельки и все их связи в несколько тасков"""
+    if config.WALLET_LOCK_PARTITIONS:
+        return await import_wallets_data_by_partitions(wallets)
     chunks = np.array_split(wallets, chunks_count)
     results = await asyncio.gather(*[import_wallets_data_chunk(chunks[i].tolist()) for i in range(chunks_count)])
     logger.info(f"Кошельки импортированы")
     return {key: value for result in results for key, value in result.items()}
 
 
+async def import_wallets_data_by_partitions(wallets) -> dict[str, Wallet]:
+    """
+    Создаем кошельки партициями по хешу адреса, каждую в своей транзакции под advisory-блокировкой партиции
+    (та же схема, что и в апдейтере статистик), поэтому дедлоков по кошелькам нет и повторы не нужны
+    """
+    partitions = partition_by_wallet_address(wallets, config.WALLET_LOCK_PARTITIONS)
+    results = await gather_partitions(
+        [
+            import_wallets_data_chunk(partition_wallets, partition=partition)
+            for partition, partition_wallets in partitions.items()
+        ],
+        partition_sessions_semaphore,
+    )
+    logger.info(f"Кошельки импортированы")
+    return {key: value for result in results for key, value in result.items()}
+
+
 async def import_wallets_data_chunk(
     wallets,
+    partition: int | None = None,
 ) -> dict[str, Wallet]:
     """Импортируем кошельки со всеми связями в одной транзакции"""
     async with AsyncSessionMaker() as session:
@@ -69,38 +206,30 @@ async def import_wallets_data_chunk(
         # # !!!Сортируем по адресу, чтобы избежать дедлоков при массовом апдейте
         wallets.sort(key=lambda w: w.address)
 
-        for i in range(5):
-            try:
-                # В случае конфликта, обновляем метки активностей
-                await repository.bulk_create(
-                    objects=wallets,
-                    on_conflict=["address"],
-                    update_fields=[
-                        # "first_activity_timestamp",
-                        "last_activity_timestamp",
-                        "updated_at",
-                    ],
-                )
-                break
-            except DBAPIError as e:
-                logger.error(f"Deadlock при обновлении кошельков: {e}")
-                await asyncio.sleep(random.randint(1, 3))
+        if partition is not None:
+            await lock_wallets_partition(session, partition)
+            wallets_ids_map = await _upsert_wallets(repository, wallets)
         else:
-            raise ValueError("Не удалось обновить кошельки после 5 попыток")
-
-        created_addresses = list({wallet.address for wallet in wallets})
-        created_wallets_map = await repository.in_bulk(created_addresses, "address")
+            for i in range(5):
+                try:
+                    wallets_ids_map = await _upsert_wallets(repository, wallets)
+                    break
+                except DBAPIError as e:
+                    logger.error(f"Deadlock при обновлении кошельков: {e}")
+                    await asyncio.sleep(random.randint(1, 3))
+            else:
+                raise ValueError("Не удалось обновить кошельки после 5 попыток")
 
         wallet_stats_7d = []
         wallet_stats_30d = []
         wallet_stats_all = []
 
         for wallet in wallets:
-            # Обновляем айдишники у связей на реальные
-            created_wallet_id = created_wallets_map[wallet.address].id
-            wallet.stats_7d.wallet_id = created_wallet_id
-            wallet.stats_30d.wallet_id = created_wallet_id
-            wallet.stats_all.wallet_id = created_wallet_id
+            # Обновляем айдишники кошелька и связей на реальные
+            wallet.id = wallets_ids_map[wallet.address]
+            wallet.stats_7d.wallet_id = wallet.id
+            wallet.stats_30d.wallet_id = wallet.id
+            wallet.stats_all.wallet_id = wallet.id
 
             wallet_stats_7d.append(wallet.stats_7d)
             wallet_stats_30d.append(wallet.stats_30d)
@@ -112,15 +241,54 @@ async def import_wallets_data_chunk(
 
         await session.commit()
 
-        return created_wallets_map
+        return {wallet.address: wallet for wallet in wallets}
+
+
+async def _upsert_wallets(repository: SQLAlchemyWalletRepository, wallets: list[Wallet]) -> dict[str, UUID]:
+    """Upsert кошельков, возвращает адрес -> id в БД"""
+    # В случае конфликта, обновляем метки активностей
+    update_fields = [
+        # "first_activity_timestamp",
+        "last_activity_timestamp",
+        "updated_at",
+    ]
+    if config.LOADER_RETURNING_IDS:
+        # id новых кошельков - сгенерированные в преобразователе uuid7, id существующих вернет RETURNING
+        return await repository.bulk_upsert_returning_ids(wallets, key_field="address", update_fields=update_fields)
+    await repository.bulk_create(
+        objects=wallets,
+        on_conflict=["address"],
+        update_fields=update_fields,
+    )
+    created_addresses = list({wallet.address for wallet in wallets})
+    created_wallets_map = await repository.in_bulk(created_addresses, "address")
+    return {address: wallet.id for address, wallet in created_wallets_map.items()}
+
+
+async def import_tokens_with_cache(tokens: list[Token]) -> dict[str, UUID]:
+    """Через upsert + select идут только новые токены"""
+    known_ids, unknown_addresses = tokens_id_cache.split_known(token.address for token in tokens)
+    unknown_addresses = set(unknown_addresses)
+    new_tokens = [token for token in tokens if token.address in unknown_addresses]
+    created_tokens_map = await import_tokens(new_tokens) if new_tokens else {}
+    created_ids = {address: token.id for address, token in created_tokens_map.items()}
+    tokens_id_cache.update(created_ids)
+    return known_ids | created_ids
 
 
 async def import_tokens(tokens) -> dict[str, Token]:
     async with AsyncSessionMaker() as session:
         repository = SQLAlchemyTokenRepository(session)
-        await repository.bulk_create(tokens, ignore_conflicts=True)
-        created_addresses = list({token.address for token in tokens})
-        created_tokens_map = await repository.in_bulk(created_addresses, "address")
+        if config.LOADER_RETURNING_IDS:
+            # Существующие токены не обновляем, дочитываются только их id
+            tokens_ids_map = await repository.bulk_upsert_returning_ids(tokens, key_field="address")
+            for token in tokens:
+                token.id = tokens_ids_map[token.address]
+            created_tokens_map = {token.address: token for token in tokens}
+        else:
+            await repository.bulk_create(tokens, ignore_conflicts=True)
+            created_addresses = list({token.address for token in tokens})
+            created_tokens_map = await repository.in_bulk(created_addresses, "address")
         await session.commit()
         logger.info("Токены импортированы")
         return created_tokens_map
@@ -132,10 +300,23 @@ async def import_activities_and_wallet_tokens(
     end_time: datetime,
 ):
     async with AsyncSessionMaker() as session:
-        await SQLAlchemySwapRepository(session).bulk_create(activities, batch_size=30000)
-        await SQLAlchemyWalletTokenRepository(session).bulk_update_or_create_wallet_token_with_merge(
-            wallet_tokens, batch_size=20000
-        )
+        if config.LOADER_COPY_SWAPS:
+            await SQLAlchemySwapRepository(session).bulk_copy(activities, batch_size=200000)
+        else:
+            await SQLAlchemySwapRepository(session).bulk_create(activities, batch_size=30000)
+        if config.LOADER_STAGING_WALLET_TOKENS:
+            await SQLAlchemyWalletTokenRepository(session).bulk_update_or_create_wallet_token_with_merge_via_staging(
+                wallet_tokens
+            )
+        else:
+            await SQLAlchemyWalletTokenRepository(session).bulk_update_or_create_wallet_token_with_merge(
+                wallet_tokens, batch_size=20000
+            )
+        if config.LOADER_MARK_DIRTY_WALLETS:
+            # В той же транзакции, чтобы кошельки с новыми свапами не потерялись для пересчета статистики
+            await SQLAlchemyWalletStatsDirtyRepository(session).mark_wallets([a.wallet_id for a in activities])
+        # Блоки новых свапов для пересчета wallet_relation (свапы могут быть и ниже уже пересчитанных блоков)
+        await SQLAlchemyWalletRelationsDirtyBlocksRepository(session).mark_blocks([a.block_id for a in activities])
         if config.PERSISTENT_MODE:
             flipside_cfg = await utils.get_flipside_config()
             flipside_cfg.swaps_parsed_until_block_timestamp = end_time
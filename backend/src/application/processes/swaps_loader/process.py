@@ -9,70 +9,118 @@ warnings.filterwarnings(
 
 import asyncio
 from asyncio import Queue
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from functools import partial
 
 from flipside.errors.query_run_errors import QueryRunCancelledError, QueryRunExecutionError
 from pydantic.error_wrappers import ValidationError
+from redis.asyncio import Redis
 
-from src.application.processes.swaps_loader import config, extractor, loader, transformer
-from src.application.processes.swaps_loader.common import utils
+from src.application.processes.swaps_loader import columnar_transformer, config, extractor, loader, transformer
+from src.application.processes.swaps_loader.common import flipside_queries, utils
+from src.application.processes.swaps_loader.common.extract_cache import ExtractCache
 from src.application.processes.swaps_loader.common.logger import root_logger as logger
+from src.application.processes.swaps_loader.common.prefetch import PrefetchLimiter
+from src.application.processes.swaps_loader.common.window_sizing import ExtractWindowSizer
 from src.application.processes.swaps_loader.extractor import FlipsideClientException
+from src.infra.redis.cache_service import RedisCacheService
 
 
 async def extract_process(
     extracted_data_queue: Queue,
-    loader_signals_queue: Queue,
+    prefetch_limiter: PrefetchLimiter,
+    window_sizer: ExtractWindowSizer,
+    extract_cache: ExtractCache | None,
     period_start: datetime,
     period_end: datetime,
 ):
+    """
+    Собирает свапы по окнам. Одновременно собирается до EXTRACTOR_PREFETCH_WINDOWS окон,
+    но дальше они передаются строго по порядку, чтобы период в конфиге не перескакивал вперед
+    """
+    windows_queue = Queue()
+    scheduler = asyncio.create_task(
+        schedule_extract_windows(windows_queue, prefetch_limiter, window_sizer, extract_cache, period_start, period_end)
+    )
+    try:
+        while True:
+            window_task = await windows_queue.get()
+            if window_task is None:
+                break
+            data = await window_task
+            if data is None:
+                break
+            await extracted_data_queue.put(data)
+    finally:
+        scheduler.cancel()
+        while not windows_queue.empty():
+            window_task = windows_queue.get_nowait()
+            if window_task is not None:
+                window_task.cancel()
+
+    await extracted_data_queue.put(None)
+    logger.info(f"Сборщик свапов завершил работу")
+
+
+async def schedule_extract_windows(
+    windows_queue: Queue,
+    prefetch_limiter: PrefetchLimiter,
+    window_sizer: ExtractWindowSizer,
+    extract_cache: ExtractCache | None,
+    period_start: datetime,
+    period_end: datetime,
+):
+    """Запускает сбор следующих окон, пока позволяет лимит опережающего сбора"""
     current_time = period_start
     while current_time < period_end:
-        load_next = await loader_signals_queue.get()
-        logger.info("Получили сигнал NEXT")
-        flipside_account = await utils.get_flipside_account()
-        if not flipside_account:
-            logger.error(f"Нету активных аккаунтов FlipsideCrypto в БД")
-            break
-
+        await prefetch_limiter.acquire_window()
         next_time = min(
-            current_time + timedelta(minutes=config.EXTRACTOR_PERIOD_INTERVAL_MINUTES),
+            current_time + window_sizer.next_window(),
             period_end,
         )  # Максимальный диапазон за запрос
-
-        sol_prices = await utils.get_sol_prices(
-            minute_from=current_time - timedelta(minutes=1),
-            minute_to=next_time + timedelta(minutes=1),
+        await windows_queue.put(
+            asyncio.create_task(extract_window(prefetch_limiter, window_sizer, extract_cache, current_time, next_time))
         )
-        if not sol_prices.get(next_time):
-            logger.error(f"Ошибка - Нету данных о цене соланы в {next_time}!")
-            break
+        current_time = next_time
+    await windows_queue.put(None)
+
+
+async def extract_window(
+    prefetch_limiter: PrefetchLimiter,
+    window_sizer: ExtractWindowSizer,
+    extract_cache: ExtractCache | None,
+    current_time: datetime,
+    next_time: datetime,
+) -> list | None:
+    """
+    Собирает свапы за одно окно (из локального кеша, если окно уже собиралось), при ошибках Flipside меняет учетку.
+    None - сбор нужно прекратить
+    """
+    sol_prices = await utils.get_sol_prices(
+        minute_from=current_time - timedelta(minutes=1),
+        minute_to=next_time + timedelta(minutes=1),
+    )
+    if not sol_prices.get(next_time):
+        logger.error(f"Ошибка - Нету данных о цене соланы в {next_time}!")
+        return None
+
+    start = datetime.now()
+    parts_count = 0
+    extracted_data = await asyncio.to_thread(extract_cache.get, current_time, next_time) if extract_cache else None
+    if extracted_data is not None:
+        logger.info(f"Свапы за {current_time} - {next_time} взяты из кеша")
+    while extracted_data is None:
+        flipside_account = await utils.get_flipside_account()
+        if not flipside_account:
+            logger.error(f"Нету активных аккаунтов FlipsideCrypto в БД")
+            return None
         try:
             logger.info(f"Начинаем сбор свапов за {current_time} - {next_time}")
-            start = datetime.now()
-            extracted_data = await extract_data_for_period(current_time, next_time, flipside_account.api_key)
-            total_count = len(extracted_data)
-            end = datetime.now()
-            logger.info(
-                " | ".join(
-                    [
-                        f"Собраны свапы за период {current_time} - {next_time}",
-                        f"Кол-во: {total_count}",
-                        f"Время {end - start}",
-                    ]
-                )
-            )
-            await extracted_data_queue.put(
-                [
-                    extracted_data,
-                    current_time,
-                    next_time,
-                    sol_prices,
-                ]
+            parts_count = window_sizer.parts_count(current_time, next_time)
+            extracted_data = await extract_data_for_period(
+                current_time, next_time, flipside_account.api_key, parts_count
             )
-            current_time = next_time
         except (
             QueryRunExecutionError,
             QueryRunCancelledError,
@@ -81,20 +129,44 @@ async def extract_process(
             await utils.set_flipside_account_inactive(flipside_account)
             logger.error(f"Ошибка Flipside: {e}")
             logger.info(f"Меняем учетку Flipside")
-            await loader_signals_queue.put("EXTRACT NEXT")
             continue
+        if extract_cache:
+            await asyncio.to_thread(extract_cache.put, current_time, next_time, extracted_data)
 
-    await extracted_data_queue.put(None)
-    logger.info(f"Сборщик свапов завершил работу")
+    total_count = len(extracted_data)
+    window_sizer.observe(total_count, current_time, next_time)
+    data_size = utils.estimate_records_size(extracted_data)
+    await prefetch_limiter.add_size(data_size)
+    end = datetime.now()
+    logger.info(
+        " | ".join(
+            [
+                f"Собраны свапы за период {current_time} - {next_time}",
+                f"Кол-во: {total_count}",
+                f"Запросов: {parts_count}",
+                f"Время {end - start}",
+                f"В очереди: {prefetch_limiter.queued_bytes // 2**20} MB",
+            ]
+        )
+    )
+    return [
+        extracted_data,
+        current_time,
+        next_time,
+        sol_prices,
+        data_size,
+    ]
 
 
 async def extract_data_for_period(
     start_time: datetime,
     end_time: datetime,
     flipside_api_key,
+    parts_count: int | None = None,
 ) -> list[dict]:
-    workers_count = config.EXTRACTOR_PARALLEL_WORKERS
-    intervals = utils.split_time_range(start_time, end_time, workers_count)
+    parts_count = parts_count or config.EXTRACTOR_PARALLEL_WORKERS
+    workers_count = min(parts_count, config.EXTRACTOR_PARALLEL_WORKERS)
+    intervals = utils.split_time_range(start_time, end_time, parts_count)
     swaps = []
     try:
         loop = asyncio.get_running_loop()
@@ -126,40 +198,71 @@ async def transform_process(
     extracted_data_queue: Queue,
     transformed_data_queue: Queue,
 ):
+    if config.TRANSFORMER_VECTORIZED:
+        transform_data = columnar_transformer.transform_data_vectorized
+    else:
+        transform_data = transformer.transform_data
 
-    while True:
-        data = await extracted_data_queue.get()
-        if data is not None:
-            swaps, period_start, period_end, sol_prices = data
-            logger.info(f"Начинаем преобразование данных")
-            start = datetime.now()
-            objects_to_load = await asyncio.to_thread(transformer.transform_data, swaps, sol_prices)
-            end = datetime.now()
-            logger.info(f"Время преобразования: {end-start}")
-            await transformed_data_queue.put([objects_to_load, period_start, period_end])
-        else:
-            break
+    executor = ProcessPoolExecutor(max_workers=config.TRANSFORMER_WORKERS) if config.TRANSFORMER_WORKERS > 1 else None
+    try:
+        while True:
+            data = await extracted_data_queue.get()
+            if data is not None:
+                swaps, period_start, period_end, sol_prices, data_size = data
+                logger.info(f"Начинаем преобразование данных")
+                start = datetime.now()
+                if executor:
+                    objects_to_load = await transform_data_in_processes(executor, transform_data, swaps, sol_prices)
+                else:
+                    objects_to_load = await asyncio.to_thread(transform_data, swaps, sol_prices)
+                end = datetime.now()
+                logger.info(f"Время преобразования: {end-start}")
+                await transformed_data_queue.put([objects_to_load, period_start, period_end, data_size])
+            else:
+                break
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
     await transformed_data_queue.put(None)  # Кладем None чтобы остальные процессы завершали работу
     logger.info(f"Преобразователь завершил работу!")
 
 
+async def transform_data_in_processes(
+    executor: ProcessPoolExecutor,
+    transform_data,
+    swaps: list[dict],
+    sol_prices: dict,
+):
+    """Разбивает свапы периода по tx_id на части, преобразует их в пуле процессов и сливает результаты"""
+    shards = transformer.shard_swaps_by_tx(swaps, config.TRANSFORMER_WORKERS)
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(
+        *[loop.run_in_executor(executor, transform_data, shard, sol_prices) for shard in shards]
+    )
+    return await asyncio.to_thread(transformer.merge_transformed_shards, results)
+
+
 async def load_process(
     transformed_data_queue: Queue,
-    loader_signals_queue: Queue,
+    prefetch_limiter: PrefetchLimiter,
 ):
-    while True:
-        data = await transformed_data_queue.get()
-        if data is not None:
-            await loader_signals_queue.put("EXTRACT NEXT")
-            objects_to_load, period_start, period_end = data
-            logger.info(f"Начинаем импорт данных в БД")
-            start = datetime.now()
-            await loader.load_data_to_db(*objects_to_load, period_end)
-            end = datetime.now()
-            logger.info(f"Данные импортированы за {period_start} - {period_end}")
-            logger.info(f"Время импорта: {end-start}")
-        else:
-            break
+    # Клиент Redis живет, пока работает загрузчик (подключается только при сбросе кеша)
+    async with Redis.from_url(config.REDIS_URL, decode_responses=True) as redis:
+        cache_service = RedisCacheService(redis, local_max_size=0) if config.LOADER_INVALIDATE_API_CACHE else None
+        while True:
+            data = await transformed_data_queue.get()
+            if data is not None:
+                await prefetch_limiter.release_window()
+                objects_to_load, period_start, period_end, data_size = data
+                logger.info(f"Начинаем импорт данных в БД")
+                start = datetime.now()
+                await loader.load_data_to_db(*objects_to_load, period_end, cache_service=cache_service)
+                await prefetch_limiter.release_size(data_size)
+                end = datetime.now()
+                logger.info(f"Данные импортированы за {period_start} - {period_end}")
+                logger.info(f"Время импорта: {end-start}")
+            else:
+                break
     logger.info(f"Загрузчик завершил работу!")
 
 
@@ -169,29 +272,53 @@ async def process():
 
     extracted_data_queue = Queue()
     transformed_data_queue = Queue()
-    loader_signals_queue = Queue()  # Очередь сигналов, чтобы подгружать новые, только когда загрузчик забрал предыдущие
-
-    await loader_signals_queue.put("EXTRACT NEXT")
+    # Лимит опережающего сбора, чтобы подгружать новые, только когда загрузчик забрал предыдущие
+    prefetch_limiter = PrefetchLimiter(
+        max_windows=config.EXTRACTOR_PREFETCH_WINDOWS,
+        max_bytes=config.EXTRACTOR_PREFETCH_MAX_MB * 2**20,
+    )
+    window_sizer = ExtractWindowSizer(
+        adaptive=config.EXTRACTOR_ADAPTIVE_WINDOWS,
+        period_interval_minutes=config.EXTRACTOR_PERIOD_INTERVAL_MINUTES,
+        parallel_workers=config.EXTRACTOR_PARALLEL_WORKERS,
+        target_rows_per_query=config.EXTRACTOR_TARGET_ROWS_PER_QUERY,
+        min_period_interval_minutes=config.EXTRACTOR_MIN_PERIOD_INTERVAL_MINUTES,
+        max_period_interval_minutes=config.EXTRACTOR_MAX_PERIOD_INTERVAL_MINUTES,
+    )
+    extract_cache = (
+        ExtractCache(
+            directory=config.EXTRACT_CACHE_DIR,
+            max_size_bytes=config.EXTRACT_CACHE_MAX_MB * 2**20,
+            query_version=flipside_queries.get_swaps_query_version(config.BLACKLISTED_TOKENS),
+        )
+        if config.EXTRACT_CACHE_DIR
+        else None
+    )
 
     try:
         async with asyncio.TaskGroup() as tg:
             tg.create_task(
                 extract_process(
                     extracted_data_queue,
-                    loader_signals_queue,
+                    prefetch_limiter,
+                    window_sizer,
+                    extract_cache,
                     start_time,
                     end_time,
                 )
             )
             tg.create_task(transform_process(extracted_data_queue, transformed_data_queue))
-            tg.create_task(load_process(transformed_data_queue, loader_signals_queue))
+            tg.create_task(load_process(transformed_data_queue, prefetch_limiter))
     except Exception as e:
         logger.critical(f"Неизвестная ошибка, завершаем работу: {e}")
         raise
+    finally:
+        await asyncio.to_thread(loader.dump_address_id_caches)
     logger.info(f"Процесс для периода c {start_time} до {end_time} завершен!")
 
 
 async def main():
+    await asyncio.to_thread(loader.load_address_id_caches)
     if config.PERSISTENT_MODE:
         while True:
             await process()
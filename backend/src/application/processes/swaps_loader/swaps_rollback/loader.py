@@ -15,6 +15,7 @@ from src.infra.db.sqlalchemy.models import FlipsideConfig
 from src.infra.db.sqlalchemy.repositories import (
     SQLAlchemySwapRepository,
     SQLAlchemyTokenRepository,
+    SQLAlchemyWalletRelationsDirtyBlocksRepository,
     SQLAlchemyWalletRepository,
     SQLAlchemyWalletStatistic7dRepository,
     SQLAlchemyWalletStatistic30dRepository,
@@ -55,6 +56,8 @@ async def import_activities_and_wallet_tokens(
         await SQLAlchemyWalletTokenRepository(session).bulk_update_or_create_wallet_token_with_merge(
             wallet_tokens, batch_size=20000
         )
+        # Связи кошельков по блокам удаленных свапов тоже нужно пересчитать
+        await SQLAlchemyWalletRelationsDirtyBlocksRepository(session).mark_blocks([a.block_id for a in activities])
         if config.PERSISTENT_MODE:
             flipside_cfg = await utils.get_flipside_config()
             flipside_cfg.swaps_parsed_until_block_timestamp = end_time
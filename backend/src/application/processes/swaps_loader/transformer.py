@@ -23,6 +23,73 @@ def transform_data(swaps, sol_prices):
     return wallets, tokens, activities, wallet_tokens
 
 
+def shard_swaps_by_tx(swaps: list, shards_count: int) -> list[list]:
+    """Разбивает свапы на части по хешу tx_id, чтобы все свапы одной транзакции попали в одну часть"""
+    shards = [[] for _ in range(shards_count)]
+    for swap in swaps:
+        shards[hash(swap["tx_id"]) % shards_count].append(swap)
+    return [shard for shard in shards if shard]
+
+
+def merge_transformed_shards(
+    results: list[Tuple[List[Wallet], List[Token], List[Swap], List[WalletToken]]],
+) -> Tuple[List[Wallet], List[Token], List[Swap], List[WalletToken]]:
+    """Сливает результаты transform_data, посчитанные по частям одного периода"""
+    wallets = {}
+    tokens = {}
+    activities_list = []
+    wallet_tokens = {}
+    merged_keys = set()
+
+    for shard_wallets, shard_tokens, shard_activities, shard_wallet_tokens in results:
+        for wallet in shard_wallets:
+            merged_wallet = wallets.get(wallet.address)
+            if not merged_wallet:
+                wallets[wallet.address] = wallet
+                continue
+            merged_wallet.first_activity_timestamp = min(
+                merged_wallet.first_activity_timestamp, wallet.first_activity_timestamp
+            )
+            merged_wallet.last_activity_timestamp = max(
+                merged_wallet.last_activity_timestamp, wallet.last_activity_timestamp
+            )
+
+        for token in shard_tokens:
+            tokens.setdefault(token.address, token)
+
+        for activity in shard_activities:
+            activity.wallet_id = wallets[activity.wallet_address].id
+            activity.token_id = tokens[activity.token_address].id
+            activities_list.append(activity)
+
+        for wallet_token in shard_wallet_tokens:
+            key = (wallet_token.wallet_address, wallet_token.token_address)
+            merged_wallet_token = wallet_tokens.get(key)
+            if not merged_wallet_token:
+                wallet_token.wallet_id = wallets[wallet_token.wallet_address].id
+                wallet_token.token_id = tokens[wallet_token.token_address].id
+                wallet_tokens[key] = wallet_token
+                continue
+            calculations.merge_wallet_tokens(merged_wallet_token, wallet_token)
+            merged_keys.add(key)
+
+    # Цена первой покупки/продажи связок, собранных из нескольких частей, - по свапам всех частей
+    merged_activities = defaultdict(list)
+    for activity in activities_list:
+        key = (activity.wallet_address, activity.token_address)
+        if key in merged_keys:
+            merged_activities[key].append(activity)
+    for key, activities in merged_activities.items():
+        calculations.calculate_first_prices(wallet_tokens[key], activities)
+
+    return (
+        list(wallets.values()),
+        list(tokens.values()),
+        activities_list,
+        list(wallet_tokens.values()),
+    )
+
+
 def populate_swaps_data(swaps: list):
     """Дополняет данные свапов дополнительной информацией"""
     swaps_map = defaultdict(list)
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+from collections import deque
+
+from src.domain.entities.wallet import Wallet
+
+logger = logging.getLogger(__name__)
+
+
+def measure_item(item) -> tuple[int, int]:
+    """Размер элемента очереди конвейера: (кошельков, токенов)"""
+    if item is None:
+        return 0, 0
+    if isinstance(item, Wallet):
+        return 1, len(item.tokens)
+    wallets, columns = item  # Батч колоночного пересчета
+    return len(wallets), len(columns["wallet_code"])
+
+
+class WalletsQueue:
+    """
+    Очередь конвейера пересчета, ограниченная суммарным кол-вом кошельков и их токенов.
+    put ждет, пока в очереди не освободится место. Элемент больше лимита пропускается в пустую очередь,
+    иначе он бы навсегда заблокировал конвейер. 0 - без ограничения
+    """
+
+    def __init__(self, max_wallets: int = 0, max_tokens: int = 0):
+        self._max_wallets = max_wallets
+        self._max_tokens = max_tokens
+        self._items: deque[tuple[object, int, int]] = deque()
+        self._wallets = 0
+        self._tokens = 0
+        self._changed = asyncio.Condition()
+
+    @property
+    def wallets(self) -> int:
+        return self._wallets
+
+    @property
+    def tokens(self) -> int:
+        return self._tokens
+
+    def _fits(self, wallets: int, tokens: int) -> bool:
+        if not self._items:
+            return True
+        if self._max_wallets and self._wallets + wallets > self._max_wallets:
+            return False
+        if self._max_tokens and self._tokens + tokens > self._max_tokens:
+            return False
+        return True
+
+    async def put(self, item) -> None:
+        wallets, tokens = measure_item(item)
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._fits(wallets, tokens))
+            self._items.append((item, wallets, tokens))
+            self._wallets += wallets
+            self._tokens += tokens
+            self._changed.notify_all()
+
+    async def get(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: bool(self._items))
+            item, wallets, tokens = self._items.popleft()
+            self._wallets -= wallets
+            self._tokens -= tokens
+            self._changed.notify_all()
+            return item
+
+
+class AdaptiveParallelLimit:
+    """
+    Лимит параллельных задач этапа, подстраивающийся под задержку БД (AIMD).
+    Базовая задержка - минимальная сглаженная задержка батча (медленно растет, чтобы не устаревать).
+    Если сглаженная задержка выше базовой в tolerance раз - лимит уменьшается вдвое, иначе растет на 1
+    до max_parallel. Если adaptive=False - лимит всегда max_parallel
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_parallel: int,
+        adaptive: bool = True,
+        tolerance: float = 2.0,
+        smoothing: float = 0.3,
+        baseline_drift: float = 0.01,
+    ):
+        self._name = name
+        self._max_parallel = max_parallel
+        self._adaptive = adaptive
+        self._tolerance = tolerance
+        self._smoothing = smoothing
+        self._baseline_drift = baseline_drift
+        self._latency: float | None = None
+        self._baseline: float | None = None
+        self.limit = max_parallel
+
+    def observe(self, latency: float) -> None:
+        """Учитывает время выполнения очередного батча (секунды)"""
+        if not self._adaptive:
+            return
+        if self._latency is None:
+            self._latency = latency
+        else:
+            self._latency = self._smoothing * latency + (1 - self._smoothing) * self._latency
+        if self._baseline is None:
+            self._baseline = self._latency
+        else:
+            self._baseline = min(self._latency, self._baseline * (1 + self._baseline_drift))
+
+        limit = self.limit
+        if self._latency > self._baseline * self._tolerance:
+            limit = max(limit // 2, 1)
+        elif limit < self._max_parallel:
+            limit += 1
+        if limit != self.limit:
+            logger.debug(
+                f"Этап {self._name}: лимит параллельных задач {self.limit} -> {limit} "
+                f"| Задержка: {self._latency:.2f}с (базовая {self._baseline:.2f}с)"
+            )
+            self.limit = limit
@@ -1,9 +1,17 @@
 import statistics
+from dataclasses import fields
 from datetime import datetime, timedelta, timezone
 
 import pytz
 
-from src.domain.entities.wallet import Wallet, WalletStatisticAll
+from src.domain.entities.wallet import Wallet, WalletStatistic7d, WalletStatisticAll
+
+# Поля статистики, входящие в отпечаток (все посчитанные значения - числа или None)
+STATS_FINGERPRINT_FIELDS = tuple(
+    f.name
+    for f in fields(WalletStatistic7d)
+    if f.name not in ("id", "wallet_id", "created_at", "updated_at", "stats_fingerprint")
+)
 
 
 def calculate_wallet_stats(wallet):
@@ -20,10 +28,25 @@ def calculate_wallet_stats(wallet):
         token_stats = filter_period_tokens(all_tokens, period, current_datetime)
         recalculate_wallet_period_stats(stats, token_stats)
 
+    wallet.next_period_expiry_at = calculate_next_period_expiry(all_tokens, current_datetime)
     wallet.is_scammer = determine_scammer_status(wallet)
     wallet.is_bot = determine_bot_status(wallet)
 
 
+def calculate_stats_fingerprint(stats) -> int:
+    """
+    Отпечаток посчитанной статистики периода.
+    hash() чисел детерминирован между процессами (в отличие от строк) и совпадает для равных int/float/Decimal,
+    None заменяется флагом, т.к. его hash в Python 3.11 зависит от процесса
+    """
+    values = []
+    for name in STATS_FINGERPRINT_FIELDS:
+        value = getattr(stats, name)
+        values.append(value is None)
+        values.append(0 if value is None else value)
+    return hash(tuple(values))
+
+
 def determine_bot_status(
     wallet: Wallet,
 ) -> bool:
@@ -85,6 +108,25 @@ def filter_period_tokens(all_tokens, period, current_datetime) -> list:
     return period_tokens
 
 
+def calculate_next_period_expiry(all_tokens, current_datetime) -> datetime | None:
+    """
+    Ближайший момент, когда какой-либо токен выйдет из периода 7д или 30д (и статистика за период изменится
+    без новых свапов). Токен в периоде, пока первая продажа (а без продаж - первая покупка) не старше периода
+    """
+    next_expiry = None
+    for token in all_tokens:
+        timestamp = token.first_sell_timestamp or token.first_buy_timestamp
+        if timestamp is None:
+            continue
+        for days in (7, 30):
+            expiry = timestamp + timedelta(days=days, microseconds=1)
+            if expiry > current_datetime:
+                if next_expiry is None or expiry < next_expiry:
+                    next_expiry = expiry
+                break
+    return next_expiry
+
+
 def recalculate_wallet_period_stats(stats, token_stats):
     total_token = 0
     total_token_buys = 0
@@ -0,0 +1,421 @@
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import numpy as np
+import pytz
+
+from src.domain.entities.wallet import Wallet
+
+from .calculations import determine_bot_status, determine_scammer_status
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+NO_TIMESTAMP = np.iinfo(np.int64).min
+NO_EXPIRY = np.iinfo(np.int64).max
+PERIODS = (7, 30, 0)
+
+
+# Поля WalletToken, нужные для пересчета статистики (порядок - порядок значений в строках)
+WALLET_TOKEN_FIELDS = (
+    "wallet_id",
+    "first_buy_timestamp",
+    "first_sell_timestamp",
+    "total_buys_count",
+    "total_sales_count",
+    "total_buy_amount_usd",
+    "total_sell_amount_usd",
+    "total_buy_amount_token",
+    "total_sell_amount_token",
+    "total_profit_usd",
+    "total_profit_percent",
+    "first_buy_price_usd",
+    "first_buy_sell_duration",
+    "total_swaps_from_txs_with_mt_3_swappers",
+    "total_swaps_from_arbitrage_swap_events",
+)
+
+
+def calculate_wallets_stats_vectorized(wallets: list[Wallet], columns: dict[str, np.ndarray] | None = None) -> None:
+    """
+    Векторизованный вариант calculations.calculate_wallet_stats для батча кошельков.
+    Токены всех кошельков собираются в колонки (или передаются уже колонками), статистика за все периоды
+    считается сгруппированными операциями numpy по кошелькам.
+
+    Точность совпадает с построчным расчетом:
+    - счетчики, корзины PnL и длительности - int64 / float64, как и исходные поля;
+    - суммы Decimal-полей - по Decimal (object-массивы) в том же порядке и контексте, что и sum() в построчном расчете;
+    - медианы выбираются из отсортированных исходных значений, как в statistics.median;
+    - средние и проценты - теми же выражениями из тех же сумм и счетчиков
+    """
+    if columns is None:
+        columns = wallet_token_rows_to_columns(wallets, wallet_tokens_to_rows(wallets))
+    current_datetime = datetime.now().astimezone(tz=pytz.UTC)
+    apply_wallets_stats(wallets, calculate_columns_stats(columns, len(wallets), current_datetime))
+
+
+def calculate_columns_stats(
+    columns: dict[str, np.ndarray],
+    n_wallets: int,
+    current_datetime: datetime,
+) -> tuple[dict[int, list[dict]], list[datetime | None]]:
+    """
+    Статистика кошельков по колонкам их токенов: {период: [значения полей статистики по кошелькам]}
+    и ближайшие моменты выхода токенов из периодов по кошелькам
+    """
+    stats_by_period = {
+        period: calculate_period_stats(columns, n_wallets, period, current_datetime) for period in PERIODS
+    }
+    return stats_by_period, calculate_next_period_expiry(columns, n_wallets, current_datetime)
+
+
+def calculate_packed_columns_stats(
+    packed_columns: dict,
+    n_wallets: int,
+    current_datetime: datetime,
+) -> tuple[dict[int, list[dict]], list[datetime | None]]:
+    """calculate_columns_stats для колонок, упакованных pack_columns (для запуска в пуле процессов)"""
+    return calculate_columns_stats(unpack_columns(packed_columns), n_wallets, current_datetime)
+
+
+def apply_wallets_stats(
+    wallets: list[Wallet],
+    calculated: tuple[dict[int, list[dict]], list[datetime | None]],
+) -> None:
+    """Записывает посчитанную статистику в кошельки и определяет статусы бота/скамера"""
+    stats_by_period, next_period_expiry = calculated
+    updated_at = datetime.now(timezone.utc)
+    for period, period_stats in stats_by_period.items():
+        for wallet, values in zip(wallets, period_stats):
+            if period == 7:
+                stats = wallet.stats_7d
+            elif period == 30:
+                stats = wallet.stats_30d
+            else:
+                stats = wallet.stats_all
+            for name, value in values.items():
+                setattr(stats, name, value)
+            stats.updated_at = updated_at
+
+    for wallet, next_expiry in zip(wallets, next_period_expiry):
+        wallet.next_period_expiry_at = next_expiry
+        wallet.is_scammer = determine_scammer_status(wallet)
+        wallet.is_bot = determine_bot_status(wallet)
+
+
+def pack_columns(columns: dict[str, np.ndarray]) -> dict:
+    """
+    Компактное представление колонок для передачи в другой процесс: numpy-колонки передаются как есть,
+    Decimal-колонки - одной строкой значений через пробел (None - пустое значение) вместо pickle каждого Decimal
+    """
+    packed = {}
+    for name, values in columns.items():
+        if values.dtype == object:
+            packed[name] = (len(values), " ".join("" if value is None else str(value) for value in values).encode())
+        else:
+            packed[name] = values
+    return packed
+
+
+def unpack_columns(packed_columns: dict) -> dict[str, np.ndarray]:
+    columns = {}
+    for name, values in packed_columns.items():
+        if isinstance(values, tuple):
+            count, data = values
+            strings = data.decode().split(" ") if count else []
+            columns[name] = np.array([Decimal(value) if value else None for value in strings], dtype=object)
+        else:
+            columns[name] = values
+    return columns
+
+
+def _to_microseconds(value: datetime | None) -> int:
+    if value is None:
+        return NO_TIMESTAMP
+    return (value - EPOCH) // ONE_MICROSECOND
+
+
+def wallet_tokens_to_rows(wallets: list[Wallet]) -> list[tuple]:
+    """Токены кошельков (wallet.tokens) в строки с полями WALLET_TOKEN_FIELDS"""
+    return [
+        (wallet.id, *(getattr(token, field) for field in WALLET_TOKEN_FIELDS[1:]))
+        for wallet in wallets
+        for token in wallet.tokens
+    ]
+
+
+def wallet_token_rows_to_columns(wallets: list[Wallet], rows: list[tuple]) -> dict[str, np.ndarray]:
+    """
+    Строки WalletToken (поля WALLET_TOKEN_FIELDS) в колонки.
+    wallet_code - индекс кошелька в списке, строки группируются по кошелькам с сохранением исходного порядка
+    """
+    wallet_codes_map = {wallet.id: code for code, wallet in enumerate(wallets)}
+    wallet_codes = np.array([wallet_codes_map[row[0]] for row in rows], dtype=np.int64)
+    (
+        _,
+        first_buy_timestamp,
+        first_sell_timestamp,
+        total_buys_count,
+        total_sales_count,
+        total_buy_amount_usd,
+        total_sell_amount_usd,
+        total_buy_amount_token,
+        total_sell_amount_token,
+        total_profit_usd,
+        total_profit_percent,
+        first_buy_price_usd,
+        first_buy_sell_duration,
+        total_swaps_from_txs_with_mt_3_swappers,
+        total_swaps_from_arbitrage_swap_events,
+    ) = (
+        zip(*rows) if rows else [()] * len(WALLET_TOKEN_FIELDS)
+    )
+
+    total_buys_count = np.array(total_buys_count, dtype=np.int64)
+    total_buy_amount_usd = np.array(total_buy_amount_usd, dtype=object)
+    first_buy_price_usd = np.array(first_buy_price_usd, dtype=object)
+    has_first_buy_price = np.array([bool(price) for price in first_buy_price_usd], dtype=bool)
+    total_profit_usd = np.array([profit if profit else 0 for profit in total_profit_usd], dtype=object)
+    columns = {
+        "wallet_code": wallet_codes,
+        "first_buy_timestamp": np.array(
+            [(ts - EPOCH) // ONE_MICROSECOND if ts else NO_TIMESTAMP for ts in first_buy_timestamp], dtype=np.int64
+        ),
+        "first_sell_timestamp": np.array(
+            [(ts - EPOCH) // ONE_MICROSECOND if ts else NO_TIMESTAMP for ts in first_sell_timestamp], dtype=np.int64
+        ),
+        "total_buys_count": total_buys_count,
+        "total_sales_count": np.array(total_sales_count, dtype=np.int64),
+        "total_buy_amount_usd": total_buy_amount_usd,
+        "total_buy_amount_usd_key": total_buy_amount_usd.astype(np.float64),
+        "total_sell_amount_usd": np.array(total_sell_amount_usd, dtype=object),
+        "total_profit_usd": total_profit_usd,
+        "first_buy_price_usd": first_buy_price_usd,
+        "first_buy_price_usd_key": np.where(has_first_buy_price, first_buy_price_usd, 0).astype(np.float64),
+        "has_first_buy_price": has_first_buy_price,
+        "first_buy_sell_duration": np.array(
+            [duration if duration is not None else -1 for duration in first_buy_sell_duration], dtype=np.int64
+        ),
+        "has_first_buy_sell_duration": np.array(
+            [duration is not None for duration in first_buy_sell_duration], dtype=bool
+        ),
+        "total_profit_percent": np.array(
+            [percent if percent is not None else np.nan for percent in total_profit_percent], dtype=np.float64
+        ),
+        "sell_amount_gt_buy_amount": np.array(
+            [sell > buy for sell, buy in zip(total_sell_amount_token, total_buy_amount_token)], dtype=bool
+        ),
+        "is_profitable": (total_buys_count > 0) & (total_profit_usd >= 0).astype(bool),
+        "total_swaps_from_txs_with_mt_3_swappers": np.array(total_swaps_from_txs_with_mt_3_swappers, dtype=np.int64),
+        "total_swaps_from_arbitrage_swap_events": np.array(total_swaps_from_arbitrage_swap_events, dtype=np.int64),
+    }
+    order = np.argsort(wallet_codes, kind="stable")
+    return {name: values[order] for name, values in columns.items()}
+
+
+def filter_period_mask(columns: dict[str, np.ndarray], period: int, current_datetime: datetime) -> np.ndarray:
+    """Колоночный аналог calculations.filter_period_tokens"""
+    fb = columns["first_buy_timestamp"]
+    fs = columns["first_sell_timestamp"]
+    if period == 0:
+        return np.ones(len(fb), dtype=bool)
+    threshold = _to_microseconds(current_datetime - timedelta(days=int(period)))
+    has_fb, has_fs = fb != NO_TIMESTAMP, fs != NO_TIMESTAMP
+    return (has_fb & (fb >= threshold) & (~has_fs | (fs >= threshold))) | (has_fs & (fs >= threshold))
+
+
+def calculate_next_period_expiry(
+    columns: dict[str, np.ndarray],
+    n_wallets: int,
+    current_datetime: datetime,
+) -> list[datetime | None]:
+    """Колоночный аналог calculations.calculate_next_period_expiry"""
+    fs = columns["first_sell_timestamp"]
+    timestamps = np.where(fs != NO_TIMESTAMP, fs, columns["first_buy_timestamp"])
+    has_timestamp = timestamps != NO_TIMESTAMP
+    now = _to_microseconds(current_datetime)
+    codes = columns["wallet_code"]
+    result = np.full(n_wallets, NO_EXPIRY, dtype=np.int64)
+    # Для 7д срок раньше, чем для 30д, поэтому 30д учитываем только у токенов, уже вышедших из 7д
+    pending = has_timestamp
+    for days in (7, 30):
+        expiry = timestamps + timedelta(days=days, microseconds=1) // ONE_MICROSECOND
+        mask = pending & (expiry > now)
+        np.minimum.at(result, codes[mask], expiry[mask])
+        pending = pending & ~mask
+    return [None if value == NO_EXPIRY else EPOCH + timedelta(microseconds=int(value)) for value in result]
+
+
+def _grouped_count(mask: np.ndarray, codes: np.ndarray, n_groups: int) -> np.ndarray:
+    return np.bincount(codes[mask], minlength=n_groups)
+
+
+def _grouped_int_sum(values: np.ndarray, codes: np.ndarray, n_groups: int) -> np.ndarray:
+    result = np.zeros(n_groups, dtype=np.int64)
+    np.add.at(result, codes, values)
+    return result
+
+
+def _grouped_decimal_sum(values: np.ndarray, codes: np.ndarray, n_groups: int) -> list:
+    """
+    Сумма Decimal по группам (codes отсортированы). Как и sum() с нуля: первое слагаемое приводится к
+    точности контекста, дальше сложение в исходном порядке. Для пустой группы - 0
+    """
+    result = [0] * n_groups
+    if not len(values):
+        return result
+    uniques, starts = np.unique(codes, return_index=True)
+    sums = np.add.reduceat(np.positive(values), starts)
+    for code, value in zip(uniques.tolist(), sums.tolist()):
+        result[code] = value
+    return result
+
+
+def _grouped_median(values: np.ndarray, keys: np.ndarray, codes: np.ndarray, n_groups: int) -> list:
+    """
+    Медиана по группам, как statistics.median. Для пустой группы - None.
+    Значения сортируются по float64-ключу, значения с одинаковым ключом в середине группы досортировываются точно
+    (Decimal, неразличимые во float64)
+    """
+    result = [None] * n_groups
+    if not len(values):
+        return result
+    order = np.lexsort((keys, codes))
+    sorted_keys, sorted_values = keys[order], values[order].astype(object)  # Python int/Decimal, как в statistics
+    counts = np.bincount(codes, minlength=n_groups)
+    groups = np.flatnonzero(counts)
+    starts = (np.cumsum(counts) - counts)[groups]
+    ends = starts + counts[groups]
+    middles = starts + counts[groups] // 2
+    is_even = counts[groups] % 2 == 0
+
+    if values.dtype == object:
+        # Есть ли соседи с тем же ключом у средних элементов внутри группы
+        positions = np.concatenate([middles, (middles - 1)[is_even]])
+        group_idx = np.concatenate([np.arange(len(groups)), np.flatnonzero(is_even)])
+        prev_tie = (positions > starts[group_idx]) & (sorted_keys[positions - 1] == sorted_keys[positions])
+        next_positions = np.minimum(positions + 1, len(sorted_keys) - 1)
+        next_tie = (positions + 1 < ends[group_idx]) & (sorted_keys[next_positions] == sorted_keys[positions])
+        for k in np.flatnonzero(prev_tie | next_tie).tolist():
+            g = group_idx[k]
+            _sort_ties(sorted_keys, sorted_values, int(starts[g]), int(ends[g]), int(positions[k]))
+
+    medians = sorted_values[middles]
+    medians[is_even] = (sorted_values[middles[is_even] - 1] + sorted_values[middles[is_even]]) / 2
+    for code, value in zip(groups.tolist(), medians.tolist()):
+        result[code] = value
+    return result
+
+
+def _sort_ties(sorted_keys: np.ndarray, sorted_values: np.ndarray, start: int, end: int, position: int) -> None:
+    """Точно сортирует значения группы [start, end) с тем же float64-ключом, что и на позиции position"""
+    group_keys = sorted_keys[start:end]
+    key = sorted_keys[position]
+    lo = start + int(np.searchsorted(group_keys, key, side="left"))
+    hi = start + int(np.searchsorted(group_keys, key, side="right"))
+    sorted_values[lo:hi] = sorted(sorted_values[lo:hi])
+
+
+def calculate_period_stats(
+    columns: dict[str, np.ndarray],
+    n_wallets: int,
+    period: int,
+    current_datetime: datetime,
+) -> list[dict]:
+    """Колоночный аналог calculations.recalculate_wallet_period_stats для всех кошельков сразу"""
+    period_mask = filter_period_mask(columns, period, current_datetime)
+    rows = np.flatnonzero(period_mask)
+    codes = columns["wallet_code"][rows]
+    col = {name: values[rows] for name, values in columns.items()}
+
+    has_buy = col["total_buys_count"] > 0
+    has_sell = col["total_sales_count"] > 0
+    profit_percent = col["total_profit_percent"]
+    has_profit_percent = has_buy & ~np.isnan(profit_percent)
+    has_first_buy_price = has_buy & col["has_first_buy_price"]
+    has_duration = col["has_first_buy_sell_duration"]
+
+    total_token = np.bincount(codes, minlength=n_wallets)
+    total_token_buys = _grouped_int_sum(col["total_buys_count"], codes, n_wallets)
+    total_token_sales = _grouped_int_sum(col["total_sales_count"], codes, n_wallets)
+    total_mt_3 = _grouped_int_sum(col["total_swaps_from_txs_with_mt_3_swappers"], codes, n_wallets)
+    total_arbitrage = _grouped_int_sum(col["total_swaps_from_arbitrage_swap_events"], codes, n_wallets)
+    token_with_buy = _grouped_count(has_buy, codes, n_wallets)
+    token_with_buy_and_sell = _grouped_count(has_buy & has_sell, codes, n_wallets)
+    token_buy_without_sell = _grouped_count(has_buy & ~has_sell, codes, n_wallets)
+    token_sell_without_buy = _grouped_count(has_sell & ~has_buy, codes, n_wallets)
+    token_with_sell_amount_gt_buy_amount = _grouped_count(has_buy & col["sell_amount_gt_buy_amount"], codes, n_wallets)
+    profitable_tokens_count = _grouped_count(col["is_profitable"], codes, n_wallets)
+    pnl_gt_5x_num = _grouped_count(has_profit_percent & (profit_percent > 500), codes, n_wallets)
+    pnl_2x_5x_num = _grouped_count(
+        has_profit_percent & (profit_percent <= 500) & (profit_percent > 200), codes, n_wallets
+    )
+    pnl_lt_2x_num = _grouped_count(
+        has_profit_percent & (profit_percent <= 200) & (profit_percent > 0), codes, n_wallets
+    )
+    pnl_minus_dot5_0x_num = _grouped_count(
+        has_profit_percent & (profit_percent <= 0) & (profit_percent > -50), codes, n_wallets
+    )
+    pnl_lt_minus_dot5_num = _grouped_count(has_profit_percent & (profit_percent <= -50), codes, n_wallets)
+    duration_sum = _grouped_int_sum(col["first_buy_sell_duration"][has_duration], codes[has_duration], n_wallets)
+
+    total_buy_usd = _grouped_decimal_sum(col["total_buy_amount_usd"], codes, n_wallets)
+    total_sell_usd = _grouped_decimal_sum(col["total_sell_amount_usd"], codes, n_wallets)
+    total_profit_usd = _grouped_decimal_sum(col["total_profit_usd"], codes, n_wallets)
+    first_buy_price_sum = _grouped_decimal_sum(
+        col["first_buy_price_usd"][has_first_buy_price], codes[has_first_buy_price], n_wallets
+    )
+    first_buy_price_median = _grouped_median(
+        col["first_buy_price_usd"][has_first_buy_price],
+        col["first_buy_price_usd_key"][has_first_buy_price],
+        codes[has_first_buy_price],
+        n_wallets,
+    )
+    buy_amount_median = _grouped_median(
+        col["total_buy_amount_usd"][has_buy], col["total_buy_amount_usd_key"][has_buy], codes[has_buy], n_wallets
+    )
+    durations = col["first_buy_sell_duration"][has_duration]
+    duration_median = _grouped_median(durations, durations, codes[has_duration], n_wallets)
+
+    result = []
+    for i in range(n_wallets):
+        with_buy = int(token_with_buy[i])
+        with_buy_and_sell = int(token_with_buy_and_sell[i])
+        values = {
+            "total_token": int(total_token[i]),
+            "total_token_buys": int(total_token_buys[i]),
+            "total_token_sales": int(total_token_sales[i]),
+            "total_token_buy_amount_usd": total_buy_usd[i],
+            "total_token_sell_amount_usd": total_sell_usd[i],
+            "total_profit_usd": total_profit_usd[i],
+            "pnl_lt_minus_dot5_num": int(pnl_lt_minus_dot5_num[i]),
+            "pnl_minus_dot5_0x_num": int(pnl_minus_dot5_0x_num[i]),
+            "pnl_lt_2x_num": int(pnl_lt_2x_num[i]),
+            "pnl_2x_5x_num": int(pnl_2x_5x_num[i]),
+            "pnl_gt_5x_num": int(pnl_gt_5x_num[i]),
+            "token_with_buy": with_buy,
+            "token_with_buy_and_sell": with_buy_and_sell,
+            "token_buy_without_sell": int(token_buy_without_sell[i]),
+            "token_sell_without_buy": int(token_sell_without_buy[i]),
+            "token_with_sell_amount_gt_buy_amount": int(token_with_sell_amount_gt_buy_amount[i]),
+            "total_swaps_from_txs_with_mt_3_swappers": int(total_mt_3[i]),
+            "total_swaps_from_arbitrage_swap_events": int(total_arbitrage[i]),
+            "total_profit_multiplier": (
+                total_profit_usd[i] / total_buy_usd[i] * 100 if total_buy_usd[i] else None
+            ),  # Только для токенов у которых была покупка!
+            "token_avg_buy_amount": total_buy_usd[i] / with_buy if with_buy else None,
+            "token_first_buy_avg_price_usd": first_buy_price_sum[i] / with_buy if with_buy else None,
+            "token_first_buy_median_price_usd": first_buy_price_median[i],
+            "token_avg_profit_usd": total_profit_usd[i] / with_buy if with_buy else None,
+            "winrate": int(profitable_tokens_count[i]) / with_buy * 100 if with_buy else None,
+            "token_buy_sell_duration_avg": int(duration_sum[i]) / with_buy_and_sell if with_buy_and_sell else None,
+            "token_buy_sell_duration_median": duration_median[i],
+            "token_median_buy_amount": buy_amount_median[i],
+        }
+        if with_buy:
+            values["pnl_lt_minus_dot5_percent"] = values["pnl_lt_minus_dot5_num"] / with_buy * 100
+            values["pnl_minus_dot5_0x_percent"] = values["pnl_minus_dot5_0x_num"] / with_buy * 100
+            values["pnl_lt_2x_percent"] = values["pnl_lt_2x_num"] / with_buy * 100
+            values["pnl_2x_5x_percent"] = values["pnl_2x_5x_num"] / with_buy * 100
+            values["pnl_gt_5x_percent"] = values["pnl_gt_5x_num"] / with_buy * 100
+        result.append(values)
+    return result
@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from uuid import UUID
+
+import pytz
+from redis.asyncio import Redis
+
+from src.domain.entities.swap import SwapEventType
+from src.domain.entities.wallet import WalletRelation, WalletRelationsDirtyBlocks
+from src.infra.db.sqlalchemy.repositories import (
+    SQLAlchemySwapRepository,
+    SQLAlchemyWalletRelationRepository,
+    SQLAlchemyWalletRelationsDirtyBlocksRepository,
+    SQLAlchemyWalletRepository,
+)
+from src.infra.db.sqlalchemy.setup import AsyncSessionMaker
+from src.infra.redis.cache_service import RedisCacheService
+from src.infra.redis.related_wallets_cache import invalidate_related_wallets_cache
+from src.settings import config
+
+logger = logging.getLogger(__name__)
+
+BLOCKS_BEFORE = 3  # Сколько блоков до первой сделки кошелька считаются соседними
+BLOCKS_AFTER = 3  # Сколько блоков после первой сделки кошелька считаются соседними
+MAX_WALLET_TOKENS = 1000  # Сколько последних активных токенов кошелька учитывается
+MIN_INTERSECTED_TOKENS = 3  # Мин. кол-во общих токенов для связи кошельков
+
+
+async def update_wallet_relations() -> None:
+    """
+    Инкрементальный пересчет wallet_relation по диапазонам блоков из очереди wallet_relations_dirty_blocks
+    (диапазоны загруженных и удаленных свапов пишутся туда в одной транзакции со свапами, поэтому учитываются
+    и свапы ниже уже пересчитанных блоков).
+    Связи кошелька зависят только от его первых сделок и сделок других кошельков рядом с ними, поэтому
+    пересчитываются только кошельки, у которых первая покупка/продажа токена попала в диапазон
+    (расширенный на BLOCKS_BEFORE/BLOCKS_AFTER), и кошельки со свапами в диапазоне, у которых больше
+    MAX_WALLET_TOKENS токенов. Требует заполненных wallet_token.first_*_block_id.
+    Диапазон обрабатывается шагами, после каждого шага в очереди сохраняется еще не пересчитанная часть
+    """
+    async with AsyncSessionMaker() as session:
+        repository = SQLAlchemyWalletRelationsDirtyBlocksRepository(session)
+        dirty_blocks = await repository.get_all_ordered()
+        # Пересекающиеся и смежные диапазоны разных загрузок пересчитываются один раз
+        dirty_blocks = await repository.replace(dirty_blocks, merge_blocks_ranges(dirty_blocks))
+        await session.commit()
+    if not dirty_blocks:
+        logger.info("Новых свапов для пересчета связей кошельков нет")
+        return
+
+    blocks_chunk_size = config.wallet_statistic_updater.relations_blocks_chunk_size
+    invalidate_api_cache = config.wallet_statistic_updater.relations_invalidate_api_cache
+    # Клиент Redis живет, пока идет пересчет (подключается только при сбросе кеша)
+    async with Redis.from_url(config.redis.url, decode_responses=True) as redis:
+        cache_service = RedisCacheService(redis, local_max_size=0) if invalidate_api_cache else None
+        for blocks in dirty_blocks:
+            while blocks.from_block_id < blocks.until_block_id:
+                until_block_id = min(blocks.from_block_id + blocks_chunk_size, blocks.until_block_id)
+                await update_wallet_relations_for_blocks(blocks.from_block_id, until_block_id, cache_service)
+                blocks.from_block_id = until_block_id
+                async with AsyncSessionMaker() as session:
+                    repository = SQLAlchemyWalletRelationsDirtyBlocksRepository(session)
+                    if blocks.from_block_id < blocks.until_block_id:
+                        await repository.save_progress(blocks)
+                    else:
+                        await repository.delete_by_ids([blocks.id])
+                    await session.commit()
+
+
+def merge_blocks_ranges(dirty_blocks: list[WalletRelationsDirtyBlocks]) -> list[tuple[int, int]]:
+    """Объединяет пересекающиеся и смежные диапазоны (from_block_id, until_block_id], отсортированные по началу"""
+    ranges = []
+    for blocks in dirty_blocks:
+        if ranges and blocks.from_block_id <= ranges[-1][1]:
+            ranges[-1] = (ranges[-1][0], max(ranges[-1][1], blocks.until_block_id))
+        else:
+            ranges.append((blocks.from_block_id, blocks.until_block_id))
+    return ranges
+
+
+async def update_wallet_relations_for_blocks(
+    from_block_id: int,
+    until_block_id: int,
+    cache_service: RedisCacheService | None = None,
+) -> None:
+    """Пересчет связей кошельков, затронутых свапами блоков (from_block_id, until_block_id]"""
+    start = time.perf_counter()
+    async with AsyncSessionMaker() as session:
+        wallet_ids = await SQLAlchemyWalletRelationRepository(session).get_wallets_with_first_trades_in_blocks(
+            from_block_id - BLOCKS_AFTER,
+            until_block_id + BLOCKS_BEFORE,
+            max_tokens=MAX_WALLET_TOKENS,
+        )
+    logger.info(f"Блоки ({from_block_id}, {until_block_id}]: кошельков для пересчета связей: {len(wallet_ids)}")
+
+    batch_size = config.wallet_statistic_updater.relations_wallets_batch_size
+    relations_count = 0
+    for i in range(0, len(wallet_ids), batch_size):
+        relations_count += await update_wallets_relations(wallet_ids[i : i + batch_size], cache_service)
+        logger.debug(f"Пересчитаны связи {min(i + batch_size, len(wallet_ids))}/{len(wallet_ids)} кошельков")
+
+    logger.info(
+        f"Блоки ({from_block_id}, {until_block_id}]: пересчитаны связи {len(wallet_ids)} кошельков "
+        f"| Связей: {relations_count} | Время: {time.perf_counter() - start:.2f}с"
+    )
+
+
+async def update_wallets_relations(wallet_ids: list[UUID], cache_service: RedisCacheService | None = None) -> int:
+    """
+    Пересчитывает и заменяет связи кошельков одной транзакцией, возвращает кол-во связей.
+    cache_service - кеш API, в котором после замены сбрасываются связанные кошельки этих кошельков
+    """
+    async with AsyncSessionMaker() as session:
+        neighbors = await SQLAlchemySwapRepository(session).get_first_trades_neighbors(
+            wallet_ids,
+            blocks_before=BLOCKS_BEFORE,
+            blocks_after=BLOCKS_AFTER,
+            max_tokens=MAX_WALLET_TOKENS,
+        )
+        relations = build_wallet_relations(neighbors, datetime.now(pytz.UTC))
+        await SQLAlchemyWalletRelationRepository(session).replace_wallets_relations(wallet_ids, relations)
+        if cache_service:
+            addresses = await SQLAlchemyWalletRepository(session).get_addresses_by_ids(wallet_ids)
+        await session.commit()
+    if cache_service:
+        await invalidate_related_wallets_cache(cache_service, addresses)
+    return len(relations)
+
+
+def build_wallet_relations(neighbors: list[dict], updated_at: datetime) -> list[WalletRelation]:
+    """Связи кошельков по соседним сделкам: кол-во общих токенов по статусам и время последней общей сделки"""
+    neighbors_by_wallet = defaultdict(list)
+    for neighbor in neighbors:
+        neighbors_by_wallet[neighbor["wallet_id"]].append(neighbor)
+
+    relations = []
+    for wallet_id, wallet_neighbors in neighbors_by_wallet.items():
+        for related_wallet_id, tokens in build_related_wallets_map(wallet_neighbors).items():
+            if len(tokens) < MIN_INTERSECTED_TOKENS:
+                continue
+            status_counts = Counter(token["status"] for token in tokens.values())
+            sell_timestamps = [token["sell_timestamp"] for token in tokens.values() if token["sell_timestamp"]]
+            relations.append(
+                WalletRelation(
+                    wallet_id=wallet_id,
+                    related_wallet_id=related_wallet_id,
+                    before_count=status_counts["before"],
+                    after_count=status_counts["after"],
+                    same_count=status_counts["same"],
+                    mixed_count=status_counts["mixed"],
+                    last_intersected_tokens_trade_timestamp=max(sell_timestamps, default=None),
+                    updated_at=updated_at,
+                )
+            )
+    return relations
+
+
+def build_related_wallets_map(neighbors: list[dict]) -> dict:
+    """
+    Статусы сделок соседних кошельков по токенам относительно первых покупки и продажи кошелька.
+    Учитываются только кошельки, у которых по токену есть и соседняя покупка, и соседняя продажа
+    """
+    # Маппинг по кошелькам и токенам, с первыми покупками\продажами
+    trades_map = defaultdict(lambda: {SwapEventType.BUY: None, SwapEventType.SELL: None})
+    for neighbor in neighbors:
+        trades_map[(neighbor["related_wallet_id"], neighbor["token_id"])][neighbor["event_type"]] = neighbor
+
+    related_wallets_map = defaultdict(dict)
+    for (wallet_id, token_id), trades in trades_map.items():
+        if not ((fb := trades[SwapEventType.BUY]) and (fs := trades[SwapEventType.SELL])):
+            continue
+
+        buy_status = compare_transaction_blocks(fb["block_id"], fb["anchor_block_id"])
+        sell_status = compare_transaction_blocks(fs["block_id"], fs["anchor_block_id"])
+
+        status = classify_token_trade_status(buy_status, sell_status)
+
+        related_wallets_map[wallet_id][token_id] = {
+            "buy_status": buy_status,
+            "sell_status": sell_status,
+            "status": status,
+            "sell_timestamp": fs["timestamp"],
+        }
+    return related_wallets_map
+
+
+def compare_transaction_blocks(event_block: int, reference_block: int) -> str:
+    """Определяем порядок транзакций"""
+    if event_block < reference_block:
+        return "before"
+    elif event_block > reference_block:
+        return "after"
+    return "same"
+
+
+def classify_token_trade_status(buy_status: str, sell_status: str):
+    """Определяем статус позиции кошелька в трейде конкретного токена"""
+    if (buy_status, sell_status) in [
+        ("after", "after"),
+        ("same", "after"),
+        ("after", "same"),
+    ]:
+        status = "after"
+    elif (buy_status, sell_status) in [
+        ("same", "before"),
+        ("before", "before"),
+        ("before", "same"),
+    ]:
+        status = "before"
+    elif (buy_status, sell_status) == (
+        "same",
+        "same",
+    ):
+        status = "same"
+    else:
+        # Остаются случаи
+        # ("before", "after"),
+        # ("after", "before"),
+        status = "mixed"
+
+    return status
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    asyncio.run(update_wallet_relations())
@@ -1,12 +1,14 @@
 import asyncio
 import logging
-from collections import defaultdict
+from collections import Counter, defaultdict
 from datetime import datetime
 
 import pytz
-import requests
+from redis.asyncio import Redis
 from sqlalchemy import select
 
+from src.application.common.exceptions import WalletNotFoundException
+from src.application.handlers.wallet.queries.get_wallet_related_wallets import GetWalletRelatedWalletsHandler
 from src.domain.entities import (
     Wallet,
     WalletCopyable,
@@ -23,55 +25,109 @@ from src.infra.db.sqlalchemy.repositories import (
 )
 from src.infra.db.sqlalchemy.repositories.wallet import SQLAlchemyWalletCopyableRepository
 from src.infra.db.sqlalchemy.setup import AsyncSessionMaker
+from src.infra.redis.copyable_wallets_progress import RedisCopyableWalletsProgress
+from src.settings import config
 
 from .calculations import filter_period_tokens, recalculate_wallet_period_stats
+from .wallet_relations_updater import update_wallet_relations
 
 logger = logging.getLogger(__name__)
 
 
 async def update_wallet_statistics_copyable_async():
-    wallets = await get_wallets_for_update()
+    await update_wallet_relations()
+    async with Redis.from_url(config.redis.url, decode_responses=True) as redis:
+        progress = RedisCopyableWalletsProgress(
+            redis, ttl_seconds=config.wallet_statistic_updater.copyable_progress_ttl_seconds
+        )
+        wallets = await get_wallets_for_update(progress)
+        if wallets is None:
+            # Набор копировщиков неполный - copyable не перезаписываем, прогресс сохраняется для следующего запуска
+            return
 
-    if wallets:
-        await process_wallets(wallets)
-    else:
-        await delete_old_copyable_wallets()
+        if wallets:
+            await process_wallets(wallets)
+        else:
+            await delete_old_copyable_wallets()
+        # Запуск завершен - следующий начнет поиск копировщиков заново
+        await progress.clear()
 
 
-async def get_wallets_for_update():
+async def get_wallets_for_update(progress: RedisCopyableWalletsProgress) -> list[Wallet] | None:
+    """Копирующие кошельки кандидатов, None - если не все кандидаты обработаны"""
     logger.debug(f"Начинаем получение кошельков из БД")
     t1 = datetime.now()
     from src.infra.db.sqlalchemy.models import Wallet as WalletModel
 
     async with AsyncSessionMaker() as session:
         _wallets = await SQLAlchemyWalletRepository(session).get_wallets_for_copytraders_statistic()
-        logger.info(f"Всего кошельков к обработке: {len(_wallets)}")
-        unique_addresses = set()
-        for i, wallet in enumerate(_wallets):
-            res = requests.get(f"http://api:8000/api/v1/wallets/{wallet.address}/related_wallets")
-            try:
-                data = res.json()
-            except Exception as e:
-                logger.error(res.text)
-                raise e
-            logger.debug(data)
-            if data["status"] == "error":
-                continue
-            copying_wallets = data["result"]["copying_wallets"]
-            for w in copying_wallets:
-                if w["address"] not in unique_addresses:
-                    unique_addresses.add(w["address"])
-            logger.info(f"Обработано {i} кошельков")
-        logger.info(unique_addresses)
+    logger.info(f"Всего кошельков к обработке: {len(_wallets)}")
+    unique_addresses = await collect_copying_wallets_addresses([wallet.address for wallet in _wallets], progress)
+    if unique_addresses is None:
+        return None
+
+    async with AsyncSessionMaker() as session:
         connection = await session.connection()
         result = await connection.execute(select(WalletModel).where(WalletModel.address.in_(unique_addresses)))
-
         wallets = [Wallet(**row) for row in result.mappings().all()]
     t2 = datetime.now()
     logger.info(f"Получили {len(wallets)} кошельков из БД | Время: {t2-t1}")
     return wallets
 
 
+async def collect_copying_wallets_addresses(
+    addresses: list[str], progress: RedisCopyableWalletsProgress
+) -> set[str] | None:
+    """
+    Параллельный поиск копирующих кошельков кандидатов (не больше copyable_concurrency одновременно).
+    Кандидаты, обработанные прерванным ранее запуском, пропускаются. Кандидат, не уложившийся в таймаут,
+    не отмечается обработанным и будет повторен следующим запуском - тогда возвращается None
+    """
+    processed = await progress.get_processed()
+    pending = [address for address in addresses if address not in processed]
+    logger.info(f"Кандидатов обработано ранее: {len(addresses) - len(pending)} | Осталось: {len(pending)}")
+
+    updater_config = config.wallet_statistic_updater
+    semaphore = asyncio.Semaphore(updater_config.copyable_concurrency)
+    counters = Counter()
+
+    async def process_address(address: str) -> None:
+        async with semaphore:
+            try:
+                async with asyncio.timeout(updater_config.copyable_call_timeout_seconds):
+                    copying_addresses = await get_copying_wallets_addresses(address)
+            except TimeoutError:
+                logger.warning(f"Таймаут поиска копировщиков кошелька {address}")
+                counters["failed"] += 1
+                return
+            await progress.mark_processed(address, copying_addresses)
+            counters["processed"] += 1
+            if counters["processed"] % 100 == 0:
+                logger.info(f"Обработано {counters['processed']}/{len(pending)} кошельков")
+
+    async with asyncio.TaskGroup() as tg:
+        for address in pending:
+            tg.create_task(process_address(address))
+
+    if counters["failed"]:
+        logger.warning(
+            f"Не удалось обработать {counters['failed']} кошельков, будут повторены следующим запуском"
+            f" - copyable не обновляется"
+        )
+        return None
+    return await progress.get_copying()
+
+
+async def get_copying_wallets_addresses(address: str) -> list[str]:
+    """Адреса кошельков, копирующих сделки кошелька (из wallet_relation, тем же обработчиком, что и в API)"""
+    async with AsyncSessionMaker() as session:
+        try:
+            related_wallets = await GetWalletRelatedWalletsHandler(SQLAlchemyWalletRepository(session))(address)
+        except WalletNotFoundException:
+            return []
+    return [w.address for w in related_wallets.copying_wallets]
+
+
 async def process_wallets(wallets):
     """Массовое обновление статистик кошельков на основе их транзакций"""
     start = datetime.now()
@@ -1,48 +1,107 @@
 import asyncio
 import logging
 import random
+import time
 from asyncio import Queue
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 
+import pytz
+from redis.asyncio import Redis
 from sqlalchemy.exc import DBAPIError
 from tortoise.timezone import now
 
-from src.application.processes.wallet_statistic_updaters import calculations
-from src.domain.entities.wallet import Wallet, WalletStatistic7d, WalletStatistic30d, WalletStatisticAll
+from src.application.processes.wallet_statistic_updaters import calculations, columnar_calculations
+from src.application.processes.wallet_statistic_updaters.backpressure import AdaptiveParallelLimit, WalletsQueue
+from src.domain.entities.wallet import (
+    Wallet,
+    WalletStatistic7d,
+    WalletStatistic30d,
+    WalletStatisticAll,
+    WalletStatsDirty,
+)
+from src.infra.db.sqlalchemy.locks import gather_partitions, lock_wallets_partition, partition_by_wallet_address
 from src.infra.db.sqlalchemy.repositories import (
     SQLAlchemyWalletRepository,
     SQLAlchemyWalletStatistic7dRepository,
     SQLAlchemyWalletStatistic30dRepository,
     SQLAlchemyWalletStatisticAllRepository,
+    SQLAlchemyWalletStatsDirtyRepository,
     SQLAlchemyWalletTokenRepository,
 )
-from src.infra.db.sqlalchemy.setup import AsyncSessionMaker, engine
+from src.infra.db.sqlalchemy.setup import AsyncSessionMaker, engine, partition_sessions_semaphore
+from src.infra.redis.wallet_refresh_queue import RedisWalletRefreshQueue
+from src.settings import config
 
 logger = logging.getLogger(__name__)
 
 
+def use_columnar_calculations() -> bool:
+    """Пересчет батчами по колонкам токенов (в текущем процессе или в пуле процессов)"""
+    return config.wallet_statistic_updater.vectorized or config.wallet_statistic_updater.calculate_workers > 1
+
+
 async def receive_wallets_from_db(
     received_wallets_queue: Queue,
     count: int,
 ):
-    """Загрузка данных из БД и помещение в очередь"""
+    """
+    Загрузка кошельков из БД порциями (keyset, каждая порция - своей короткой транзакцией) и помещение в очередь.
+    Очередь ограничена, поэтому порции читаются в темпе обработки, а не всей выборкой сразу.
+    Между порциями транзакция не держится - снимок БД не мешает autovacuum чистить строки, которые пишет пересчет
+    """
     logger.info(f"Начинаем получение кошельков из БД")
     t1 = datetime.now()
-    async with AsyncSessionMaker() as session:
-        wallets: list[Wallet] = await SQLAlchemyWalletRepository(session).get_wallets_for_update_stats(count=count)
+    checked_before = datetime.now(pytz.UTC)
+    wallets_count = 0
+    after = None
+    while wallets_count < count:
+        async with AsyncSessionMaker() as session:
+            wallets, after = await SQLAlchemyWalletRepository(session).get_wallets_for_update_stats_page(
+                count=min(config.wallet_statistic_updater.receive_chunk_size, count - wallets_count),
+                checked_before=checked_before,
+                after=after,
+                expired_periods_only=config.wallet_statistic_updater.event_driven_schedule,
+            )
+        if not wallets:
+            break
+        for wallet in wallets:
+            await received_wallets_queue.put(wallet)
+        wallets_count += len(wallets)
     t2 = datetime.now()
-    logger.info(f"Получили {len(wallets)} кошельков из БД | Время: {t2 - t1}")
-    for wallet in wallets:
+    logger.info(f"Получили {wallets_count} кошельков из БД | Время: {t2 - t1}")
+    await received_wallets_queue.put(None)
+    return wallets_count
+
+
+async def receive_dirty_wallets_from_db(
+    received_wallets_queue: Queue,
+    count: int,
+) -> list[WalletStatsDirty]:
+    """Загрузка кошельков из очереди на пересчет (с новыми свапами) и помещение в очередь обработки"""
+    async with AsyncSessionMaker() as session:
+        dirty_wallets = await SQLAlchemyWalletStatsDirtyRepository(session).get_oldest(count=count)
+        wallets_map = await SQLAlchemyWalletRepository(session).in_bulk([d.wallet_id for d in dirty_wallets], "id")
+    logger.info(f"Получили {len(wallets_map)} кошельков из очереди на пересчет")
+    for wallet in wallets_map.values():
         await received_wallets_queue.put(wallet)
     await received_wallets_queue.put(None)
+    return dirty_wallets
+
+
+async def delete_processed_dirty_wallets(dirty_wallets: list[WalletStatsDirty]) -> None:
+    async with AsyncSessionMaker() as session:
+        await SQLAlchemyWalletStatsDirtyRepository(session).delete_processed(dirty_wallets)
+        await session.commit()
 
 
 async def fetch_wallets_related_data(
     received_wallets_queue: Queue,
-    fetched_wallets_queue: Queue,
+    fetched_wallets_queue: WalletsQueue,
     batch_size: int,
     max_parallel: int = 1,
+    parallel_limit: AdaptiveParallelLimit | None = None,
 ):
     """
     Асинхронно подгружает токены для кошельков, получаемых из очереди.
@@ -53,10 +112,13 @@ async def fetch_wallets_related_data(
 
     Параметры:
         received_wallets_queue (Queue): Очередь, из которой извлекаются объекты кошельков для обработки.
-        fetched_wallets_queue (Queue): Очередь, в которую помещаются кошельки с подгруженными токенами.
+        fetched_wallets_queue (WalletsQueue): Очередь, в которую помещаются кошельки с подгруженными токенами.
         batch_size (int): Количество кошельков в батче для запуска параллельной обработки.
         max_parallel (int, optional): Максимальное количество параллельных задач. По умолчанию 1.
+        parallel_limit (AdaptiveParallelLimit, optional): Лимит параллельных задач, подстраивающийся под
+            задержку БД. Если не передан - используется постоянный max_parallel.
     """
+    parallel_limit = parallel_limit or AdaptiveParallelLimit("fetch", max_parallel, adaptive=False)
     batch = []
     tasks = []  # Список активных задач обработки батчей
     while True:
@@ -71,16 +133,19 @@ async def fetch_wallets_related_data(
                     fetch_related_data_and_put_in_queue(
                         batch.copy(),
                         fetched_wallets_queue,
+                        parallel_limit,
                     )
                 )
             )
             batch.clear()
-            # Если достигли лимита параллельных задач, ждём, пока хотя бы одна завершится
-            if len(tasks) >= max_parallel:
+            # Если достигли лимита параллельных задач, ждём, пока завершится достаточно задач
+            while len(tasks) >= parallel_limit.limit:
                 done, pending = await asyncio.wait(
                     tasks,
                     return_when=asyncio.FIRST_COMPLETED,
                 )
+                for task in done:
+                    task.result()  # Пробрасываем ошибку задачи
                 tasks = list(pending)  # Обновляем список, оставляя незавершённые задачи
         if wallet is None:
             # Ждём завершения всех оставшихся задач
@@ -93,10 +158,21 @@ async def fetch_wallets_related_data(
 
 async def fetch_related_data_and_put_in_queue(
     wallets: list[Wallet],
-    fetched_wallets_queue: Queue,
+    fetched_wallets_queue: WalletsQueue,
+    parallel_limit: AdaptiveParallelLimit,
 ):
+    # Задержка учитывается только по запросу к БД, без ожидания места в очереди
+    start = time.monotonic()
+    if use_columnar_calculations():
+        # Токены загружаются сразу колонками, в очередь уходит весь батч
+        columns = await _fetch_related_data_columns(wallets)
+        parallel_limit.observe(time.monotonic() - start)
+        await fetched_wallets_queue.put((wallets, columns))
+        return
+
     # Загружаем токены для кошельков
     await _fetch_related_data(wallets)
+    parallel_limit.observe(time.monotonic() - start)
 
     for wallet in wallets:
         await fetched_wallets_queue.put(wallet)
@@ -126,9 +202,78 @@ async def _fetch_related_data(
         wallet.tokens = [wt for wt in wallet_tokens_map[wallet.id]]
 
 
+async def _fetch_related_data_columns(
+    wallets: list[Wallet],
+) -> dict:
+    async with AsyncSessionMaker() as session:
+        rows = await SQLAlchemyWalletTokenRepository(session).get_wallet_tokens_rows_by_wallets_list(
+            [wallet.id for wallet in wallets],
+            fields=list(columnar_calculations.WALLET_TOKEN_FIELDS),
+        )
+
+    for wallet in wallets:
+        wallet.stats_7d = WalletStatistic7d(wallet_id=wallet.id)
+        wallet.stats_30d = WalletStatistic30d(wallet_id=wallet.id)
+        wallet.stats_all = WalletStatisticAll(wallet_id=wallet.id)
+    return columnar_calculations.wallet_token_rows_to_columns(wallets, rows)
+
+
+async def calculate_wallets_batches(
+    received_batches_queue: WalletsQueue,
+    calculated_wallets_queue: WalletsQueue,
+    executor: ProcessPoolExecutor | None = None,
+):
+    """
+    Колоночный пересчет батчей (кошельки, колонки токенов) и передача кошельков в следующую очередь.
+    Если передан executor - батчи считаются в пуле процессов (колонки передаются упакованными), в обработке
+    держится до 2 батчей на процесс, результаты передаются дальше в порядке поступления батчей
+    """
+    loop = asyncio.get_running_loop()
+    max_pending = config.wallet_statistic_updater.calculate_workers * 2
+    pending = deque()  # (кошельки, future с результатом пересчета)
+    tokens_count = 0
+    while True:
+        batch: tuple[list[Wallet], dict] | None = await received_batches_queue.get()
+        if batch is None:
+            while pending:
+                await _put_calculated_batch(*pending.popleft(), calculated_wallets_queue)
+            await calculated_wallets_queue.put(None)
+            logger.debug(f"Задача пересчета завершена")
+            return tokens_count
+
+        wallets, columns = batch
+        tokens_count += len(columns["wallet_code"])
+        if executor is None:
+            columnar_calculations.calculate_wallets_stats_vectorized(wallets, columns)
+            for wallet in wallets:
+                await calculated_wallets_queue.put(wallet)
+            continue
+
+        future = loop.run_in_executor(
+            executor,
+            columnar_calculations.calculate_packed_columns_stats,
+            columnar_calculations.pack_columns(columns),
+            len(wallets),
+            datetime.now().astimezone(tz=pytz.UTC),
+        )
+        pending.append((wallets, future))
+        if len(pending) >= max_pending:
+            await _put_calculated_batch(*pending.popleft(), calculated_wallets_queue)
+
+
+async def _put_calculated_batch(
+    wallets: list[Wallet],
+    future: asyncio.Future,
+    calculated_wallets_queue: WalletsQueue,
+):
+    columnar_calculations.apply_wallets_stats(wallets, await future)
+    for wallet in wallets:
+        await calculated_wallets_queue.put(wallet)
+
+
 async def calculate_wallets(
-    received_wallets_queue: Queue,
-    calculated_wallets_queue: Queue,
+    received_wallets_queue: WalletsQueue,
+    calculated_wallets_queue: WalletsQueue,
 ):
     """Обработка данных и передача в следующую очередь"""
     spent_time = timedelta(minutes=0)
@@ -140,6 +285,7 @@ async def calculate_wallets(
             # await asyncio.sleep(0)
             result = calculations.calculate_wallet_stats(wallet)
             tokens_count += len(wallet.tokens)
+            wallet.tokens = []  # Токены больше не нужны, не держим их в очереди на обновление
 
             await calculated_wallets_queue.put(wallet)
         else:
@@ -149,11 +295,13 @@ async def calculate_wallets(
 
 
 async def update_wallets(
-    calculated_wallets_queue: Queue,
+    calculated_wallets_queue: WalletsQueue,
     batch_size: int,
     max_parallel: int = 1,
+    parallel_limit: AdaptiveParallelLimit | None = None,
 ) -> None:
     """Обновление обработанных данных в БД"""
+    parallel_limit = parallel_limit or AdaptiveParallelLimit("update", max_parallel, adaptive=False)
     batch = []
     tasks = []  # Список активных задач обработки батчей
     while True:
@@ -169,12 +317,12 @@ async def update_wallets(
         # Если набрали батч нужного размера или пришёл сигнал завершения (wallet is None)
         if (len(batch) >= batch_size) or (wallet is None and batch):
             # Создаём копию батча для передачи в задачу
-            task = asyncio.create_task(_update_wallets_data(batch.copy()))
+            task = asyncio.create_task(_update_wallets_data(batch.copy(), parallel_limit))
             tasks.append(task)
             batch.clear()
 
-            # Если достигли лимита параллельных задач, ждём, пока хотя бы одна завершится
-            if len(tasks) >= max_parallel:
+            # Если достигли лимита параллельных задач, ждём, пока завершится достаточно задач
+            while len(tasks) >= parallel_limit.limit:
                 done, pending = await asyncio.wait(
                     tasks,
                     return_when=asyncio.FIRST_COMPLETED,
@@ -188,7 +336,7 @@ async def update_wallets(
             return
 
 
-async def _update_wallets_data(wallets):
+async def _update_wallets_data(wallets, parallel_limit: AdaptiveParallelLimit | None = None):
     logger.debug(f"Начинаем обновление кошельков")
     start = now()
 
@@ -197,24 +345,70 @@ async def _update_wallets_data(wallets):
         "wallet_id",
         "created_at",
     ]
+    # Строки статистики перезаписываются, только если изменился отпечаток
+    for wallet in wallets:
+        for stats in (wallet.stats_7d, wallet.stats_30d, wallet.stats_all):
+            stats.stats_fingerprint = calculations.calculate_stats_fingerprint(stats)
 
-    await asyncio.gather(
-        _update_wallets(wallets),
-        _update_wallet_stats_7d([wallet.stats_7d for wallet in wallets], excluded_fields),
-        _update_wallet_stats_30d([wallet.stats_30d for wallet in wallets], excluded_fields),
-        _update_wallet_stats_all([wallet.stats_all for wallet in wallets], excluded_fields),
-    )
+    if config.db.wallet_lock_partitions:
+        partitions = partition_by_wallet_address(wallets, config.db.wallet_lock_partitions)
+        await gather_partitions(
+            [
+                _update_wallets_partition(partition, partition_wallets, excluded_fields)
+                for partition, partition_wallets in partitions.items()
+            ],
+            partition_sessions_semaphore,
+        )
+    else:
+        await asyncio.gather(
+            _update_wallets(wallets),
+            _update_wallet_stats_7d([wallet.stats_7d for wallet in wallets], excluded_fields),
+            _update_wallet_stats_30d([wallet.stats_30d for wallet in wallets], excluded_fields),
+            _update_wallet_stats_all([wallet.stats_all for wallet in wallets], excluded_fields),
+        )
 
     elapsed_time = now() - start
+    if parallel_limit:
+        parallel_limit.observe(elapsed_time.total_seconds())
 
     logger.debug(f"Обновили {len(wallets)} кошельков в базе! | Время: {elapsed_time}")
 
 
+async def _update_wallets_partition(partition, wallets, excluded_fields):
+    """
+    Обновляет кошельки одной партиции и их статистики в одной транзакции под advisory-блокировкой партиции
+    (та же схема, что и в загрузчике свапов), поэтому дедлоков по кошелькам нет и повторы не нужны
+    """
+    last_check = now()
+    for wallet in wallets:
+        wallet.last_stats_check = last_check
+    async with AsyncSessionMaker() as session:
+        await lock_wallets_partition(session, partition)
+        await _update_wallets_flags_and_check(session, wallets, last_check)
+        await SQLAlchemyWalletStatistic7dRepository(session).bulk_update(
+            [wallet.stats_7d for wallet in wallets],
+            excluded_fields=excluded_fields,
+            only_changed_fields=["stats_fingerprint"],
+        )
+        await SQLAlchemyWalletStatistic30dRepository(session).bulk_update(
+            [wallet.stats_30d for wallet in wallets],
+            excluded_fields=excluded_fields,
+            only_changed_fields=["stats_fingerprint"],
+        )
+        await SQLAlchemyWalletStatisticAllRepository(session).bulk_update(
+            [wallet.stats_all for wallet in wallets],
+            excluded_fields=excluded_fields,
+            only_changed_fields=["stats_fingerprint"],
+        )
+        await session.commit()
+
+
 async def _update_wallet_stats_7d(stats, excluded_fields):
     async with AsyncSessionMaker() as session:
         await SQLAlchemyWalletStatistic7dRepository(session).bulk_update(
             stats,
             excluded_fields=excluded_fields,
+            only_changed_fields=["stats_fingerprint"],
         )
         await session.commit()
 
@@ -224,6 +418,7 @@ async def _update_wallet_stats_30d(stats, excluded_fields):
         await SQLAlchemyWalletStatistic30dRepository(session).bulk_update(
             stats,
             excluded_fields=excluded_fields,
+            only_changed_fields=["stats_fingerprint"],
         )
         await session.commit()
 
@@ -233,6 +428,7 @@ async def _update_wallet_stats_all(stats, excluded_fields):
         await SQLAlchemyWalletStatisticAllRepository(session).bulk_update(
             stats,
             excluded_fields=excluded_fields,
+            only_changed_fields=["stats_fingerprint"],
         )
         await session.commit()
 
@@ -245,10 +441,7 @@ async def _update_wallets(wallets):
     for i in range(5):
         try:
             async with AsyncSessionMaker() as session:
-                await SQLAlchemyWalletRepository(session).bulk_update(
-                    wallets,
-                    fields=["last_stats_check", "is_bot", "is_scammer"],
-                )
+                await _update_wallets_flags_and_check(session, wallets, last_check)
                 await session.commit()
                 break
         except DBAPIError as e:
@@ -258,6 +451,20 @@ async def _update_wallets(wallets):
         raise ValueError("Не удалось обновить кошельки после 5 попыток")
 
 
+async def _update_wallets_flags_and_check(session, wallets: list[Wallet], last_check: datetime):
+    """Флаги обновляются только у изменившихся кошельков, время пересчета - отдельным легким запросом"""
+    fields = ["is_bot", "is_scammer", "next_period_expiry_at"]
+    await SQLAlchemyWalletRepository(session).bulk_update(
+        wallets,
+        fields=fields,
+        only_changed_fields=fields,
+    )
+    await SQLAlchemyWalletRepository(session).update_last_stats_check(
+        [wallet.id for wallet in wallets],
+        last_check,
+    )
+
+
 async def log_statistics(
     wallets_count,
     tokens_count,
@@ -307,74 +514,247 @@ async def log_statistics(
     )
 
 
-async def process_update_wallet_statistics():
-    received_wallets_queue = Queue()
-    fetched_wallets_queue = Queue()
-    calculated_wallets_queue = Queue()
-    wallets_count = 100_000
-    total_wallets_processed = 0
-    total_tokens_processed = 0
-    total_elapsed_time = 0
+async def recalculate_wallets_in_db(
+    received_wallets_queue: Queue,
+    batch_size: int,
+    max_parallel: int = 1,
+) -> None:
+    """Пересчет статистики кошельков из очереди целиком в БД, без загрузки их токенов"""
+    batch = []
+    tasks = []  # Список активных задач обработки батчей
     while True:
-        start = datetime.now()
-        # Получаем кошельки для обновления из БД
-        await receive_wallets_from_db(
-            received_wallets_queue,
-            count=wallets_count,
+        wallet: Wallet | None = await received_wallets_queue.get()
+        if wallet is not None:
+            batch.append(wallet)
+        if (len(batch) >= batch_size) or (wallet is None and batch):
+            tasks.append(asyncio.create_task(_recalculate_wallets_in_db(batch.copy())))
+            batch.clear()
+            if len(tasks) >= max_parallel:
+                done, pending = await asyncio.wait(
+                    tasks,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    task.result()  # Пробрасываем ошибку задачи
+                tasks = list(pending)
+        if wallet is None:
+            if tasks:
+                await asyncio.gather(*tasks)
+            logger.debug(f"Задача пересчета в БД завершена")
+            return
+
+
+async def _recalculate_wallets_in_db(wallets: list[Wallet]) -> None:
+    current_datetime = now()
+    if config.db.wallet_lock_partitions:
+        partitions = partition_by_wallet_address(wallets, config.db.wallet_lock_partitions)
+        await gather_partitions(
+            [
+                _recalculate_wallets_partition_in_db(partition, partition_wallets, current_datetime)
+                for partition, partition_wallets in partitions.items()
+            ],
+            partition_sessions_semaphore,
         )
-        # Запускаем обработку кошельков
-        async with asyncio.TaskGroup() as tg:
-            tg.create_task(
-                fetch_wallets_related_data(
-                    received_wallets_queue,
-                    fetched_wallets_queue,
-                    batch_size=500,
-                    max_parallel=5,
+        return
+
+    for i in range(5):
+        try:
+            async with AsyncSessionMaker() as session:
+                await SQLAlchemyWalletRepository(session).recalculate_wallets_statistics(
+                    [wallet.id for wallet in wallets],
+                    current_datetime,
                 )
+                await session.commit()
+                break
+        except DBAPIError as e:
+            logger.error(f"Deadlock при пересчете статистики кошельков в БД: {e}")
+            await asyncio.sleep(random.randint(1, 3))
+    else:
+        raise ValueError("Не удалось пересчитать статистику кошельков после 5 попыток")
+
+
+async def _recalculate_wallets_partition_in_db(partition, wallets, current_datetime):
+    async with AsyncSessionMaker() as session:
+        await lock_wallets_partition(session, partition)
+        await SQLAlchemyWalletRepository(session).recalculate_wallets_statistics(
+            [wallet.id for wallet in wallets],
+            current_datetime,
+        )
+        await session.commit()
+
+
+async def process_wallets(
+    received_wallets_queue: Queue,
+    fetched_wallets_queue: WalletsQueue,
+    calculated_wallets_queue: WalletsQueue,
+    executor: ProcessPoolExecutor | None = None,
+    fetch_parallel_limit: AdaptiveParallelLimit | None = None,
+    update_parallel_limit: AdaptiveParallelLimit | None = None,
+) -> int:
+    """Подгрузка токенов, пересчет и обновление в БД кошельков из received_wallets_queue"""
+    if config.wallet_statistic_updater.sql_aggregation:
+        await recalculate_wallets_in_db(received_wallets_queue, batch_size=5000, max_parallel=3)
+        return 0  # Токены в приложение не загружаются
+
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(
+            fetch_wallets_related_data(
+                received_wallets_queue,
+                fetched_wallets_queue,
+                batch_size=500,
+                max_parallel=5,
+                parallel_limit=fetch_parallel_limit,
             )
+        )
+        if use_columnar_calculations():
             calc_task = tg.create_task(
-                calculate_wallets(
+                calculate_wallets_batches(
                     fetched_wallets_queue,
                     calculated_wallets_queue,
+                    executor,
                 )
             )
-            tg.create_task(
-                update_wallets(
+        else:
+            calc_task = tg.create_task(
+                calculate_wallets(
+                    fetched_wallets_queue,
                     calculated_wallets_queue,
-                    batch_size=5000,
-                    max_parallel=3,
                 )
             )
-        end = datetime.now()
-        tokens_count = calc_task.result()
-        elapsed_time = (end - start).total_seconds()
-
-        (
-            total_wallets_processed,
-            total_tokens_processed,
-            total_elapsed_time,
-        ) = await log_statistics(
-            wallets_count,
-            tokens_count,
-            elapsed_time,
-            total_wallets_processed,
-            total_tokens_processed,
-            total_elapsed_time,
+        tg.create_task(
+            update_wallets(
+                calculated_wallets_queue,
+                batch_size=5000,
+                max_parallel=3,
+                parallel_limit=update_parallel_limit,
+            )
         )
+    return calc_task.result()
+
+
+async def process_update_wallet_statistics():
+    received_wallets_queue = Queue(maxsize=config.wallet_statistic_updater.received_queue_size)
+    updater_config = config.wallet_statistic_updater
+    # Очереди ограничены по кошелькам и токенам, чтобы при медленной БД память не росла
+    fetched_wallets_queue = WalletsQueue(updater_config.queue_max_wallets, updater_config.queue_max_tokens)
+    calculated_wallets_queue = WalletsQueue(updater_config.queue_max_wallets, updater_config.queue_max_tokens)
+    # Лимиты параллельности этапов общие для всех циклов, чтобы не терять накопленную задержку
+    fetch_parallel_limit = AdaptiveParallelLimit("fetch", 5, adaptive=updater_config.adaptive_parallel)
+    update_parallel_limit = AdaptiveParallelLimit("update", 3, adaptive=updater_config.adaptive_parallel)
+    dirty_wallets_count = 100_000
+    total_wallets_processed = 0
+    total_tokens_processed = 0
+    total_elapsed_time = 0
+    workers = config.wallet_statistic_updater.calculate_workers
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        while True:
+            start = datetime.now()
+            tokens_count = 0
+            # Сначала пересчитываем кошельки с новыми свапами
+            # (очередь ограничена, поэтому получение и обработка идут одновременно)
+            async with asyncio.TaskGroup() as tg:
+                receive_task = tg.create_task(
+                    receive_dirty_wallets_from_db(
+                        received_wallets_queue,
+                        count=dirty_wallets_count,
+                    )
+                )
+                process_task = tg.create_task(
+                    process_wallets(
+                        received_wallets_queue,
+                        fetched_wallets_queue,
+                        calculated_wallets_queue,
+                        executor,
+                        fetch_parallel_limit,
+                        update_parallel_limit,
+                    )
+                )
+            dirty_wallets = receive_task.result()
+            tokens_count += process_task.result()
+            await delete_processed_dirty_wallets(dirty_wallets)
+            # Затем плановый пересчет давно не обновлявшихся, пока очередь не пуста - меньшими порциями
+            async with asyncio.TaskGroup() as tg:
+                receive_task = tg.create_task(
+                    receive_wallets_from_db(
+                        received_wallets_queue,
+                        count=10_000 if dirty_wallets else 100_000,
+                    )
+                )
+                process_task = tg.create_task(
+                    process_wallets(
+                        received_wallets_queue,
+                        fetched_wallets_queue,
+                        calculated_wallets_queue,
+                        executor,
+                        fetch_parallel_limit,
+                        update_parallel_limit,
+                    )
+                )
+            wallets_count = receive_task.result()
+            tokens_count += process_task.result()
+            if not dirty_wallets and not wallets_count:
+                # Пересчитывать нечего (при расписании по выходу токенов из периодов) - ждем новых событий
+                await asyncio.sleep(config.wallet_statistic_updater.idle_sleep_seconds)
+            wallets_count += len(dirty_wallets)
+            end = datetime.now()
+            elapsed_time = (end - start).total_seconds()
+
+            (
+                total_wallets_processed,
+                total_tokens_processed,
+                total_elapsed_time,
+            ) = await log_statistics(
+                wallets_count,
+                tokens_count,
+                elapsed_time,
+                total_wallets_processed,
+                total_tokens_processed,
+                total_elapsed_time,
+            )
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
 
 
 async def update_single_wallet_statistics(
     address,
 ):
-    global engine
+    await update_wallets_statistics_by_addresses([address])
 
+
+async def update_wallets_statistics_by_addresses(addresses: list[str]) -> list[str]:
+    """Пересчет статистики кошельков по адресам одним батчем. Возвращает адреса найденных и обновленных кошельков"""
     async with AsyncSessionMaker() as session:
-        wallet = await SQLAlchemyWalletRepository(session).get_by_address(address)
-        if not wallet:
-            return
-        await _fetch_related_data([wallet])
-        calculations.calculate_wallet_stats(wallet)
-        await _update_wallets_data([wallet])
+        wallets_map = await SQLAlchemyWalletRepository(session).in_bulk(addresses, "address")
+    wallets: list[Wallet] = list(wallets_map.values())
+    if not wallets:
+        return []
+    if use_columnar_calculations():
+        columns = await _fetch_related_data_columns(wallets)
+        columnar_calculations.calculate_wallets_stats_vectorized(wallets, columns)
+    else:
+        await _fetch_related_data(wallets)
+        for wallet in wallets:
+            calculations.calculate_wallet_stats(wallet)
+    await _update_wallets_data(wallets)
+    return [wallet.address for wallet in wallets]
+
+
+async def update_requested_wallets_statistics(batch_id: str) -> dict:
+    """Обновление статистики кошельков, запрошенных через API за одно окно (батч очереди RedisWalletRefreshQueue)"""
+    async with Redis.from_url(config.redis.url, decode_responses=True) as redis:
+        refresh_queue = RedisWalletRefreshQueue(redis)
+        addresses = await refresh_queue.pop_batch(batch_id)
+        try:
+            updated_addresses = await update_wallets_statistics_by_addresses(addresses)
+        finally:
+            await refresh_queue.release(batch_id, addresses)
+    logger.info(f"Обновили статистику {len(updated_addresses)} из {len(addresses)} запрошенных кошельков")
+    return {
+        "updated": len(updated_addresses),
+        "not_found": sorted(set(addresses) - set(updated_addresses)),
+    }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+import time
+from uuid import UUID
+
+from sqlalchemy import text
+
+from src.infra.db.queries import BACKFILL_WALLET_TOKEN_FIRST_BLOCK_IDS
+from src.infra.db.sqlalchemy.setup import AsyncSessionMaker
+
+logger = logging.getLogger(__name__)
+
+WALLETS_BATCH_SIZE = 5000  # Кол-во кошельков в одной транзакции бэкфилла
+START_AFTER_WALLET_ID = UUID(int=0)  # Для продолжения прерванного бэкфилла - последний id из лога
+
+GET_WALLETS_BATCH_UPPER_ID = text(
+    "SELECT max(id) FROM (SELECT id FROM wallet WHERE id > :after_wallet_id ORDER BY id LIMIT :limit) w"
+)
+
+
+async def backfill_wallet_token_first_block_ids(
+    after_wallet_id: UUID = START_AFTER_WALLET_ID,
+    batch_size: int = WALLETS_BATCH_SIZE,
+) -> None:
+    """
+    Разовое заполнение first_buy_block_id/first_sell_block_id у связок, созданных до появления колонок.
+    Кошельки обходятся диапазонами по id, каждый диапазон - отдельная транзакция.
+    Повторный запуск перезаписывает только расходящиеся значения
+    """
+    logger.info(f"Запущен бэкфилл блоков первых сделок WalletToken с кошелька {after_wallet_id}")
+    total_updated = 0
+    while True:
+        start = time.perf_counter()
+        async with AsyncSessionMaker() as session:
+            until_wallet_id = await session.scalar(
+                GET_WALLETS_BATCH_UPPER_ID,
+                {"after_wallet_id": after_wallet_id, "limit": batch_size},
+            )
+            if until_wallet_id is None:
+                break
+            result = await session.execute(
+                text(BACKFILL_WALLET_TOKEN_FIRST_BLOCK_IDS),
+                {"after_wallet_id": after_wallet_id, "until_wallet_id": until_wallet_id},
+            )
+            await session.commit()
+        total_updated += result.rowcount
+        logger.info(
+            f"Обработаны кошельки до {until_wallet_id} | Обновлено связок: {result.rowcount} (всего {total_updated}) "
+            f"| Время: {time.perf_counter() - start:.2f}с"
+        )
+        after_wallet_id = until_wallet_id
+    logger.info(f"Бэкфилл завершен, обновлено связок: {total_updated}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    asyncio.run(backfill_wallet_token_first_block_ids())
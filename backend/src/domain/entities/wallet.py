@@ -20,6 +20,7 @@ class Wallet(
     sol_balance: Optional[Decimal] = None
     is_scammer: bool = False
     is_bot: bool = False
+    next_period_expiry_at: Optional[datetime] = None
     stats_7d: Optional["WalletStatistic7d"] = None
     stats_30d: Optional["WalletStatistic30d"] = None
     stats_all: Optional["WalletStatisticAll"] = None  # field(default=None, repr=False)
@@ -69,17 +70,17 @@ class AbstractWalletStatistic(BaseEntity, TimestampMixinEntity):
 
 @dataclass
 class WalletStatistic7d(AbstractWalletStatistic):
-    pass
+    stats_fingerprint: Optional[int] = None
 
 
 @dataclass
 class WalletStatistic30d(AbstractWalletStatistic):
-    pass
+    stats_fingerprint: Optional[int] = None
 
 
 @dataclass
 class WalletStatisticAll(AbstractWalletStatistic):
-    pass
+    stats_fingerprint: Optional[int] = None
 
 
 @dataclass
@@ -123,6 +124,8 @@ class WalletToken(BaseEntity, TimestampMixinEntity):
     first_sell_price_usd: Optional[Decimal] = None
     first_sell_timestamp: Optional[datetime] = None
     last_activity_timestamp: Optional[datetime] = None
+    first_buy_block_id: Optional[int] = None
+    first_sell_block_id: Optional[int] = None
     total_profit_usd: Decimal = Decimal(0)
     total_profit_percent: Optional[float] = None
     first_buy_sell_duration: Optional[int] = None
@@ -133,3 +136,29 @@ class WalletToken(BaseEntity, TimestampMixinEntity):
 @dataclass
 class TgSentWallet(BaseEntity, TimestampMixinEntity):
     wallet_id: Optional[UUID] = None
+
+
+@dataclass
+class WalletStatsDirty(BaseEntity):
+    wallet_id: UUID
+    marked_at: Optional[datetime] = None
+
+
+@dataclass(kw_only=True, slots=True)
+class WalletRelation(BaseEntity):
+    wallet_id: UUID
+    related_wallet_id: UUID
+    before_count: int = 0
+    after_count: int = 0
+    same_count: int = 0
+    mixed_count: int = 0
+    last_intersected_tokens_trade_timestamp: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+@dataclass(kw_only=True, slots=True)
+class WalletRelationsDirtyBlocks(BaseEntity):
+    id: Optional[UUID] = None
+    from_block_id: int
+    until_block_id: int
+    marked_at: Optional[datetime] = None
@@ -83,6 +83,21 @@ TASK_CONFIGS = {
             },
         },
     },
+    "update_wallets_statistics_batch_task": {
+        "loggers": ["src"],  # включаем логирование для всех модулей проекта
+        "handlers": {
+            "file": {
+                "class": "logging.FileHandler",
+                "filename": f"{LOGS_ROOT_DIR}/update_wallets_statistics_batch_task.log",
+                "level": "INFO",
+                "formatter": "detailed",
+            },
+            "console": {
+                "class": "logging.StreamHandler",
+                "level": "INFO",
+            },
+        },
+    },
     "update_wallet_statistics_buy_price_gt_15k_task": {
         "loggers": ["src"],  # включаем логирование для всех модулей проекта
         "handlers": {
@@ -128,7 +143,6 @@ TASK_CONFIGS = {
             },
         },
     },
-
 }
 
 
@@ -15,6 +15,7 @@ from src.application.processes.wallet_statistic_updaters.wallet_statistic_copyab
 )
 from src.application.processes.wallet_statistic_updaters.wallet_statistic_updater import (
     process_update_wallet_statistics,
+    update_requested_wallets_statistics,
     update_single_wallet_statistics,
 )
 from src.infra.celery.logging import setup_task_logging
@@ -89,6 +90,14 @@ def update_single_wallet_statistics_task(self, address):
     return loop.run_until_complete(update_single_wallet_statistics(address))
 
 
+@shared_task(bind=True, ignore_result=False)
+@task_logger
+def update_wallets_statistics_batch_task(self, batch_id):
+    """Задача обновления статистики кошельков, запрошенных за одно окно объединения запросов"""
+    loop = asyncio.get_event_loop()
+    return loop.run_until_complete(update_requested_wallets_statistics(batch_id))
+
+
 @shared_task(bind=True, ignore_result=False)
 @task_logger
 def update_wallet_statistics_buy_price_gt_15k_task(
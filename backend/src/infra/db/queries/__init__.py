@@ -25,6 +25,209 @@ GET_WALLETS_FOR_UPDATE_STATS = textwrap.dedent(
 """
 )
 
+# Порции кошельков для пересчета статистики по keyset, каждая отдельным коротким запросом.
+# Только колонки, нужные пересчету (is_bot/is_scammer и last_stats_check пересчитываются заново), и ключ порции.
+# Сначала ни разу не пересчитанные кошельки - по id
+GET_NOT_CHECKED_WALLETS_IDS_PAGE = textwrap.dedent(
+    """\
+    SELECT id, address, last_stats_check, next_period_expiry_at
+    FROM wallet
+    WHERE last_stats_check IS NULL
+      AND id > :after_id
+    ORDER BY id
+    LIMIT :count
+"""
+)
+
+# Затем по ({sort_column}, id): давно не пересчитанные (last_stats_check) или с выходом токена из периода 7д/30д
+# (next_period_expiry_at; кошельки с новыми свапами пересчитываются через wallet_stats_dirty).
+# Кошельки, пересчитанные после начала обхода (:checked_before), получают значение позже него и не читаются повторно
+GET_CHECKED_WALLETS_IDS_PAGE = textwrap.dedent(
+    """\
+    SELECT id, address, last_stats_check, next_period_expiry_at
+    FROM wallet
+    WHERE last_stats_check IS NOT NULL
+      AND {sort_column} < :checked_before
+      AND ({sort_column}, id) > (:after_value, :after_id)
+    ORDER BY {sort_column}, id
+    LIMIT :count
+"""
+)
+
+# Временная таблица для слияния WalletToken одним INSERT ... SELECT (временные таблицы не пишутся в WAL)
+CREATE_WALLET_TOKEN_STAGING_TABLE = textwrap.dedent(
+    """\
+    CREATE TEMP TABLE IF NOT EXISTS {table_name}
+      (LIKE wallet_token INCLUDING DEFAULTS)
+      ON COMMIT DELETE ROWS
+    """
+)
+
+# Пересчет статистики кошельков за период целиком в БД: агрегаты по WalletToken кошелька, как в
+# calculations.recalculate_wallet_period_stats. Медианы берутся из отсортированного массива, как statistics.median
+# (percentile_cont работает только с float8). Средняя и медиана длительности - целочисленным делением:
+# дробные значения из приложения при записи в bigint тоже отбрасывают дробную часть.
+# {columns} / {set_columns} - поля таблицы статистики, {wallet_update} - обновление самих кошельков (для all)
+UPSERT_WALLETS_PERIOD_STATISTIC = textwrap.dedent(
+    """\
+    WITH wallets AS (
+      SELECT unnest(CAST(:wallet_ids AS uuid[])) AS wallet_id
+    ),
+    agg AS (
+      SELECT
+        w.wallet_id,
+        count(wt.id) AS total_token,
+        coalesce(sum(wt.total_buys_count), 0) AS total_token_buys,
+        coalesce(sum(wt.total_sales_count), 0) AS total_token_sales,
+        coalesce(sum(wt.total_buy_amount_usd), 0) AS total_token_buy_amount_usd,
+        coalesce(sum(wt.total_sell_amount_usd), 0) AS total_token_sell_amount_usd,
+        coalesce(sum(wt.total_profit_usd), 0) AS total_profit_usd,
+        coalesce(sum(wt.total_swaps_from_txs_with_mt_3_swappers), 0) AS total_swaps_from_txs_with_mt_3_swappers,
+        coalesce(sum(wt.total_swaps_from_arbitrage_swap_events), 0) AS total_swaps_from_arbitrage_swap_events,
+        count(*) FILTER (WHERE wt.total_buys_count > 0) AS token_with_buy,
+        count(*) FILTER (WHERE wt.total_buys_count > 0 AND wt.total_sales_count > 0) AS token_with_buy_and_sell,
+        count(*) FILTER (WHERE wt.total_buys_count > 0 AND wt.total_sales_count = 0) AS token_buy_without_sell,
+        count(*) FILTER (WHERE wt.total_sales_count > 0 AND wt.total_buys_count = 0) AS token_sell_without_buy,
+        count(*) FILTER (
+          WHERE wt.total_buys_count > 0 AND wt.total_sell_amount_token > wt.total_buy_amount_token
+        ) AS token_with_sell_amount_gt_buy_amount,
+        count(*) FILTER (WHERE wt.total_buys_count > 0 AND wt.total_profit_usd >= 0) AS profitable_tokens_count,
+        count(*) FILTER (WHERE wt.total_buys_count > 0 AND wt.total_profit_percent > 500) AS pnl_gt_5x_num,
+        count(*) FILTER (
+          WHERE wt.total_buys_count > 0 AND wt.total_profit_percent > 200 AND wt.total_profit_percent <= 500
+        ) AS pnl_2x_5x_num,
+        count(*) FILTER (
+          WHERE wt.total_buys_count > 0 AND wt.total_profit_percent > 0 AND wt.total_profit_percent <= 200
+        ) AS pnl_lt_2x_num,
+        count(*) FILTER (
+          WHERE wt.total_buys_count > 0 AND wt.total_profit_percent > -50 AND wt.total_profit_percent <= 0
+        ) AS pnl_minus_dot5_0x_num,
+        count(*) FILTER (
+          WHERE wt.total_buys_count > 0 AND wt.total_profit_percent <= -50
+        ) AS pnl_lt_minus_dot5_num,
+        coalesce(
+          sum(wt.first_buy_price_usd) FILTER (WHERE wt.total_buys_count > 0 AND wt.first_buy_price_usd <> 0), 0
+        ) AS first_buy_price_sum,
+        array_agg(wt.first_buy_price_usd ORDER BY wt.first_buy_price_usd) FILTER (
+          WHERE wt.total_buys_count > 0 AND wt.first_buy_price_usd <> 0
+        ) AS first_buy_prices,
+        array_agg(wt.total_buy_amount_usd ORDER BY wt.total_buy_amount_usd) FILTER (
+          WHERE wt.total_buys_count > 0
+        ) AS buy_amounts,
+        coalesce(sum(wt.first_buy_sell_duration), 0) AS duration_sum,
+        array_agg(wt.first_buy_sell_duration ORDER BY wt.first_buy_sell_duration) FILTER (
+          WHERE wt.first_buy_sell_duration IS NOT NULL
+        ) AS durations,
+        min(
+          CASE
+            WHEN coalesce(wt.first_sell_timestamp, wt.first_buy_timestamp) + interval '7 days 1 microsecond'
+              > CAST(:current_datetime AS timestamptz)
+            THEN coalesce(wt.first_sell_timestamp, wt.first_buy_timestamp) + interval '7 days 1 microsecond'
+            ELSE coalesce(wt.first_sell_timestamp, wt.first_buy_timestamp) + interval '30 days 1 microsecond'
+          END
+        ) FILTER (
+          WHERE coalesce(wt.first_sell_timestamp, wt.first_buy_timestamp) + interval '30 days 1 microsecond'
+            > CAST(:current_datetime AS timestamptz)
+        ) AS next_period_expiry_at
+      FROM wallets w
+      LEFT JOIN wallet_token wt ON wt.wallet_id = w.wallet_id AND ({period_condition})
+      GROUP BY w.wallet_id
+    ),
+    stats AS (
+      SELECT
+        agg.*,
+        CASE
+          WHEN total_token_buy_amount_usd <> 0 THEN total_profit_usd / total_token_buy_amount_usd * 100
+        END AS total_profit_multiplier,
+        total_token_buy_amount_usd / nullif(token_with_buy, 0) AS token_avg_buy_amount,
+        first_buy_price_sum / nullif(token_with_buy, 0) AS token_first_buy_avg_price_usd,
+        (
+          first_buy_prices[(cardinality(first_buy_prices) + 1) / 2]
+          + first_buy_prices[(cardinality(first_buy_prices) + 2) / 2]
+        ) / 2 AS token_first_buy_median_price_usd,
+        total_profit_usd / nullif(token_with_buy, 0) AS token_avg_profit_usd,
+        profitable_tokens_count::numeric / nullif(token_with_buy, 0) * 100 AS winrate,
+        duration_sum / nullif(token_with_buy_and_sell, 0) AS token_buy_sell_duration_avg,
+        (
+          durations[(cardinality(durations) + 1) / 2]
+          + durations[(cardinality(durations) + 2) / 2]
+        ) / 2 AS token_buy_sell_duration_median,
+        (
+          buy_amounts[(cardinality(buy_amounts) + 1) / 2]
+          + buy_amounts[(cardinality(buy_amounts) + 2) / 2]
+        ) / 2 AS token_median_buy_amount,
+        pnl_lt_minus_dot5_num::float / nullif(token_with_buy, 0) * 100 AS pnl_lt_minus_dot5_percent,
+        pnl_minus_dot5_0x_num::float / nullif(token_with_buy, 0) * 100 AS pnl_minus_dot5_0x_percent,
+        pnl_lt_2x_num::float / nullif(token_with_buy, 0) * 100 AS pnl_lt_2x_percent,
+        pnl_2x_5x_num::float / nullif(token_with_buy, 0) * 100 AS pnl_2x_5x_percent,
+        pnl_gt_5x_num::float / nullif(token_with_buy, 0) * 100 AS pnl_gt_5x_percent
+      FROM agg
+    ){wallet_update}
+    INSERT INTO {table_name} (wallet_id, {columns}, updated_at)
+    SELECT wallet_id, {columns}, now()
+    FROM stats
+    ORDER BY wallet_id
+    ON CONFLICT (wallet_id) DO UPDATE SET {set_columns}, updated_at = EXCLUDED.updated_at
+    """
+)
+
+# Токен попадает в период, если первая покупка в периоде и до нее нет продаж, или первая продажа в периоде
+# (calculations.filter_period_tokens)
+WALLET_TOKEN_PERIOD_CONDITION = textwrap.dedent(
+    """\
+    (
+      wt.first_buy_timestamp >= CAST(:current_datetime AS timestamptz) - interval '{days} days'
+      AND (
+        wt.first_sell_timestamp IS NULL
+        OR wt.first_sell_timestamp >= CAST(:current_datetime AS timestamptz) - interval '{days} days'
+      )
+    )
+    OR wt.first_sell_timestamp >= CAST(:current_datetime AS timestamptz) - interval '{days} days'
+    """
+)
+
+# Обновление кошельков по статистике за все время: last_stats_check, ближайший выход токена из периода
+# и статусы скамера/бота
+# (calculations.determine_scammer_status / determine_bot_status)
+UPDATE_WALLETS_STATUSES_CTE = textwrap.dedent(
+    """\
+    ,
+    updated_wallets AS (
+      UPDATE wallet
+      SET
+        last_stats_check = CAST(:current_datetime AS timestamptz),
+        next_period_expiry_at = stats.next_period_expiry_at,
+        is_scammer = coalesce(
+          (stats.total_token >= 5 AND stats.token_sell_without_buy::float / stats.total_token >= 0.21)
+          OR (stats.total_token >= 5 AND stats.token_with_sell_amount_gt_buy_amount::float / stats.total_token >= 0.21)
+          OR stats.total_swaps_from_txs_with_mt_3_swappers > 0,
+          false
+        ),
+        is_bot = coalesce(
+          (
+            stats.total_token_buys + stats.total_token_sales > 0
+            AND stats.total_swaps_from_arbitrage_swap_events::float
+              / (stats.total_token_buys + stats.total_token_sales) >= 0.5
+          )
+          OR (
+            stats.total_token >= 500
+            AND stats.duration_sum <> 0
+            AND stats.duration_sum::numeric / nullif(stats.token_with_buy_and_sell, 0) <= 2
+          )
+          OR (
+            stats.total_token >= 1000
+            AND (
+              (stats.token_avg_buy_amount <> 0 AND stats.token_avg_buy_amount < 30)
+              OR (stats.total_token_buys + stats.total_token_sales)::float / stats.total_token > 10
+            )
+          ),
+          false
+        )
+      FROM stats
+      WHERE wallet.id = stats.wallet_id
+    )"""
+)
+
 # Создает функцию coun_estimate для подсчета примерного кол-ва строк для запросов с фильтрами
 CREATE_FUNC_COUNT_ESTIMATE = """
     CREATE OR REPLACE FUNCTION count_estimate(query text) RETURNS bigint AS $$
@@ -48,3 +251,130 @@ GET_COUNT_ESTIMATE_FULL = """
     FROM pg_class
     WHERE relname = '{table_name}'
 """
+
+# Первые покупка и продажа каждого из кошельков по токенам (не более :max_tokens последних активных токенов
+# с покупками и продажами) и первые сделки того же типа других кошельков в диапазоне блоков вокруг них
+GET_FIRST_TRADES_NEIGHBORS = textwrap.dedent(
+    """\
+    WITH anchors AS (
+      SELECT
+        wt.wallet_id,
+        wt.token_id,
+        e.event_type,
+        CASE
+          WHEN e.block_id IS NULL AND e.events_count > 0 THEN (
+            -- Связка еще не заполнена бэкфиллом first_*_block_id
+            SELECT min(s.block_id)
+            FROM swap s
+            WHERE s.wallet_id = wt.wallet_id AND s.token_id = wt.token_id AND s.event_type = e.event_type
+          )
+          ELSE e.block_id
+        END AS block_id
+      FROM unnest(CAST(:wallet_ids AS uuid[])) w (id)
+      CROSS JOIN LATERAL (
+        SELECT wallet_id, token_id, first_buy_block_id, first_sell_block_id, total_buys_count, total_sales_count
+        FROM wallet_token
+        WHERE wallet_id = w.id AND total_buys_count > 0 AND total_sales_count > 0
+        ORDER BY last_activity_timestamp DESC
+        LIMIT :max_tokens
+      ) wt
+      CROSS JOIN LATERAL (
+        VALUES
+          ('buy'::varchar, wt.first_buy_block_id, wt.total_buys_count),
+          ('sell'::varchar, wt.first_sell_block_id, wt.total_sales_count)
+      ) e (event_type, block_id, events_count)
+    )
+    SELECT
+      a.wallet_id,
+      a.token_id,
+      a.event_type,
+      a.block_id AS anchor_block_id,
+      n.wallet_id AS related_wallet_id,
+      n.block_id,
+      n.timestamp
+    FROM anchors a
+    CROSS JOIN LATERAL (
+      SELECT DISTINCT ON (s.wallet_id) s.wallet_id, s.block_id, s.timestamp
+      FROM swap s
+      WHERE s.token_id = a.token_id
+        AND s.event_type = a.event_type
+        AND s.block_id BETWEEN a.block_id - :blocks_before AND a.block_id + :blocks_after
+        AND s.wallet_id <> a.wallet_id
+      ORDER BY s.wallet_id, s.block_id, s.timestamp
+    ) n
+    WHERE a.block_id <> 0
+"""
+)
+
+# Кошельки, у которых первая покупка или продажа какого-либо токена попала в диапазон блоков
+# (:from_block_id, :until_block_id], и кошельки со свапами в диапазоне, у которых больше :max_tokens токенов
+# (в GET_FIRST_TRADES_NEIGHBORS учитываются их последние активные токены, набор которых сменился)
+GET_WALLETS_WITH_FIRST_TRADES_IN_BLOCKS = textwrap.dedent(
+    """\
+    SELECT s.wallet_id
+    FROM swap s
+    JOIN wallet_token wt ON wt.wallet_id = s.wallet_id AND wt.token_id = s.token_id
+    WHERE s.block_id > :from_block_id
+      AND s.block_id <= :until_block_id
+      AND (wt.first_buy_block_id = s.block_id OR wt.first_sell_block_id = s.block_id)
+    UNION
+    SELECT s.wallet_id
+    FROM swap s
+    JOIN wallet_statistic_all ws ON ws.wallet_id = s.wallet_id
+    WHERE s.block_id > :from_block_id
+      AND s.block_id <= :until_block_id
+      AND ws.total_token > :max_tokens
+    ORDER BY wallet_id
+"""
+)
+
+# Связанные кошельки из wallet_relation со статистикой (кроме ботов). Параметры позиционные (tortoise / asyncpg)
+GET_WALLET_RELATED_WALLETS = textwrap.dedent(
+    """\
+    SELECT
+      w.address,
+      w.last_activity_timestamp,
+      wr.last_intersected_tokens_trade_timestamp,
+      s30.total_profit_usd AS total_profit_usd_30d,
+      s30.total_profit_multiplier AS total_profit_multiplier_30d,
+      sa.total_token AS total_token_count,
+      wr.before_count,
+      wr.after_count,
+      wr.same_count,
+      wr.mixed_count
+    FROM wallet_relation wr
+    JOIN wallet w ON w.id = wr.related_wallet_id
+    LEFT JOIN wallet_statistic_all sa ON sa.wallet_id = w.id
+    LEFT JOIN wallet_statistic_30d s30 ON s30.wallet_id = w.id
+    WHERE wr.wallet_id = $1
+      AND w.is_bot = false
+    ORDER BY wr.last_intersected_tokens_trade_timestamp DESC NULLS LAST
+"""
+)
+
+
+# Бэкфилл first_buy_block_id/first_sell_block_id для связок кошельков диапазона (:after_wallet_id, :until_wallet_id]
+BACKFILL_WALLET_TOKEN_FIRST_BLOCK_IDS = textwrap.dedent(
+    """\
+    UPDATE wallet_token wt
+    SET
+      first_buy_block_id = s.first_buy_block_id,
+      first_sell_block_id = s.first_sell_block_id
+    FROM (
+      SELECT
+        wallet_id,
+        token_id,
+        min(block_id) FILTER (WHERE event_type = 'buy') AS first_buy_block_id,
+        min(block_id) FILTER (WHERE event_type = 'sell') AS first_sell_block_id
+      FROM swap
+      WHERE wallet_id > :after_wallet_id AND wallet_id <= :until_wallet_id
+      GROUP BY wallet_id, token_id
+    ) s
+    WHERE wt.wallet_id = s.wallet_id
+      AND wt.token_id = s.token_id
+      AND (
+        wt.first_buy_block_id IS DISTINCT FROM s.first_buy_block_id
+        OR wt.first_sell_block_id IS DISTINCT FROM s.first_sell_block_id
+      )
+"""
+)
@@ -0,0 +1,57 @@
+import asyncio
+import zlib
+from collections import defaultdict
+from typing import Awaitable, Iterable, TypeVar
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+T = TypeVar("T")
+
+WALLETS_PARTITION_LOCK_NAMESPACE = 7301  # classid для pg_advisory_xact_lock(classid, objid) партиций кошельков
+
+
+def get_wallet_partition(address: str, partitions_count: int) -> int:
+    """Партиция кошелька по хешу адреса (crc32 одинаков во всех процессах, в отличие от hash())"""
+    return zlib.crc32(address.encode()) % partitions_count
+
+
+def partition_by_wallet_address(
+    objects: Iterable[T],
+    partitions_count: int,
+    get_address=lambda obj: obj.address,
+) -> dict[int, list[T]]:
+    """Разбивает объекты по партициям кошельков, внутри партиции объекты отсортированы по адресу"""
+    partitions = defaultdict(list)
+    for obj in objects:
+        partitions[get_wallet_partition(get_address(obj), partitions_count)].append(obj)
+    for partition_objects in partitions.values():
+        partition_objects.sort(key=get_address)
+    return dict(sorted(partitions.items()))
+
+
+async def lock_wallets_partition(session: AsyncSession, partition: int) -> None:
+    """
+    Блокировка партиции кошельков до конца транзакции.
+    Каждая транзакция, изменяющая кошельки, держит блокировку ровно одной партиции и меняет только ее кошельки,
+    поэтому такие транзакции не могут взаимно заблокировать друг друга
+    """
+    await session.execute(
+        text("SELECT pg_advisory_xact_lock(:namespace, :partition)"),
+        {"namespace": WALLETS_PARTITION_LOCK_NAMESPACE, "partition": partition},
+    )
+
+
+async def gather_partitions(coroutines: Iterable[Awaitable[T]], semaphore: asyncio.Semaphore) -> list[T]:
+    """
+    asyncio.gather по партициям (каждая в своей сессии), но одновременно не больше сессий, чем позволяет semaphore.
+    Семафор общий на процесс (setup.partition_sessions_semaphore): без него каждый батч берет из пула
+    по сессии на партицию, параллельные батчи умножают это число, и при wallet_lock_partitions больше пула
+    запросы ждут соединение до таймаута пула
+    """
+
+    async def run(coroutine: Awaitable[T]) -> T:
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*[run(coroutine) for coroutine in coroutines])
@@ -6,11 +6,14 @@ from .user import User
 from .wallet import (
     TgSentWallet,
     Wallet,
+    WalletRelation,
+    WalletRelationsDirtyBlocks,
     WalletStatistic7d,
     WalletStatistic30d,
     WalletStatisticAll,
     WalletStatisticBuyPriceGt15k7d,
     WalletStatisticBuyPriceGt15k30d,
     WalletStatisticBuyPriceGt15kAll,
+    WalletStatsDirty,
     WalletToken,
 )
@@ -36,4 +36,12 @@ class Swap(Base, UUIDIDMixin, TimestampsMixin):
         # Index("idx_tx_hash", "tx_hash"),
         Index("idx_swap_block_id", "block_id"),
         Index("idx_swap_timestamp", "timestamp"),
+        # Поиск соседних сделок по токену в диапазоне блоков (index-only scan)
+        Index(
+            "idx_swap_token_event_block",
+            "token_id",
+            "event_type",
+            "block_id",
+            postgresql_include=["wallet_id", "timestamp"],
+        ),
     )
@@ -18,6 +18,7 @@ from sqlalchemy import (
     Sequence,
     String,
     UniqueConstraint,
+    func,
     text,
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
@@ -33,6 +34,12 @@ class WalletFKPKMixin:
     )
 
 
+class WalletStatsFingerprintMixin:
+    """Миксин для отпечатка посчитанной статистики (строка не перезаписывается, если отпечаток не изменился)"""
+
+    stats_fingerprint: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+
+
 class Wallet(Base, UUIDIDMixin, TimestampsMixin):
     wallet = None
     __tablename__ = "wallet"
@@ -43,6 +50,8 @@ class Wallet(Base, UUIDIDMixin, TimestampsMixin):
 
     is_scammer: Mapped[bool] = mapped_column(Boolean, default=False, server_default="false")
     is_bot: Mapped[bool] = mapped_column(Boolean, default=False, server_default="false")
+    # Ближайший момент выхода токена из периода 7д/30д (когда статистику нужно пересчитать без новых свапов)
+    next_period_expiry_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     sol_balance: Mapped[Decimal] = mapped_column(DECIMAL(50, 20), nullable=True)
 
     address: Mapped[str] = mapped_column(String(90), unique=True, nullable=False)
@@ -69,6 +78,7 @@ class Wallet(Base, UUIDIDMixin, TimestampsMixin):
         Index("idx_wallet_is_bot", "is_bot"),
         Index("idx_wallet_is_scammer", "is_scammer"),
         Index("idx_wallet_last_stats_check", text("last_stats_check NULLS FIRST")),
+        Index("idx_wallet_next_period_expiry_at", "next_period_expiry_at"),
         Index(
             "wallet_idx_last_activity_last_stats_check",
             "last_activity_timestamp",
@@ -122,7 +132,7 @@ class AbstractWalletStatistic(Base, WalletFKPKMixin, TimestampsMixin):
         return (self.total_token_buys or 0) + (self.total_token_sales or 0)
 
 
-class WalletStatistic7d(AbstractWalletStatistic):
+class WalletStatistic7d(AbstractWalletStatistic, WalletStatsFingerprintMixin):
     __tablename__ = "wallet_statistic_7d"
 
     wallet = relationship(
@@ -135,7 +145,7 @@ class WalletStatistic7d(AbstractWalletStatistic):
         return "Статистика кошелька за 7д"
 
 
-class WalletStatistic30d(AbstractWalletStatistic):
+class WalletStatistic30d(AbstractWalletStatistic, WalletStatsFingerprintMixin):
     __tablename__ = "wallet_statistic_30d"
 
     wallet = relationship(
@@ -148,7 +158,7 @@ class WalletStatistic30d(AbstractWalletStatistic):
         return "Статистика кошелька за 30д"
 
 
-class WalletStatisticAll(AbstractWalletStatistic):
+class WalletStatisticAll(AbstractWalletStatistic, WalletStatsFingerprintMixin):
     __tablename__ = "wallet_statistic_all"
 
     wallet = relationship(
@@ -209,6 +219,8 @@ class WalletToken(Base, UUIDIDMixin, TimestampsMixin):
     first_buy_timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
     first_sell_timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
     last_activity_timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
+    first_buy_block_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    first_sell_block_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
 
     total_profit_percent: Mapped[float] = mapped_column(Float, nullable=True)
     first_buy_sell_duration: Mapped[int] = mapped_column(Integer, nullable=True)
@@ -252,3 +264,51 @@ class WalletCopyable(Base, WalletFKPKMixin):
     __tablename__ = "wallet_copyable"
 
     wallet = relationship("Wallet", backref="wallet_copyable")
+
+
+class WalletStatsDirty(Base, WalletFKPKMixin):
+    """Очередь кошельков с новыми свапами, которым нужно пересчитать статистику в первую очередь"""
+
+    __tablename__ = "wallet_stats_dirty"
+
+    marked_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    wallet = relationship("Wallet", backref="stats_dirty")
+
+    __table_args__ = (Index("idx_wallet_stats_dirty_marked_at", "marked_at"),)
+
+
+class WalletRelation(Base, WalletFKPKMixin):
+    """
+    Связанный кошелек: сделал первые сделки по токенам wallet рядом (по блокам) с первыми покупкой и продажей wallet.
+    Кол-во общих токенов по статусу сделок related_wallet относительно wallet. Пересчитывается пакетно по новым свапам
+    """
+
+    __tablename__ = "wallet_relation"
+
+    related_wallet_id: Mapped[uuid.UUID] = mapped_column(
+        ForeignKey("wallet.id", ondelete="CASCADE"), primary_key=True, sort_order=-999
+    )
+    before_count: Mapped[int] = mapped_column(Integer, default=0)
+    after_count: Mapped[int] = mapped_column(Integer, default=0)
+    same_count: Mapped[int] = mapped_column(Integer, default=0)
+    mixed_count: Mapped[int] = mapped_column(Integer, default=0)
+    last_intersected_tokens_trade_timestamp: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (Index("idx_wallet_relation_related_wallet_id", "related_wallet_id"),)
+
+
+class WalletRelationsDirtyBlocks(Base, UUIDIDMixin):
+    """
+    Очередь диапазонов блоков (from_block_id, until_block_id], в которых загружены или удалены свапы
+    и по которым нужно пересчитать wallet_relation. Пишется в одной транзакции со свапами
+    """
+
+    __tablename__ = "wallet_relations_dirty_blocks"
+
+    from_block_id: Mapped[int] = mapped_column(BigInteger)
+    until_block_id: Mapped[int] = mapped_column(BigInteger)
+    marked_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
@@ -2,6 +2,8 @@ from .swap import SQLAlchemySwapRepository
 from .token import SQLAlchemyTokenPriceRepository, SQLAlchemyTokenRepository
 from .user import SQLAlchemyUserRepository
 from .wallet import (
+    SQLAlchemyWalletRelationRepository,
+    SQLAlchemyWalletRelationsDirtyBlocksRepository,
     SQLAlchemyWalletRepository,
     SQLAlchemyWalletStatistic7dRepository,
     SQLAlchemyWalletStatistic30dRepository,
@@ -9,6 +11,7 @@ from .wallet import (
     SQLAlchemyWalletStatisticBuyPriceGt15k7dRepository,
     SQLAlchemyWalletStatisticBuyPriceGt15k30dRepository,
     SQLAlchemyWalletStatisticBuyPriceGt15kAllRepository,
+    SQLAlchemyWalletStatsDirtyRepository,
     SQLAlchemyWalletTokenRepository,
 )
 
@@ -24,5 +27,8 @@ __all__ = [
     "SQLAlchemyTokenRepository",
     "SQLAlchemyTokenPriceRepository",
     "SQLAlchemyWalletTokenRepository",
+    "SQLAlchemyWalletStatsDirtyRepository",
     "SQLAlchemySwapRepository",
+    "SQLAlchemyWalletRelationRepository",
+    "SQLAlchemyWalletRelationsDirtyBlocksRepository",
 ]
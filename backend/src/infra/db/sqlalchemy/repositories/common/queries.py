@@ -1,15 +1,43 @@
 import textwrap
-from typing import Any, List
-
-from sqlalchemy import DECIMAL, Boolean, Date, DateTime, Float, Integer, String, Uuid, case, cast, extract, func, or_
+from typing import Any, List, Optional
+
+from sqlalchemy import (
+    DECIMAL,
+    Boolean,
+    Date,
+    DateTime,
+    Float,
+    Integer,
+    String,
+    Uuid,
+    case,
+    cast,
+    column,
+    extract,
+    func,
+    or_,
+    select,
+    table,
+)
 from sqlalchemy.dialects.postgresql import insert
 
 from src.infra.db.sqlalchemy.models import WalletToken
 
 
-def get_bulk_update_or_create_wallet_token_with_merge_stmt():
-
+def get_bulk_update_or_create_wallet_token_with_merge_stmt(from_table: Optional[str] = None):
+    """
+    Upsert WalletToken со слиянием статистики при конфликте.
+    Если передан from_table - строки берутся одним INSERT ... SELECT из таблицы с такими же колонками
+    (отсортированными по ключу, чтобы блокировки брались в предсказуемом порядке)
+    """
     stmt = insert(WalletToken)
+    if from_table:
+        columns = [col.name for col in WalletToken.__table__.columns]
+        source = table(from_table, *[column(name) for name in columns])
+        stmt = stmt.from_select(
+            columns,
+            select(*[source.c[name] for name in columns]).order_by(source.c.wallet_id, source.c.token_id),
+        )
 
     first_buy_ts = func.least(WalletToken.first_buy_timestamp, stmt.excluded.first_buy_timestamp)
     first_sell_ts = func.least(WalletToken.first_sell_timestamp, stmt.excluded.first_sell_timestamp)
@@ -55,6 +83,8 @@ def get_bulk_update_or_create_wallet_token_with_merge_stmt():
                 WalletToken.last_activity_timestamp,
                 stmt.excluded.last_activity_timestamp,
             ),
+            "first_buy_block_id": func.least(WalletToken.first_buy_block_id, stmt.excluded.first_buy_block_id),
+            "first_sell_block_id": func.least(WalletToken.first_sell_block_id, stmt.excluded.first_sell_block_id),
             "total_profit_usd": WalletToken.total_profit_usd + stmt.excluded.total_profit_usd,
             "total_profit_percent": case(
                 (
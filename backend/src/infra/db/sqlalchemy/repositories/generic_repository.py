@@ -1,7 +1,8 @@
 from dataclasses import asdict
+from datetime import datetime, timezone
 from typing import Any, Iterable, List, Optional, Type, TypeVar
 
-from sqlalchemy import bindparam, delete, func, inspect, select, text, update
+from sqlalchemy import bindparam, delete, func, inspect, or_, select, text, update
 from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import class_mapper
@@ -102,6 +103,76 @@ class SQLAlchemyGenericRepository(GenericRepositoryInterface[BaseEntity]):
             await connection.execute(stmt, values)
         return objects
 
+    async def bulk_upsert_returning_ids(
+        self,
+        objects: list[Entity],
+        key_field: str,
+        update_fields: Optional[Iterable[str]] = None,
+        batch_size: Optional[int] = None,
+    ) -> dict[Any, Any]:
+        """
+        Массовый upsert по уникальному полю key_field с RETURNING id, key_field.
+        Новые записи создаются с id из объектов, возвращается словарь key -> id в БД для всех объектов.
+        С update_fields конфликтующие записи обновляются и их id сразу возвращает RETURNING,
+        без update_fields (ON CONFLICT DO NOTHING) id существующих записей дочитываются отдельным запросом
+        """
+        if not objects:
+            return {}
+        values = [self.entity_to_dict(obj) for obj in objects]
+        key_column = getattr(self.model_class, key_field)
+        stmt = insert(self.model_class)
+        if update_fields:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[key_field],
+                set_={field: getattr(stmt.excluded, field) for field in update_fields if hasattr(stmt.excluded, field)},
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=[key_field])
+        stmt = stmt.returning(self.model_class.id, key_column)
+
+        connection = await self._session.connection()
+        batch_size = batch_size or len(values)
+        ids_map = {}
+        for i in range(0, len(values), batch_size):
+            result = await connection.execute(stmt, values[i : i + batch_size])
+            ids_map.update({key: id_ for id_, key in result.all()})
+
+        missing_keys = list({value[key_field] for value in values} - ids_map.keys())
+        for i in range(0, len(missing_keys), 32_000):  # Лимит PostgreSQL на кол-во аргументов
+            result = await connection.execute(
+                select(self.model_class.id, key_column).where(key_column.in_(missing_keys[i : i + 32_000]))
+            )
+            ids_map.update({key: id_ for id_, key in result.all()})
+        return ids_map
+
+    async def bulk_copy(
+        self,
+        objects: list[Entity],
+        batch_size: Optional[int] = None,
+        table_name: Optional[str] = None,
+    ) -> list[Entity]:
+        """
+        Массовая вставка через COPY ... FROM STDIN (FORMAT binary) по asyncpg-соединению текущей сессии.
+        Выполняется в транзакции сессии, конфликты не обрабатываются
+        """
+        if not objects:
+            return []
+        columns = [column.name for column in inspect(self.model_class).columns]
+        now = datetime.now(timezone.utc)
+        records = [self.entity_to_record(obj, columns, now) for obj in objects]
+        connection = await self._session.connection()
+        raw_connection = await connection.get_raw_connection()
+        driver_connection = raw_connection.driver_connection
+        table_name = table_name or self.model_class.__tablename__
+        batch_size = batch_size or len(records)
+        for i in range(0, len(records), batch_size):
+            await driver_connection.copy_records_to_table(
+                table_name,
+                records=records[i : i + batch_size],
+                columns=columns,
+            )
+        return objects
+
     async def create_or_update(
         self,
         objects: list[Entity],
@@ -132,7 +203,13 @@ class SQLAlchemyGenericRepository(GenericRepositoryInterface[BaseEntity]):
         excluded_fields: Optional[Iterable[str]] = None,
         id_column: Optional[Any] = None,
         batch_size: Optional[int] = None,
+        only_changed_fields: Optional[Iterable[str]] = None,
     ) -> list[Entity]:
+        """
+        Обновление объектов по id_column.
+        only_changed_fields - строка обновляется, только если значение хотя бы одного из этих полей отличается
+        от значения в БД (неизменившиеся строки не перезаписываются и не создают мертвых версий)
+        """
 
         if not objects:
             return objects
@@ -174,6 +251,15 @@ class SQLAlchemyGenericRepository(GenericRepositoryInterface[BaseEntity]):
             .where(getattr(self.model_class, id_column) == bindparam("_id"))  # Динамически выбираем колонку
             .values({field: bindparam(field) for field in fields_to_update})
         )
+        if only_changed_fields:
+            query = query.where(
+                or_(
+                    *[
+                        getattr(self.model_class, field).is_distinct_from(bindparam(field))
+                        for field in only_changed_fields
+                    ]
+                )
+            )
 
         connection = await self._session.connection()
         await connection.execute(query, values)
@@ -219,6 +305,18 @@ class SQLAlchemyGenericRepository(GenericRepositoryInterface[BaseEntity]):
         model_data = {col.key: data[col.key] for col in mapper.columns if col.key in data}
         return self.model_class(**model_data)
 
+    # noinspection PyMethodMayBeStatic
+    def entity_to_record(self, entity: Entity, columns: list[str], now: datetime) -> tuple:
+        """Конвертация Entity -> кортеж значений колонок для COPY (server_default при COPY не применяются)"""
+        return tuple(
+            (
+                getattr(entity, column, None) or now
+                if column in ("created_at", "updated_at")
+                else getattr(entity, column, None)
+            )
+            for column in columns
+        )
+
     # noinspection PyMethodMayBeStatic
     def entity_to_dict(self, entity: Entity) -> dict:
         """Конвертация Entity -> Dict"""
@@ -1,7 +1,11 @@
 from typing import List, Optional
+from uuid import UUID
+
+from sqlalchemy import text
 
 from src.application.common.interfaces.repositories.swap import SwapRepositoryInterface
 from src.domain.entities.swap import Swap as SwapEntity
+from src.infra.db import queries
 from src.infra.db.sqlalchemy.models.swap import Swap
 
 from .generic_repository import SQLAlchemyGenericRepository
@@ -34,3 +38,29 @@ class SQLAlchemySwapRepository(
     ) -> list[SwapEntity]:
         """Возвращает соседние сделки (buy/sell) по токену в заданном диапазоне блоков"""
         raise NotImplementedError
+
+    async def get_first_trades_neighbors(
+        self,
+        wallet_ids: List[UUID],
+        blocks_before: int = 3,
+        blocks_after: int = 3,
+        max_tokens: int = 1000,
+    ) -> List[dict]:
+        """
+        Первые покупка и продажа каждого из кошельков по его токенам и первые сделки того же типа других кошельков
+        в диапазоне блоков вокруг них - одним запросом по всем кошелькам и токенам.
+        Строки: wallet_id, token_id, event_type, anchor_block_id (блок первой сделки кошелька),
+        related_wallet_id, block_id, timestamp
+        """
+        if not wallet_ids:
+            return []
+        result = await self._session.execute(
+            text(queries.GET_FIRST_TRADES_NEIGHBORS),
+            {
+                "wallet_ids": list(wallet_ids),
+                "blocks_before": blocks_before,
+                "blocks_after": blocks_after,
+                "max_tokens": max_tokens,
+            },
+        )
+        return result.mappings().all()
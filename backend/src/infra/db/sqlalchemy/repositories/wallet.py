@@ -1,8 +1,11 @@
 import logging
+from datetime import datetime
 from typing import Optional
 from uuid import UUID
 
-from sqlalchemy import and_, select, text
+import pytz
+from sqlalchemy import and_, bindparam, delete, func, select, text, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import selectinload
 
 from src.application.common.interfaces.repositories.wallet import (
@@ -18,22 +21,28 @@ from src.application.common.interfaces.repositories.wallet import (
 from src.domain.entities.wallet import Wallet as WalletEntity
 from src.domain.entities.wallet import WalletCopyable as WalletCopyableEntity
 from src.domain.entities.wallet import WalletFiltered as WalletFilteredEntity
+from src.domain.entities.wallet import WalletRelation as WalletRelationEntity
+from src.domain.entities.wallet import WalletRelationsDirtyBlocks as WalletRelationsDirtyBlocksEntity
 from src.domain.entities.wallet import WalletStatistic7d as WalletStatistic7dEntity
 from src.domain.entities.wallet import WalletStatistic30d as WalletStatistic30dEntity
 from src.domain.entities.wallet import WalletStatisticAll as WalletStatisticAllEntity
 from src.domain.entities.wallet import WalletStatisticBuyPriceGt15k7d as WalletStatisticBuyPriceGt15k7dEntity
 from src.domain.entities.wallet import WalletStatisticBuyPriceGt15k30d as WalletStatisticBuyPriceGt15k30dEntity
 from src.domain.entities.wallet import WalletStatisticBuyPriceGt15kAll as WalletStatisticBuyPriceGt15kAllEntity
+from src.domain.entities.wallet import WalletStatsDirty as WalletStatsDirtyEntity
 from src.domain.entities.wallet import WalletToken as WalletTokenEntity
 from src.infra.db import queries
 from src.infra.db.sqlalchemy.models import (
     Wallet,
+    WalletRelation,
+    WalletRelationsDirtyBlocks,
     WalletStatistic7d,
     WalletStatistic30d,
     WalletStatisticAll,
     WalletStatisticBuyPriceGt15k7d,
     WalletStatisticBuyPriceGt15k30d,
     WalletStatisticBuyPriceGt15kAll,
+    WalletStatsDirty,
     WalletToken,
 )
 
@@ -97,6 +106,128 @@ class SQLAlchemyWalletCopyableRepository(SQLAlchemyGenericRepository):
     entity_class = WalletCopyableEntity
 
 
+class SQLAlchemyWalletStatsDirtyRepository(SQLAlchemyGenericRepository):
+    """Очередь кошельков, которым нужно пересчитать статистику в первую очередь"""
+
+    model_class = WalletStatsDirty
+    entity_class = WalletStatsDirtyEntity
+
+    async def mark_wallets(self, wallet_ids: list[UUID], batch_size: int = 30000) -> None:
+        """Добавляет кошельки в очередь, у уже стоящих в очереди обновляет отметку"""
+        if not wallet_ids:
+            return
+        # Сортируем, чтобы избежать дедлоков при параллельной вставке
+        values = [{"wallet_id": wallet_id} for wallet_id in sorted(set(wallet_ids))]
+        stmt = insert(self.model_class)
+        stmt = stmt.on_conflict_do_update(index_elements=["wallet_id"], set_={"marked_at": func.now()})
+        connection = await self._session.connection()
+        for i in range(0, len(values), batch_size):
+            await connection.execute(stmt, values[i : i + batch_size])
+
+    async def get_oldest(self, count: int) -> list[WalletStatsDirtyEntity]:
+        stmt = select(self.model_class).order_by(self.model_class.marked_at).limit(count)
+        connection = await self._session.connection()
+        result = await connection.execute(stmt)
+        return [self.entity_class(**row) for row in result.mappings().all()]
+
+    async def delete_processed(self, objects: list[WalletStatsDirtyEntity]) -> None:
+        """Удаляет обработанные записи, если кошелек не был отмечен заново после их получения"""
+        if not objects:
+            return
+        stmt = delete(self.model_class).where(
+            self.model_class.wallet_id == bindparam("_wallet_id"),
+            self.model_class.marked_at == bindparam("_marked_at"),
+        )
+        connection = await self._session.connection()
+        await connection.execute(
+            stmt,
+            [{"_wallet_id": obj.wallet_id, "_marked_at": obj.marked_at} for obj in objects],
+        )
+
+
+class SQLAlchemyWalletRelationRepository(SQLAlchemyGenericRepository):
+    model_class = WalletRelation
+    entity_class = WalletRelationEntity
+
+    async def get_wallets_with_first_trades_in_blocks(
+        self,
+        from_block_id: int,
+        until_block_id: int,
+        max_tokens: int,
+    ) -> list[UUID]:
+        """
+        Кошельки, у которых первая покупка или продажа токена в диапазоне блоков (from_block_id, until_block_id],
+        и кошельки со свапами в диапазоне, у которых больше max_tokens токенов (учитываемые токены сменились)
+        """
+        result = await self._session.execute(
+            text(queries.GET_WALLETS_WITH_FIRST_TRADES_IN_BLOCKS),
+            {"from_block_id": from_block_id, "until_block_id": until_block_id, "max_tokens": max_tokens},
+        )
+        return list(result.scalars().all())
+
+    async def replace_wallets_relations(
+        self,
+        wallet_ids: list[UUID],
+        relations: list[WalletRelationEntity],
+        batch_size: int = 10000,
+    ) -> None:
+        """Заменяет все связи кошельков новыми"""
+        if not wallet_ids:
+            return
+        await self._session.execute(delete(self.model_class).where(self.model_class.wallet_id.in_(sorted(wallet_ids))))
+        relations = sorted(relations, key=lambda relation: (relation.wallet_id, relation.related_wallet_id))
+        await self.bulk_create(relations, batch_size=batch_size)
+
+
+class SQLAlchemyWalletRelationsDirtyBlocksRepository(SQLAlchemyGenericRepository):
+    """Очередь диапазонов блоков со свапами, по которым нужно пересчитать wallet_relation"""
+
+    model_class = WalletRelationsDirtyBlocks
+    entity_class = WalletRelationsDirtyBlocksEntity
+
+    async def mark_blocks(self, block_ids: list[int | None]) -> None:
+        """Добавляет в очередь диапазон блоков загруженных или удаленных свапов"""
+        block_ids = [block_id for block_id in block_ids if block_id is not None]
+        if not block_ids:
+            return
+        await self._session.execute(
+            insert(self.model_class).values(from_block_id=min(block_ids) - 1, until_block_id=max(block_ids))
+        )
+
+    async def get_all_ordered(self) -> list[WalletRelationsDirtyBlocksEntity]:
+        stmt = select(self.model_class).order_by(self.model_class.from_block_id, self.model_class.until_block_id)
+        result = await self._session.execute(stmt)
+        return [self.model_to_entity(instance) for instance in result.scalars().all()]
+
+    async def replace(
+        self,
+        objects: list[WalletRelationsDirtyBlocksEntity],
+        ranges: list[tuple[int, int]],
+    ) -> list[WalletRelationsDirtyBlocksEntity]:
+        """Заменяет записи очереди диапазонами ranges (объединенными), возвращает новые записи"""
+        await self.delete_by_ids([obj.id for obj in objects])
+        if not ranges:
+            return []
+        instances = await self._session.scalars(
+            insert(self.model_class).returning(self.model_class),
+            [
+                {"from_block_id": from_block_id, "until_block_id": until_block_id}
+                for from_block_id, until_block_id in ranges
+            ],
+        )
+        return [self.model_to_entity(instance) for instance in instances.all()]
+
+    async def save_progress(self, obj: WalletRelationsDirtyBlocksEntity) -> None:
+        """Сохраняет начало еще не пересчитанной части диапазона"""
+        await self._session.execute(
+            update(self.model_class).where(self.model_class.id == obj.id).values(from_block_id=obj.from_block_id)
+        )
+
+    async def delete_by_ids(self, ids: list[UUID]) -> None:
+        if ids:
+            await self._session.execute(delete(self.model_class).where(self.model_class.id.in_(ids)))
+
+
 class SQLAlchemyWalletFilteredRepository(SQLAlchemyGenericRepository):
     model_class = WalletFiltered
     entity_class = WalletFilteredEntity
@@ -116,6 +247,15 @@ class SQLAlchemyWalletTokenRepository(
         result = await connection.execute(query)
         return [self.entity_class(**row) for row in result.mappings().all()]
 
+    async def get_wallet_tokens_rows_by_wallets_list(self, wallet_ids: list[UUID], fields: list[str]) -> list[tuple]:
+        """Только указанные поля WalletToken кортежами, без построения сущностей (для колоночного пересчета)"""
+        query = select(*[getattr(self.model_class, field) for field in fields]).where(
+            self.model_class.wallet_id.in_(wallet_ids)
+        )
+        connection = await self._session.connection()
+        result = await connection.execute(query)
+        return result.all()
+
     async def get_wallet_tokens_by_wallets_list_for_buygt15k_statistic(
         self, wallet_ids: list[UUID]
     ) -> list[WalletTokenEntity]:
@@ -147,6 +287,26 @@ class SQLAlchemyWalletTokenRepository(
             await connection.execute(stmt, values)
         return objects
 
+    async def bulk_update_or_create_wallet_token_with_merge_via_staging(
+        self,
+        objects: list[WalletTokenEntity],
+        staging_table_name: str = "wallet_token_staging",
+    ) -> list[WalletTokenEntity]:
+        """
+        Массовая вставка записей со слиянием при конфликте через временную таблицу:
+        COPY всех записей во временную таблицу и один INSERT ... SELECT ... ON CONFLICT, отсортированный по ключу.
+        Связки кошелек-токен в objects должны быть уникальны
+        """
+        if not objects:
+            return []
+        connection = await self._session.connection()
+        await connection.execute(text(queries.CREATE_WALLET_TOKEN_STAGING_TABLE.format(table_name=staging_table_name)))
+        await connection.execute(text(f"TRUNCATE {staging_table_name}"))
+        await self.bulk_copy(objects, table_name=staging_table_name)
+        stmt = get_bulk_update_or_create_wallet_token_with_merge_stmt(from_table=staging_table_name)
+        await connection.execute(stmt)
+        return objects
+
 
 class SQLAlchemyWalletRepository(
     SQLAlchemyGenericRepository,
@@ -155,6 +315,45 @@ class SQLAlchemyWalletRepository(
     model_class = Wallet
     entity_class = WalletEntity
 
+    async def recalculate_wallets_statistics(self, wallet_ids: list[UUID], current_datetime: datetime) -> None:
+        """
+        Пересчет статистики кошельков за 7д/30д/все время целиком в БД: по одному INSERT ... SELECT ... GROUP BY
+        на период, без передачи WalletToken в приложение. Вместе со статистикой за все время обновляются
+        last_stats_check и статусы скамера/бота кошельков
+        """
+        connection = await self._session.connection()
+        for stats_model, days in ((WalletStatistic7d, 7), (WalletStatistic30d, 30), (WalletStatisticAll, 0)):
+            columns = [
+                column.name
+                for column in stats_model.__table__.columns
+                if column.name not in ("wallet_id", "created_at", "updated_at", "stats_fingerprint")
+            ]
+            query = queries.UPSERT_WALLETS_PERIOD_STATISTIC.format(
+                table_name=stats_model.__tablename__,
+                period_condition=queries.WALLET_TOKEN_PERIOD_CONDITION.format(days=days) if days else "TRUE",
+                wallet_update=queries.UPDATE_WALLETS_STATUSES_CTE if not days else "",
+                columns=", ".join(columns),
+                # Отпечаток сбрасывается, следующий пересчет в приложении перезапишет строку
+                set_columns=", ".join(
+                    [f"{column} = EXCLUDED.{column}" for column in columns] + ["stats_fingerprint = NULL"]
+                ),
+            )
+            await connection.execute(
+                text(query),
+                {"wallet_ids": sorted(wallet_ids), "current_datetime": current_datetime},
+            )
+
+    async def update_last_stats_check(self, wallet_ids: list[UUID], last_stats_check: datetime) -> None:
+        """Отметка времени пересчета статистики одним запросом"""
+        if not wallet_ids:
+            return
+        stmt = (
+            update(self.model_class)
+            .where(self.model_class.id.in_(sorted(wallet_ids)))
+            .values(last_stats_check=last_stats_check)
+        )
+        await self._session.execute(stmt)
+
     async def get_by_address(self, address: str) -> WalletEntity | None:
         stmt = select(self.model_class).where(self.model_class.address == address)
         result = await self._session.execute(stmt)
@@ -163,6 +362,11 @@ class SQLAlchemyWalletRepository(
             return None
         return self.model_to_entity(instance)
 
+    async def get_addresses_by_ids(self, wallet_ids: list[UUID]) -> list[str]:
+        stmt = select(self.model_class.address).where(self.model_class.id.in_(wallet_ids))
+        result = await self._session.execute(stmt)
+        return list(result.scalars().all())
+
     async def get_wallets_for_update_stats(self, count: int = 1) -> list[WalletEntity]:
         _query = queries.GET_WALLETS_FOR_UPDATE_STATS.format(count=count)
         query = text(_query)
@@ -170,6 +374,48 @@ class SQLAlchemyWalletRepository(
         result = await connection.execute(query)
         return [self.entity_class(**row) for row in result.mappings().all()]
 
+    async def get_wallets_for_update_stats_page(
+        self,
+        count: int,
+        checked_before: datetime,
+        after: tuple[datetime | None, UUID] | None = None,
+        expired_periods_only: bool = False,
+    ) -> tuple[list[WalletEntity], tuple[datetime | None, UUID] | None]:
+        """
+        Порция кошельков для пересчета статистики по keyset: сначала ни разу не пересчитанные, затем давно
+        не пересчитанные или (expired_periods_only) с вышедшим из периода 7д/30д токеном.
+        Каждая порция - отдельный запрос, поэтому обход не держит снимок БД открытым.
+        checked_before - начало обхода, after - ключ последнего кошелька предыдущей порции.
+        Возвращает кошельки и ключ для следующей порции
+        """
+        wallets = []
+        if after is None or after[0] is None:
+            result = await self._session.execute(
+                text(queries.GET_NOT_CHECKED_WALLETS_IDS_PAGE),
+                {"after_id": after[1] if after else UUID(int=0), "count": count},
+            )
+            wallets = [self.entity_class(**row) for row in result.mappings().all()]
+            if wallets:
+                after = (None, wallets[-1].id)
+            if len(wallets) == count:
+                return wallets, after
+            after = (datetime.min.replace(tzinfo=pytz.UTC), UUID(int=0))
+
+        sort_column = "next_period_expiry_at" if expired_periods_only else "last_stats_check"
+        result = await self._session.execute(
+            text(queries.GET_CHECKED_WALLETS_IDS_PAGE.format(sort_column=sort_column)),
+            {
+                "checked_before": checked_before,
+                "after_value": after[0],
+                "after_id": after[1],
+                "count": count - len(wallets),
+            },
+        )
+        checked_wallets = [self.entity_class(**row) for row in result.mappings().all()]
+        if checked_wallets:
+            after = (getattr(checked_wallets[-1], sort_column), checked_wallets[-1].id)
+        return wallets + checked_wallets, after
+
     async def get_wallets_for_buygt15k_statistic(self) -> list[WalletEntity]:
         """Возвращает подходящие кошельки для подсчета статистики buygt15k"""
         query = (
@@ -193,6 +439,33 @@ class SQLAlchemyWalletRepository(
         result = await connection.execute(query)
         return [self.entity_class(**row) for row in result.mappings().all()]
 
+    async def get_related_wallets(self, wallet_id: UUID) -> list[dict]:
+        query = (
+            select(
+                self.model_class.address,
+                self.model_class.last_activity_timestamp,
+                WalletRelation.last_intersected_tokens_trade_timestamp,
+                WalletStatistic30d.total_profit_usd.label("total_profit_usd_30d"),
+                WalletStatistic30d.total_profit_multiplier.label("total_profit_multiplier_30d"),
+                WalletStatisticAll.total_token.label("total_token_count"),
+                WalletRelation.before_count,
+                WalletRelation.after_count,
+                WalletRelation.same_count,
+                WalletRelation.mixed_count,
+            )
+            .join(self.model_class, self.model_class.id == WalletRelation.related_wallet_id)
+            .outerjoin(WalletStatisticAll, WalletStatisticAll.wallet_id == self.model_class.id)
+            .outerjoin(WalletStatistic30d, WalletStatistic30d.wallet_id == self.model_class.id)
+            .where(
+                WalletRelation.wallet_id == wallet_id,
+                self.model_class.is_bot == False,
+            )
+            .order_by(WalletRelation.last_intersected_tokens_trade_timestamp.desc().nulls_last())
+        )
+        connection = await self._session.connection()
+        result = await connection.execute(query)
+        return [dict(row) for row in result.mappings().all()]
+
     async def get_wallets_for_copytraders_statistic(self) -> list[WalletEntity]:
         """Возвращает подходящие кошельки для подсчета статистики copytraders"""
         query = (
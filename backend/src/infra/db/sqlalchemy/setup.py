@@ -1,3 +1,4 @@
+import asyncio
 from typing import AsyncIterable
 
 from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
@@ -12,6 +13,10 @@ engine = sa_create_async_engine(
     max_overflow=config.db.max_size,
 )
 
+# Одновременных сессий партиций кошельков на процесс (locks.gather_partitions): половина пула,
+# остальные соединения - запросам без партиций (свапы, токены, чтение кошельков)
+partition_sessions_semaphore = asyncio.Semaphore(max((config.db.min_size + config.db.max_size) // 2, 1))
+
 
 AsyncSessionMaker = async_sessionmaker(
     bind=engine,
@@ -270,6 +270,8 @@ class WalletToken(Model, UUIDIDMixin, TimestampsMixin):
     )
     first_sell_timestamp = fields.DatetimeField(null=True, description="Время 1-й продажи")
     last_activity_timestamp = fields.DatetimeField(null=True, description="Последняя активность")
+    first_buy_block_id = fields.BigIntField(null=True, description="Блок 1-й покупки")
+    first_sell_block_id = fields.BigIntField(null=True, description="Блок 1-й продажи")
     total_profit_usd = CorrectedDecimalField(
         default=0,
         max_digits=40,
@@ -121,8 +121,8 @@ class TortoiseGenericRepository(GenericRepositoryInterface[BaseEntity]):
         return await Tortoise.get_connection("default").execute_query(query)
 
     # noinspection PyMethodMayBeStatic
-    async def _execute_query_dict(self, query) -> list[dict]:
-        return await Tortoise.get_connection("default").execute_query_dict(query)
+    async def _execute_query_dict(self, query, values: Optional[list] = None) -> list[dict]:
+        return await Tortoise.get_connection("default").execute_query_dict(query, values)
 
     # noinspection PyMethodMayBeStatic
     def _build_query(
@@ -128,6 +128,9 @@ class TortoiseWalletRepository(
     async def get_wallets_for_buygt15k_statistic(self):
         raise NotImplementedError
 
+    async def get_related_wallets(self, wallet_id: UUID) -> list[dict]:
+        return await self._execute_query_dict(queries.GET_WALLET_RELATED_WALLETS, [wallet_id])
+
     # noinspection PyMethodMayBeStatic
     async def get_wallets_by_token_addresses(
         self,
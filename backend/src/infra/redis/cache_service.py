@@ -1,14 +1,78 @@
 import asyncio
 import json
-from typing import Any, Optional
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Iterable, Optional
 
 import redis.asyncio as redis
 from redis.asyncio import Redis
 
+logger = logging.getLogger(__name__)
+
+# Снимает блокировку, только если ее держит тот же владелец (блокировка могла истечь и достаться другому)
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Записывает значение, только если ключ не сбрасывался с начала загрузки (поколение ключа не изменилось).
+# KEYS: ключ записи, ключ поколения; ARGV: поколение на начало загрузки, значение, ttl (с)
+SET_IF_GENERATION_SCRIPT = """
+if (redis.call("get", KEYS[2]) or "0") == ARGV[1] then
+    redis.call("set", KEYS[1], ARGV[2], "EX", ARGV[3])
+    return 1
+end
+return 0
+"""
+
+# Удаляет записи и увеличивает поколения их ключей - загрузки, начатые до сброса, не запишут устаревшее значение.
+# KEYS: ключи записей, затем ключи их поколений; ARGV: ttl поколения (с)
+INVALIDATE_SCRIPT = """
+local count = #KEYS / 2
+for i = 1, count do
+    redis.call("unlink", KEYS[i])
+    redis.call("incr", KEYS[count + i])
+    redis.call("expire", KEYS[count + i], ARGV[1])
+end
+return count
+"""
+
 
 class RedisCacheService:
-    def __init__(self, redis_client: Redis):
+    """
+    Кеш в Redis. Для дорогих значений - get_or_load: двухуровневый кеш (LRU в процессе перед Redis),
+    одна загрузка значения на ключ (single-flight) и stale-while-revalidate
+    """
+
+    LOCK_KEY = "cache_lock:{key}"
+    GENERATION_KEY = "cache_generation:{key}"
+
+    def __init__(
+        self,
+        redis_client: Redis,
+        local_max_size: int = 1024,
+        local_ttl_seconds: float = 5,
+        lock_ttl_seconds: float = 30,
+        lock_wait_seconds: float = 10,
+        lock_poll_seconds: float = 0.05,
+        generation_ttl_seconds: int = 3600,
+    ):
         self._redis = redis_client
+        self._local_max_size = local_max_size
+        self._local_ttl_seconds = local_ttl_seconds
+        self._lock_ttl_seconds = lock_ttl_seconds
+        self._lock_wait_seconds = lock_wait_seconds
+        self._lock_poll_seconds = lock_poll_seconds
+        # Поколение ключа должно жить дольше загрузки, которая могла начаться до сброса
+        self._generation_ttl_seconds = generation_ttl_seconds
+        # key -> (до какого времени запись локального кеша действительна, запись)
+        self._local: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._loading: dict[str, asyncio.Task] = {}
+        self._refreshing: dict[str, asyncio.Task] = {}
 
     async def get(self, key: str) -> Optional[Any]:
         data = await self._redis.get(key)
@@ -18,8 +82,161 @@ class RedisCacheService:
         await self._redis.setex(key, expire, json.dumps(value))
 
     async def delete(self, key: str):
-        await self._redis.delete(key)
+        await self.invalidate([key])
+
+    async def invalidate(self, keys: Iterable[str], chunk_size: int = 1000) -> None:
+        """
+        Удаляет записи кеша. Загрузки этих ключей, начатые до сброса, свое значение в кеш не запишут.
+        Локальные кеши других процессов не сбрасываются - их записи живут не дольше local_ttl_seconds
+        """
+        keys = list(keys)
+        for key in keys:
+            self._local.pop(key, None)
+        for i in range(0, len(keys), chunk_size):
+            chunk = keys[i : i + chunk_size]
+            generation_keys = [self.GENERATION_KEY.format(key=key) for key in chunk]
+            await self._redis.eval(
+                INVALIDATE_SCRIPT, len(chunk) * 2, *chunk, *generation_keys, self._generation_ttl_seconds
+            )
 
     async def clear_all(self):
         """Очищает весь кеш (осторожно!)"""
+        self._local.clear()
         await self._redis.flushdb()
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: int,
+        stale_ttl: int = 0,
+    ) -> Any:
+        """
+        Значение из кеша, при промахе - результат loader (сохраняется в кеш).
+        Значение свежее ttl секунд, затем еще stale_ttl секунд отдается устаревшим, пока одна фоновая задача
+        его обновляет. При промахе loader выполняется один раз на ключ: в процессе - общей задачей,
+        между процессами - под блокировкой в Redis, остальные ждут результат.
+        loader не должен зависеть от объектов запроса (вызывается и после ответа, в фоне)
+        """
+        entry = await self._get_entry(key)
+        if entry is not None:
+            if entry["fresh_until"] <= time.time():
+                self._refresh_in_background(key, loader, ttl, stale_ttl)
+            return entry["value"]
+
+        task = self._loading.get(key)
+        if task is None:
+            task = self._start_task(self._loading, key, self._load(key, loader, ttl, stale_ttl))
+        # shield - отмена одного запроса не отменяет загрузку, которую ждут другие
+        return await asyncio.shield(task)
+
+    def _start_task(self, tasks: dict[str, asyncio.Task], key: str, coro: Awaitable) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        tasks[key] = task
+        task.add_done_callback(lambda t: tasks.pop(key) if tasks.get(key) is t else None)
+        return task
+
+    async def _get_entry(self, key: str) -> Optional[dict]:
+        now = time.time()
+        local = self._local.get(key)
+        if local is not None:
+            local_until, entry = local
+            if local_until > now:
+                self._local.move_to_end(key)
+                return entry
+            del self._local[key]
+
+        data = await self._redis.get(key)
+        if not data:
+            return None
+        entry = json.loads(data)
+        self._set_local(key, entry)
+        return entry
+
+    def _set_local(self, key: str, entry: dict) -> None:
+        if not self._local_max_size:
+            return
+        local_until = min(time.time() + self._local_ttl_seconds, entry["stale_until"])
+        self._local[key] = (local_until, entry)
+        self._local.move_to_end(key)
+        while len(self._local) > self._local_max_size:
+            self._local.popitem(last=False)
+
+    async def _set_entry(self, key: str, value: Any, ttl: int, stale_ttl: int, generation: str) -> None:
+        now = time.time()
+        entry = {"value": value, "fresh_until": now + ttl, "stale_until": now + ttl + stale_ttl}
+        is_set = await self._redis.eval(
+            SET_IF_GENERATION_SCRIPT,
+            2,
+            key,
+            self.GENERATION_KEY.format(key=key),
+            generation,
+            json.dumps(entry),
+            ttl + stale_ttl,
+        )
+        if not is_set:
+            logger.debug(f"{key} сброшен во время загрузки, значение не сохраняется")
+            return
+        self._set_local(key, entry)
+
+    async def _get_generation(self, key: str) -> str:
+        return await self._redis.get(self.GENERATION_KEY.format(key=key)) or "0"
+
+    async def _acquire_lock(self, key: str) -> Optional[str]:
+        token = str(uuid.uuid4())
+        lock_ms = int(self._lock_ttl_seconds * 1000)
+        if await self._redis.set(self.LOCK_KEY.format(key=key), token, nx=True, px=lock_ms):
+            return token
+        return None
+
+    async def _release_lock(self, key: str, token: str) -> None:
+        await self._redis.eval(RELEASE_LOCK_SCRIPT, 1, self.LOCK_KEY.format(key=key), token)
+
+    async def _load_and_set(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: int, stale_ttl: int) -> Any:
+        generation = await self._get_generation(key)
+        value = await loader()
+        await self._set_entry(key, value, ttl, stale_ttl, generation)
+        return value
+
+    async def _load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: int, stale_ttl: int) -> Any:
+        deadline = time.monotonic() + self._lock_wait_seconds
+        while True:
+            token = await self._acquire_lock(key)
+            if token:
+                try:
+                    return await self._load_and_set(key, loader, ttl, stale_ttl)
+                finally:
+                    await self._release_lock(key, token)
+
+            # Значение загружает другой процесс - ждем, пока оно появится в Redis
+            await asyncio.sleep(self._lock_poll_seconds)
+            data = await self._redis.get(key)
+            if data:
+                entry = json.loads(data)
+                self._set_local(key, entry)
+                return entry["value"]
+            if time.monotonic() > deadline:
+                logger.warning(f"Не дождались загрузки {key} другим процессом, загружаем сами")
+                return await self._load_and_set(key, loader, ttl, stale_ttl)
+
+    def _refresh_in_background(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: int,
+        stale_ttl: int,
+    ) -> None:
+        if key in self._refreshing or key in self._loading:
+            return
+        self._start_task(self._refreshing, key, self._refresh(key, loader, ttl, stale_ttl))
+
+    async def _refresh(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: int, stale_ttl: int) -> None:
+        token = await self._acquire_lock(key)
+        if not token:
+            return  # Обновляет другой процесс
+        try:
+            await self._load_and_set(key, loader, ttl, stale_ttl)
+        except Exception as e:
+            logger.error(f"Не удалось обновить {key} в фоне: {e}")
+        finally:
+            await self._release_lock(key, token)
@@ -0,0 +1,39 @@
+from redis.asyncio import Redis
+
+
+class RedisCopyableWalletsProgress:
+    """
+    Прогресс поиска копирующих кошельков для обновления статистики copyable.
+    Хранит обработанные кошельки-кандидаты и найденных у них копировщиков, чтобы прерванный запуск продолжился
+    с необработанных кандидатов. Прогресс старше ttl_seconds считается устаревшим и истекает
+    """
+
+    PROCESSED_KEY = "copyable_wallets:processed"
+    COPYING_KEY = "copyable_wallets:copying"
+
+    def __init__(self, redis: Redis, ttl_seconds: int = 43200):
+        self._redis = redis
+        self._ttl_seconds = ttl_seconds
+
+    async def get_processed(self) -> set[str]:
+        """Кандидаты, уже обработанные в текущем запуске"""
+        return await self._redis.smembers(self.PROCESSED_KEY)
+
+    async def get_copying(self) -> set[str]:
+        """Найденные копирующие кошельки всех обработанных кандидатов"""
+        return await self._redis.smembers(self.COPYING_KEY)
+
+    async def mark_processed(self, address: str, copying_addresses: list[str]) -> None:
+        """Отмечает кандидата обработанным вместе с его копировщиками (атомарно)"""
+        async with self._redis.pipeline(transaction=True) as pipe:
+            if copying_addresses:
+                pipe.sadd(self.COPYING_KEY, *copying_addresses)
+            pipe.sadd(self.PROCESSED_KEY, address)
+            # Срок отсчитывается от последнего обработанного кандидата
+            pipe.expire(self.COPYING_KEY, self._ttl_seconds)
+            pipe.expire(self.PROCESSED_KEY, self._ttl_seconds)
+            await pipe.execute()
+
+    async def clear(self) -> None:
+        """Сбрасывает прогресс после успешного завершения запуска"""
+        await self._redis.delete(self.PROCESSED_KEY, self.COPYING_KEY)
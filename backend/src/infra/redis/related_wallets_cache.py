@@ -0,0 +1,20 @@
+import logging
+from typing import Iterable
+
+from .cache_service import RedisCacheService
+
+logger = logging.getLogger(__name__)
+
+# Ключ кеша ответа API со связанными кошельками (сбрасывается загрузчиком свапов и пересчетом wallet_relation)
+RELATED_WALLETS_CACHE_KEY = "wallet_related_wallets:{address}"
+
+
+async def invalidate_related_wallets_cache(cache_service: RedisCacheService, addresses: Iterable[str]) -> None:
+    """
+    Сбрасывает закешированные связанные кошельки. Ошибка Redis не прерывает вызывающий процесс -
+    несброшенные записи истекут по ttl
+    """
+    try:
+        await cache_service.invalidate(RELATED_WALLETS_CACHE_KEY.format(address=address) for address in addresses)
+    except Exception as e:
+        logger.error(f"Не удалось сбросить кеш связанных кошельков: {e}")
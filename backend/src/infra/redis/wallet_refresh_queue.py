@@ -0,0 +1,109 @@
+import uuid
+
+from redis.asyncio import Redis
+
+# Добавление кошелька одним скриптом: проверка ожидания, открытие окна батча и добавление в батч.
+# Выполняется атомарно относительно POP_BATCH_SCRIPT, поэтому кошелек не может попасть в уже забранный батч
+# KEYS: текущий батч, отметка ожидания кошелька; ARGV: адрес, id нового батча, окно (мс), ttl ожидания (с),
+# префикс ключа батча. Возвращает {id батча, id нового батча или false}
+ADD_SCRIPT = """
+local pending_batch_id = redis.call("get", KEYS[2])
+if pending_batch_id then
+    return {pending_batch_id, false}
+end
+local batch_id = redis.call("get", KEYS[1])
+local new_batch_id = false
+if not batch_id then
+    batch_id = ARGV[2]
+    new_batch_id = batch_id
+    redis.call("set", KEYS[1], batch_id, "PX", ARGV[3])
+end
+redis.call("set", KEYS[2], batch_id, "EX", ARGV[4])
+local batch_key = ARGV[5] .. batch_id
+redis.call("sadd", batch_key, ARGV[1])
+redis.call("expire", batch_key, ARGV[4])
+return {batch_id, new_batch_id}
+"""
+
+# Закрывает окно батча, если оно еще открыто (задача могла стартовать раньше его истечения), и забирает адреса.
+# KEYS: текущий батч, ключ батча; ARGV: id батча
+POP_BATCH_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    redis.call("del", KEYS[1])
+end
+local addresses = redis.call("smembers", KEYS[2])
+redis.call("del", KEYS[2])
+return addresses
+"""
+
+# Снимает отметки ожидания, которые еще указывают на этот батч (отметка могла истечь и достаться другому батчу).
+# KEYS: отметки ожидания кошельков; ARGV: id батча
+RELEASE_SCRIPT = """
+local released = 0
+for _, key in ipairs(KEYS) do
+    if redis.call("get", key) == ARGV[1] then
+        redis.call("del", key)
+        released = released + 1
+    end
+end
+return released
+"""
+
+
+class RedisWalletRefreshQueue:
+    """
+    Очередь запросов на обновление статистики кошельков с объединением запросов в батчи.
+    Запросы, пришедшие за окно window_seconds, попадают в один батч - одну задачу Celery (id батча = id задачи),
+    поэтому все запросившие получают один id задачи и общий результат.
+    Кошелек, который уже ждет обновления, повторно не добавляется - возвращается id его батча
+    """
+
+    CURRENT_BATCH_KEY = "wallet_refresh:current_batch"
+    BATCH_KEY = "wallet_refresh:batch:{batch_id}"
+    PENDING_KEY = "wallet_refresh:pending:{address}"
+
+    def __init__(self, redis: Redis, window_seconds: float = 2, pending_ttl_seconds: int = 600):
+        self._redis = redis
+        self._window_seconds = window_seconds
+        self._pending_ttl_seconds = pending_ttl_seconds
+
+    @property
+    def window_seconds(self) -> float:
+        return self._window_seconds
+
+    async def add(self, address: str) -> tuple[str, str | None]:
+        """
+        Добавляет кошелек в очередь.
+        Возвращает id батча, в котором кошелек будет обновлен, и id нового батча, если его открыл этот запрос
+        (такой батч нужно запланировать)
+        """
+        batch_id, new_batch_id = await self._redis.eval(
+            ADD_SCRIPT,
+            2,
+            self.CURRENT_BATCH_KEY,
+            self.PENDING_KEY.format(address=address),
+            address,
+            str(uuid.uuid4()),
+            int(self._window_seconds * 1000),
+            self._pending_ttl_seconds,
+            self.BATCH_KEY.format(batch_id=""),
+        )
+        return batch_id, new_batch_id
+
+    async def pop_batch(self, batch_id: str) -> list[str]:
+        """Закрывает окно батча (если оно еще открыто) и забирает адреса его кошельков"""
+        addresses = await self._redis.eval(
+            POP_BATCH_SCRIPT,
+            2,
+            self.CURRENT_BATCH_KEY,
+            self.BATCH_KEY.format(batch_id=batch_id),
+            batch_id,
+        )
+        return sorted(addresses)
+
+    async def release(self, batch_id: str, addresses: list[str]) -> None:
+        """Снимает отметку ожидания с обновленных кошельков батча (если их не успели перенести в другой батч)"""
+        if not addresses:
+            return
+        pending_keys = [self.PENDING_KEY.format(address=address) for address in addresses]
+        await self._redis.eval(RELEASE_SCRIPT, len(pending_keys), *pending_keys, batch_id)
@@ -33,6 +33,7 @@ from src.application.handlers.wallet.queries.get_wallet_related_wallets import G
 from src.application.handlers.wallet.queries.get_wallet_tokens import GetWalletTokensHandler
 from src.application.handlers.wallet.queries.get_wallets import GetWalletsHandler
 from src.infra.redis.cache_service import RedisCacheService
+from src.infra.redis.related_wallets_cache import RELATED_WALLETS_CACHE_KEY
 from src.presentation.api.schemas.response import ApiResponse
 
 logger = logging.getLogger(__name__)
@@ -130,13 +131,16 @@ async def get_wallet_related_wallets(
     handler: FromDishka[GetWalletRelatedWalletsHandler],
     cache_service: FromDishka[RedisCacheService],
 ) -> ApiResponse[WalletRelatedWalletsDTO]:
-    key = f"get_wallet_related_wallets:{address}"
-    result = await cache_service.get(key)
-
-    if result is None:
-        result = await handler(address)
-        await cache_service.set(key, result.model_dump(mode="json"), expire=300)
-
+    async def load_related_wallets() -> dict:
+        # Обработчик работает через пул соединений tortoise, а не сессию запроса - его можно вызывать в фоне
+        return (await handler(address)).model_dump(mode="json")
+
+    result = await cache_service.get_or_load(
+        RELATED_WALLETS_CACHE_KEY.format(address=address),
+        load_related_wallets,
+        ttl=300,
+        stale_ttl=3600,
+    )
     return ApiResponse(result=result)
 
 
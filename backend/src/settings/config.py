@@ -16,6 +16,7 @@ class DatabaseConfig(BaseModel):
     min_size: int = 10  # Минимальное количество соединений в пуле
     max_size: int = 200  # Максимальное количество соединений, которые могут быть "переполнены"
     max_queries: int = 50000  # for tortoise
+    wallet_lock_partitions: int = 0  # Кол-во партиций кошельков под advisory-блокировками (0 - без партиций)
 
     @property
     def url_tortoise(self) -> str:
@@ -55,6 +56,8 @@ class CeleryConfig(BaseModel):
 
 class RedisConfig(BaseModel):
     url: str
+    cache_local_max_size: int = 1024  # Записей в локальном (в процессе) кеше перед Redis
+    cache_local_ttl_seconds: float = 5  # Сколько запись живет в локальном кеше до перепроверки в Redis
 
 
 class SolanaConfig(BaseModel):
@@ -84,12 +87,54 @@ class SwapsLoaderConfig(BaseModel):
     # Swaps loader
     extractor_parallel_workers: int = 12
     extractor_period_interval_minutes: int = 60
+    extractor_adaptive_windows: bool = False  # Подбирать размер окон по плотности свапов
+    extractor_target_rows_per_query: int = 80000  # Целевое кол-во строк на один запрос к Flipside (лимит 100000)
+    extractor_min_period_interval_minutes: int = 5  # Границы размера окна при подборе по плотности свапов
+    extractor_max_period_interval_minutes: int = 360
+    extractor_prefetch_windows: int = 1  # Кол-во окон, собираемых наперед (пока идет преобразование и загрузка)
+    extractor_prefetch_max_mb: int = 4096  # Лимит памяти под собранные, но еще не загруженные свапы
     process_interval_seconds: int = 3600
+    extract_cache_dir: str | None = None  # Папка локального кеша собранных свапов (None - кеш отключен)
+    extract_cache_max_mb: int = 20480  # Макс. размер кеша, старые окна вытесняются
+    transformer_vectorized: bool = False  # Колоночное (numpy) преобразование свапов вместо построчного
+    transformer_workers: int = 1  # Кол-во процессов преобразования (1 - в потоке текущего процесса)
+    address_id_cache_max_size: int = 0  # Размер кеша адрес -> id кошельков/токенов в загрузчике (0 - без кеша)
+    address_id_cache_dir: str | None = None  # Папка для сохранения кеша адрес -> id между запусками
+    loader_returning_ids: bool = False  # id кошельков/токенов из upsert ... RETURNING вместо отдельного select
+    loader_copy_swaps: bool = False  # Загрузка свапов через COPY (binary) вместо INSERT
+    loader_staging_wallet_tokens: bool = False  # Слияние WalletToken через временную таблицу одним запросом
+    loader_mark_dirty_wallets: bool = False  # Ставить кошельки с новыми свапами в очередь на пересчет статистики
+    loader_invalidate_api_cache: bool = False  # Сбрасывать кеш API связанных кошельков у кошельков с новыми свапами
     persistent_mode: bool
     config_period_start_time: datetime
     config_period_end_time: datetime
 
 
+class WalletStatisticUpdaterConfig(BaseModel):
+    vectorized: bool = False  # Колоночный (numpy) пересчет статистики батчами вместо построчного
+    calculate_workers: int = 1  # Кол-во процессов пересчета (>1 - колоночный пересчет батчей в пуле процессов)
+    sql_aggregation: bool = False  # Пересчет статистики целиком в БД (INSERT ... SELECT ... GROUP BY по периодам)
+    receive_chunk_size: int = 5000  # Размер порции чтения кошельков (отдельный запрос на порцию)
+    received_queue_size: int = 20000  # Макс. кол-во прочитанных кошельков, ожидающих обработки
+    queue_max_wallets: int = 20000  # Макс. кол-во кошельков в очередях подгруженных/пересчитанных (0 - без лимита)
+    queue_max_tokens: int = 2_000_000  # Макс. кол-во токенов кошельков в этих очередях (0 - без лимита)
+    adaptive_parallel: bool = True  # Уменьшать кол-во параллельных запросов подгрузки/обновления при росте задержки БД
+    # Плановый пересчет только кошельков, у которых токен вышел из периода 7д/30д (по next_period_expiry_at),
+    # вместо всех по last_stats_check. Кошельки с новыми свапами - через swaps_loader.loader_mark_dirty_wallets
+    event_driven_schedule: bool = False
+    idle_sleep_seconds: int = 5  # Пауза, если пересчитывать нечего
+    refresh_batch_window_seconds: float = 2  # Окно объединения запросов на обновление статистики из API в один батч
+    refresh_pending_ttl_seconds: int = (
+        600  # Сколько кошелек считается ожидающим обновления (если задача не выполнилась)
+    )
+    relations_wallets_batch_size: int = 200  # Кол-во кошельков в одной транзакции пересчета wallet_relation
+    relations_blocks_chunk_size: int = 216_000  # Диапазон блоков за шаг пересчета wallet_relation (~сутки)
+    relations_invalidate_api_cache: bool = False  # Сбрасывать кеш API связанных кошельков с пересчитанными связями
+    copyable_concurrency: int = 16  # Параллельных поисков копировщиков (не больше пула соединений БД)
+    copyable_call_timeout_seconds: float = 30  # Таймаут поиска копировщиков одного кошелька
+    copyable_progress_ttl_seconds: int = 43200  # Сколько хранится прогресс прерванного запуска copyable
+
+
 class Config(BaseSettings):
     model_config = SettingsConfigDict(
         case_sensitive=False,
@@ -107,6 +152,7 @@ class Config(BaseSettings):
     telegram: TelegramConfig
     logs: LogsConfig
     swaps_loader: SwapsLoaderConfig
+    wallet_statistic_updater: WalletStatisticUpdaterConfig = WalletStatisticUpdaterConfig()
 
 
 config: Config = Config()
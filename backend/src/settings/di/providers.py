@@ -35,11 +35,7 @@ from src.infra.db.sqlalchemy.repositories import (
 )
 from src.infra.db.sqlalchemy.setup import AsyncSessionMaker
 from src.infra.db.sqlalchemy.uow import SQLAlchemyUnitOfWork
-from src.infra.db.tortoise.repositories import (
-    TortoiseSwapRepository,
-    TortoiseWalletRepository,
-    TortoiseWalletTokenRepository,
-)
+from src.infra.db.tortoise.repositories import TortoiseWalletRepository
 from src.infra.providers.password_hasher_argon import ArgonPasswordHasher
 from src.infra.redis.cache_service import RedisCacheService
 from src.settings import config
@@ -66,7 +62,13 @@ class AppProvider(Provider):
     def get_redis(self) -> Redis:
         return Redis.from_url(config.redis.url, decode_responses=True)
 
-    redis_cache_service = provide(RedisCacheService, scope=Scope.APP)
+    @provide(scope=Scope.APP)
+    def get_redis_cache_service(self, redis: Redis) -> RedisCacheService:
+        return RedisCacheService(
+            redis,
+            local_max_size=config.redis.cache_local_max_size,
+            local_ttl_seconds=config.redis.cache_local_ttl_seconds,
+        )
 
     # Auth
     @provide(scope=Scope.APP)
@@ -110,8 +112,6 @@ class AppProvider(Provider):
 class GetWalletRelatedWalletsHandlerProvider(Provider):
     scope = Scope.REQUEST
 
-    tortoise_swap_repository = provide(TortoiseSwapRepository, provides=SwapRepositoryInterface)
     tortoise_wallet_repository = provide(TortoiseWalletRepository, provides=WalletRepositoryInterface)
-    tortoise_wallet_token_repository = provide(TortoiseWalletTokenRepository, provides=WalletTokenRepositoryInterface)
 
     get_wallet_related_wallets_handler = provide(GetWalletRelatedWalletsHandler)
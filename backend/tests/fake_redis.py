@@ -0,0 +1,138 @@
+"""
+Асинхронный Redis в памяти для тестов (decode_responses=True): команды, которые используют src.infra.redis,
+и скрипты Lua этих модулей, повторенные на Python по шагам
+"""
+
+import time
+
+from src.infra.redis.cache_service import INVALIDATE_SCRIPT, RELEASE_LOCK_SCRIPT, SET_IF_GENERATION_SCRIPT
+from src.infra.redis.wallet_refresh_queue import ADD_SCRIPT, POP_BATCH_SCRIPT, RELEASE_SCRIPT
+
+
+class FakeRedis:
+    def __init__(self):
+        self._data: dict[str, str | set] = {}
+        self._expires_at: dict[str, float] = {}
+        self._scripts = {
+            RELEASE_LOCK_SCRIPT: self._release_lock_script,
+            SET_IF_GENERATION_SCRIPT: self._set_if_generation_script,
+            INVALIDATE_SCRIPT: self._invalidate_script,
+            ADD_SCRIPT: self._add_script,
+            POP_BATCH_SCRIPT: self._pop_batch_script,
+            RELEASE_SCRIPT: self._release_script,
+        }
+
+    def _get_value(self, key: str):
+        expires_at = self._expires_at.get(key)
+        if expires_at is not None and expires_at <= time.time():
+            self._data.pop(key, None)
+            self._expires_at.pop(key, None)
+        return self._data.get(key)
+
+    def _set_value(self, key: str, value, ex: float | None = None) -> None:
+        self._data[key] = value
+        if ex is None:
+            self._expires_at.pop(key, None)
+        else:
+            self._expires_at[key] = time.time() + ex
+
+    def _delete(self, *keys: str) -> int:
+        deleted = 0
+        for key in keys:
+            if self._get_value(key) is not None:
+                deleted += 1
+            self._data.pop(key, None)
+            self._expires_at.pop(key, None)
+        return deleted
+
+    def expire_now(self, key: str) -> None:
+        """Истечение срока ключа"""
+        self._delete(key)
+
+    def ttl(self, key: str) -> float | None:
+        if self._get_value(key) is None or key not in self._expires_at:
+            return None
+        return self._expires_at[key] - time.time()
+
+    # Команды (smembers до set - иначе в аннотациях класса set уже метод)
+    async def get(self, key: str):
+        return self._get_value(key)
+
+    async def smembers(self, key: str) -> set[str]:
+        return set(self._get_value(key) or set())
+
+    async def set(self, key: str, value, nx: bool = False, px: int | None = None, ex: int | None = None):
+        if nx and self._get_value(key) is not None:
+            return None
+        self._set_value(key, str(value), ex=px / 1000 if px is not None else ex)
+        return True
+
+    async def setex(self, key: str, seconds: int, value) -> bool:
+        self._set_value(key, str(value), ex=seconds)
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        return self._delete(*keys)
+
+    async def unlink(self, *keys: str) -> int:
+        return self._delete(*keys)
+
+    async def flushdb(self) -> None:
+        self._data.clear()
+        self._expires_at.clear()
+
+    async def eval(self, script: str, numkeys: int, *keys_and_args):
+        keys = [str(key) for key in keys_and_args[:numkeys]]
+        args = [str(arg) for arg in keys_and_args[numkeys:]]
+        return self._scripts[script](keys, args)
+
+    # Скрипты Lua
+    def _release_lock_script(self, keys: list[str], args: list[str]) -> int:
+        if self._get_value(keys[0]) == args[0]:
+            return self._delete(keys[0])
+        return 0
+
+    def _set_if_generation_script(self, keys: list[str], args: list[str]) -> int:
+        if (self._get_value(keys[1]) or "0") == args[0]:
+            self._set_value(keys[0], args[1], ex=float(args[2]))
+            return 1
+        return 0
+
+    def _invalidate_script(self, keys: list[str], args: list[str]) -> int:
+        count = len(keys) // 2
+        for key, generation_key in zip(keys[:count], keys[count:]):
+            self._delete(key)
+            self._set_value(generation_key, str(int(self._get_value(generation_key) or 0) + 1), ex=float(args[0]))
+        return count
+
+    def _add_script(self, keys: list[str], args: list[str]) -> list:
+        pending_batch_id = self._get_value(keys[1])
+        if pending_batch_id:
+            return [pending_batch_id, None]
+        batch_id = self._get_value(keys[0])
+        new_batch_id = None
+        if not batch_id:
+            batch_id = args[1]
+            new_batch_id = batch_id
+            self._set_value(keys[0], batch_id, ex=int(args[2]) / 1000)
+        self._set_value(keys[1], batch_id, ex=int(args[3]))
+        batch_key = args[4] + batch_id
+        members = self._get_value(batch_key) or set()
+        members.add(args[0])
+        self._set_value(batch_key, members, ex=int(args[3]))
+        return [batch_id, new_batch_id]
+
+    def _pop_batch_script(self, keys: list[str], args: list[str]) -> list[str]:
+        if self._get_value(keys[0]) == args[0]:
+            self._delete(keys[0])
+        addresses = list(self._get_value(keys[1]) or set())
+        self._delete(keys[1])
+        return addresses
+
+    def _release_script(self, keys: list[str], args: list[str]) -> int:
+        released = 0
+        for key in keys:
+            if self._get_value(key) == args[0]:
+                self._delete(key)
+                released += 1
+        return released
@@ -0,0 +1,179 @@
+"""RedisCacheService.get_or_load: single-flight, блокировка между процессами, stale-while-revalidate и сброс"""
+
+import asyncio
+import json
+
+from src.infra.redis.cache_service import RedisCacheService
+from tests.fake_redis import FakeRedis
+
+KEY = "wallet_related_wallets:address"
+
+
+class CountingLoader:
+    """Загрузчик, который считает вызовы и может ждать разрешения на завершение"""
+
+    def __init__(self, value_prefix: str = "value", blocked: bool = False):
+        self.calls = 0
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        if not blocked:
+            self.release.set()
+        self._value_prefix = value_prefix
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        self.started.set()
+        await self.release.wait()
+        return f"{self._value_prefix}-{self.calls}"
+
+
+def make_service(redis: FakeRedis, **kwargs) -> RedisCacheService:
+    return RedisCacheService(redis, lock_poll_seconds=0.001, **kwargs)
+
+
+async def wait_refreshes(service: RedisCacheService) -> None:
+    while service._refreshing:
+        await asyncio.gather(*service._refreshing.values())
+
+
+def test_concurrent_misses_run_loader_once():
+    async def run():
+        service = make_service(FakeRedis())
+        loader = CountingLoader(blocked=True)
+        tasks = [asyncio.create_task(service.get_or_load(KEY, loader, ttl=60)) for _ in range(10)]
+        await loader.started.wait()
+        loader.release.set()
+        assert await asyncio.gather(*tasks) == ["value-1"] * 10
+        assert loader.calls == 1
+
+    asyncio.run(run())
+
+
+def test_other_instance_waits_for_lock():
+    async def run():
+        redis = FakeRedis()
+        first, second = make_service(redis), make_service(redis)
+        first_loader = CountingLoader("first", blocked=True)
+        second_loader = CountingLoader("second")
+
+        first_task = asyncio.create_task(first.get_or_load(KEY, first_loader, ttl=60))
+        await first_loader.started.wait()
+        second_task = asyncio.create_task(second.get_or_load(KEY, second_loader, ttl=60))
+        await asyncio.sleep(0.01)
+        assert not second_task.done()
+
+        first_loader.release.set()
+        assert await asyncio.gather(first_task, second_task) == ["first-1", "first-1"]
+        assert second_loader.calls == 0
+
+    asyncio.run(run())
+
+
+def test_stale_entry_triggers_one_background_refresh():
+    async def run():
+        redis = FakeRedis()
+        service = make_service(redis)
+        loader = CountingLoader()
+        # ttl=0 - запись сразу устаревшая, но отдается еще stale_ttl
+        assert await service.get_or_load(KEY, loader, ttl=0, stale_ttl=60) == "value-1"
+
+        loader.release.clear()
+        results = await asyncio.gather(*[service.get_or_load(KEY, loader, ttl=0, stale_ttl=60) for _ in range(10)])
+        assert results == ["value-1"] * 10
+        await loader.started.wait()
+        loader.release.set()
+        await wait_refreshes(service)
+
+        assert loader.calls == 2
+        assert json.loads(await redis.get(KEY))["value"] == "value-2"
+
+    asyncio.run(run())
+
+
+def test_lock_released_after_load():
+    async def run():
+        redis = FakeRedis()
+        service = make_service(redis)
+        assert await service.get_or_load(KEY, CountingLoader(), ttl=60) == "value-1"
+        assert await redis.get(service.LOCK_KEY.format(key=KEY)) is None
+
+    asyncio.run(run())
+
+
+def test_lock_released_only_by_owner():
+    async def run():
+        redis = FakeRedis()
+        service = make_service(redis)
+        lock_key = service.LOCK_KEY.format(key=KEY)
+
+        async def loader() -> str:
+            # Блокировка истекла во время загрузки и досталась другому процессу
+            redis.expire_now(lock_key)
+            await redis.set(lock_key, "other-owner")
+            return "value"
+
+        assert await service.get_or_load(KEY, loader, ttl=60) == "value"
+        assert await redis.get(lock_key) == "other-owner"
+
+    asyncio.run(run())
+
+
+def test_value_loaded_before_invalidate_is_not_cached():
+    async def run():
+        redis = FakeRedis()
+        service = make_service(redis)
+        loader = CountingLoader(blocked=True)
+
+        task = asyncio.create_task(service.get_or_load(KEY, loader, ttl=60, stale_ttl=3600))
+        await loader.started.wait()
+        await service.invalidate([KEY])
+        loader.release.set()
+
+        # Запросу, который ждал загрузку, значение отдается, но в кеш оно не попадает
+        assert await task == "value-1"
+        assert await redis.get(KEY) is None
+        assert await service.get_or_load(KEY, loader, ttl=60, stale_ttl=3600) == "value-2"
+        assert loader.calls == 2
+        assert json.loads(await redis.get(KEY))["value"] == "value-2"
+
+    asyncio.run(run())
+
+
+def test_background_refresh_started_before_invalidate_is_not_cached():
+    async def run():
+        redis = FakeRedis()
+        service = make_service(redis)
+        loader = CountingLoader()
+        assert await service.get_or_load(KEY, loader, ttl=0, stale_ttl=60) == "value-1"
+
+        loader.release.clear()
+        loader.started.clear()
+        assert await service.get_or_load(KEY, loader, ttl=0, stale_ttl=60) == "value-1"
+        await loader.started.wait()
+        await service.invalidate([KEY])
+        loader.release.set()
+        await wait_refreshes(service)
+
+        assert loader.calls == 2
+        assert await redis.get(KEY) is None
+
+    asyncio.run(run())
+
+
+def test_invalidate_increments_generation_with_ttl():
+    async def run():
+        redis = FakeRedis()
+        service = make_service(redis, generation_ttl_seconds=100)
+        keys = [f"key-{i}" for i in range(5)]
+        for key in keys:
+            await redis.set(key, "{}")
+
+        await service.invalidate(keys, chunk_size=2)
+        await service.invalidate(keys[:1])
+
+        assert [await redis.get(key) for key in keys] == [None] * 5
+        generation_keys = [service.GENERATION_KEY.format(key=key) for key in keys]
+        assert [await redis.get(key) for key in generation_keys] == ["2", "1", "1", "1", "1"]
+        assert all(0 < redis.ttl(key) <= 100 for key in generation_keys)
+
+    asyncio.run(run())
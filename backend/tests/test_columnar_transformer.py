@@ -0,0 +1,160 @@
+import copy
+import dataclasses
+import random
+import string
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+
+from src.application.processes.swaps_loader import columnar_transformer, transformer
+from src.domain.constants import OKX_WALLET_ADDRESS, SOL_ADDRESS
+
+GENERATED_FIELDS = ("id", "wallet_id", "token_id", "created_at", "updated_at")
+
+
+def random_address(rnd: random.Random) -> str:
+    return "".join(rnd.choices(string.ascii_letters + string.digits, k=44))
+
+
+def make_swaps(count: int, seed: int) -> tuple[list[dict], dict]:
+    """Свапы как из выгрузки Flipside: несколько свапов в транзакции, OKX, нулевые и крошечные объемы"""
+    rnd = random.Random(seed)
+    wallets = [random_address(rnd) for _ in range(max(count // 8, 2))] + [OKX_WALLET_ADDRESS]
+    tokens = [random_address(rnd) for _ in range(max(count // 40, 2))]
+    start = datetime(2025, 4, 10, tzinfo=timezone.utc)
+    swaps = []
+    while len(swaps) < count:
+        tx_id = random_address(rnd) * 2
+        seconds = len(swaps) * 3600 // count
+        block_id = 300_000_000 + int(seconds * 2.5)
+        block_timestamp = (start + timedelta(seconds=seconds)).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+        for _ in range(rnd.choice([1, 1, 1, 2, 2, 3, 4])):
+            token = rnd.choice(tokens)
+            is_buy = rnd.random() < 0.55
+            sol_amount = round(rnd.uniform(0.001, 50), 9)
+            token_amount = round(rnd.uniform(1, 1e9), 6)
+            if rnd.random() < 0.03:
+                token_amount = rnd.choice([0.0, 1e-20])
+            swaps.append(
+                {
+                    "tx_id": tx_id,
+                    "block_id": block_id if rnd.random() > 0.01 else None,
+                    "swapper": rnd.choice(wallets),
+                    "swap_from_mint": SOL_ADDRESS if is_buy else token,
+                    "swap_to_mint": token if is_buy else SOL_ADDRESS,
+                    "swap_from_amount": sol_amount if is_buy else token_amount,
+                    "swap_to_amount": token_amount if is_buy else sol_amount,
+                    "block_timestamp": block_timestamp,
+                }
+            )
+    swaps[0]["swapper"] = None
+    # Минуты без цены SOL
+    swaps[-1]["block_timestamp"] = "2025-04-10T05:00:00.000Z"
+    sol_prices = {start + timedelta(minutes=minute): str(round(120 + rnd.random() * 10, 4)) for minute in range(61)}
+    return swaps, sol_prices
+
+
+def comparable(entity) -> tuple:
+    values = {field.name: getattr(entity, field.name) for field in dataclasses.fields(entity)}
+    for name in GENERATED_FIELDS:
+        values.pop(name)
+    return values, entity.wallet_address, entity.token_address
+
+
+@pytest.mark.parametrize("count, seed", [(500, 1), (3000, 2), (3000, 3)])
+def test_vectorized_matches_row_transform(count, seed):
+    swaps, sol_prices = make_swaps(count, seed)
+    wallets, tokens, activities, wallet_tokens = transformer.transform_data(copy.deepcopy(swaps), sol_prices)
+    v_wallets, v_tokens, v_activities, v_wallet_tokens = columnar_transformer.transform_data_vectorized(
+        copy.deepcopy(swaps), sol_prices
+    )
+
+    assert [(w.address, w.first_activity_timestamp, w.last_activity_timestamp) for w in wallets] == [
+        (w.address, w.first_activity_timestamp, w.last_activity_timestamp) for w in v_wallets
+    ]
+    assert [t.address for t in tokens] == [t.address for t in v_tokens]
+    assert [comparable(a) for a in activities] == [comparable(a) for a in v_activities]
+    assert [comparable(wt) for wt in wallet_tokens] == [comparable(wt) for wt in v_wallet_tokens]
+
+
+def test_vectorized_ids_are_unique_and_linked():
+    swaps, sol_prices = make_swaps(2000, 4)
+    wallets, tokens, activities, wallet_tokens = columnar_transformer.transform_data_vectorized(swaps, sol_prices)
+
+    ids = [e.id for e in [*wallets, *tokens, *activities, *wallet_tokens]]
+    assert len(set(ids)) == len(ids)
+    assert [a.id for a in activities] == sorted(a.id for a in activities)
+    wallet_ids = {w.address: w.id for w in wallets}
+    token_ids = {t.address: t.id for t in tokens}
+    for entity in [*activities, *wallet_tokens]:
+        assert entity.wallet_id == wallet_ids[entity.wallet_address]
+        assert entity.token_id == token_ids[entity.token_address]
+
+
+def comparable_by_key(entities, key) -> dict:
+    return {key(entity): comparable(entity)[0] for entity in entities}
+
+
+@pytest.mark.parametrize("transform_data", [transformer.transform_data, columnar_transformer.transform_data_vectorized])
+@pytest.mark.parametrize("shards_count", [1, 2, 4])
+@pytest.mark.parametrize("seed", [5, 6])
+def test_sharded_transform_matches_single_pass(seed, shards_count, transform_data):
+    swaps, sol_prices = make_swaps(3000, seed)
+    rnd = random.Random(seed)
+    for swap in swaps:
+        # Время с точностью до минуты - много свапов разных транзакций с одним временем
+        swap["block_timestamp"] = swap["block_timestamp"][:16] + ":00.000Z"
+        # Частые свапы без цены (крошечное кол-во токенов), в т.ч. самые ранние в связке
+        if rnd.random() < 0.2:
+            swap["swap_to_amount" if swap["swap_from_mint"] == SOL_ADDRESS else "swap_from_amount"] = 1e-20
+
+    wallets, tokens, activities, wallet_tokens = transformer.transform_data(copy.deepcopy(swaps), sol_prices)
+    shards = transformer.shard_swaps_by_tx(copy.deepcopy(swaps), shards_count)
+    assert len(shards) == shards_count
+    m_wallets, m_tokens, m_activities, m_wallet_tokens = transformer.merge_transformed_shards(
+        [transform_data(shard, sol_prices) for shard in shards]
+    )
+
+    assert {(w.address, w.first_activity_timestamp, w.last_activity_timestamp) for w in wallets} == {
+        (w.address, w.first_activity_timestamp, w.last_activity_timestamp) for w in m_wallets
+    }
+    assert {t.address for t in tokens} == {t.address for t in m_tokens}
+    # Части сливаются по очереди, порядок свапов сохраняется только внутри транзакции
+    assert [comparable(a) for a in sorted(activities, key=lambda a: a.tx_hash)] == [
+        comparable(a) for a in sorted(m_activities, key=lambda a: a.tx_hash)
+    ]
+
+    def pair_key(wallet_token):
+        return wallet_token.wallet_address, wallet_token.token_address
+
+    expected = comparable_by_key(wallet_tokens, pair_key)
+    assert comparable_by_key(m_wallet_tokens, pair_key) == expected
+    # Фикстура покрывает связки, где самый ранний свап без цены, а цена есть у более позднего
+    assert any(
+        wt.first_buy_price_usd is not None
+        and any(
+            a.timestamp == wt.first_buy_timestamp and a.token_amount < Decimal("1e-16")
+            for a in activities
+            if (a.wallet_address, a.token_address) == pair_key(wt) and a.event_type == "buy"
+        )
+        for wt in wallet_tokens
+    )
+
+    wallet_ids = {w.address: w.id for w in m_wallets}
+    token_ids = {t.address: t.id for t in m_tokens}
+    for entity in [*m_activities, *m_wallet_tokens]:
+        assert entity.wallet_id == wallet_ids[entity.wallet_address]
+        assert entity.token_id == token_ids[entity.token_address]
+
+
+def test_records_to_columns_by_record_batches(monkeypatch):
+    swaps, _ = make_swaps(500, 7)
+    columns = columnar_transformer.records_to_columns(swaps)
+    monkeypatch.setattr(columnar_transformer, "RECORD_BATCH_SIZE", 37)
+    batched_columns = columnar_transformer.records_to_columns(swaps)
+
+    assert columns.keys() == batched_columns.keys()
+    for name, values in columns.items():
+        assert batched_columns[name].tolist() == values.tolist(), name
+    assert columnar_transformer.records_to_columns([])["tx_id"].tolist() == []
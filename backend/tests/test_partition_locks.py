@@ -0,0 +1,40 @@
+"""Партиции кошельков: разбиение по адресу и gather_partitions с ограничением одновременных сессий"""
+
+import asyncio
+
+from src.infra.db.sqlalchemy.locks import gather_partitions, get_wallet_partition, partition_by_wallet_address
+
+
+def test_partition_by_wallet_address_is_stable_and_sorted():
+    addresses = [f"wallet-{i}" for i in range(50)]
+    partitions = partition_by_wallet_address(addresses, 4, get_address=lambda address: address)
+
+    assert list(partitions) == sorted(partitions)
+    assert sorted(address for objects in partitions.values() for address in objects) == sorted(addresses)
+    for partition, objects in partitions.items():
+        assert objects == sorted(objects)
+        assert all(get_wallet_partition(address, 4) == partition for address in objects)
+
+
+def test_gather_partitions_limits_concurrent_sessions():
+    async def run():
+        semaphore = asyncio.Semaphore(3)
+        active = max_active = 0
+
+        async def partition_task(partition: int) -> int:
+            nonlocal active, max_active
+            active += 1
+            max_active = max(max_active, active)
+            await asyncio.sleep(0.001)
+            active -= 1
+            return partition
+
+        # Два параллельных батча делят один семафор процесса
+        results = await asyncio.gather(
+            gather_partitions([partition_task(partition) for partition in range(10)], semaphore),
+            gather_partitions([partition_task(partition) for partition in range(10, 20)], semaphore),
+        )
+        assert results == [list(range(10)), list(range(10, 20))]
+        assert max_active == 3
+
+    asyncio.run(run())
@@ -0,0 +1,83 @@
+"""Протокол очереди обновления статистики (RedisWalletRefreshQueue): add / pop_batch / release"""
+
+import asyncio
+
+from src.infra.redis.wallet_refresh_queue import RedisWalletRefreshQueue
+from tests.fake_redis import FakeRedis
+
+
+def make_queue() -> tuple[RedisWalletRefreshQueue, FakeRedis]:
+    redis = FakeRedis()
+    return RedisWalletRefreshQueue(redis, window_seconds=60, pending_ttl_seconds=600), redis
+
+
+def test_add_opens_batch_and_joins_open_batch():
+    async def run():
+        queue, _ = make_queue()
+        batch_id, new_batch_id = await queue.add("a")
+        assert new_batch_id == batch_id
+        assert await queue.add("b") == (batch_id, None)
+        assert await queue.pop_batch(batch_id) == ["a", "b"]
+
+    asyncio.run(run())
+
+
+def test_duplicate_add_returns_pending_batch():
+    async def run():
+        queue, _ = make_queue()
+        batch_id, _ = await queue.add("a")
+        assert await queue.add("a") == (batch_id, None)
+        # Кошелек ждет обновления и после закрытия окна батча - повторный запрос получает тот же батч
+        assert await queue.pop_batch(batch_id) == ["a"]
+        assert await queue.add("a") == (batch_id, None)
+
+    asyncio.run(run())
+
+
+def test_add_after_pop_opens_new_batch():
+    async def run():
+        queue, _ = make_queue()
+        batch_id, _ = await queue.add("a")
+        assert await queue.pop_batch(batch_id) == ["a"]
+
+        next_batch_id, new_batch_id = await queue.add("b")
+        assert next_batch_id != batch_id
+        assert new_batch_id == next_batch_id
+        assert await queue.pop_batch(batch_id) == []
+        assert await queue.pop_batch(next_batch_id) == ["b"]
+
+    asyncio.run(run())
+
+
+def test_pop_batch_keeps_newer_open_batch():
+    async def run():
+        queue, redis = make_queue()
+        batch_id, _ = await queue.add("a")
+        # Окно первого батча истекло, открыт следующий - забор первого батча его не закрывает
+        redis.expire_now(queue.CURRENT_BATCH_KEY)
+        next_batch_id, _ = await queue.add("b")
+        assert await queue.pop_batch(batch_id) == ["a"]
+        assert await queue.add("c") == (next_batch_id, None)
+
+    asyncio.run(run())
+
+
+def test_release_drops_only_marks_of_this_batch():
+    async def run():
+        queue, redis = make_queue()
+        batch_id, _ = await queue.add("a")
+        await queue.add("b")
+        assert await queue.pop_batch(batch_id) == ["a", "b"]
+
+        # Отметка "b" истекла, кошелек попал в следующий батч до снятия отметок первого
+        redis.expire_now(queue.PENDING_KEY.format(address="b"))
+        next_batch_id, _ = await queue.add("b")
+        assert next_batch_id != batch_id
+
+        await queue.release(batch_id, ["a", "b"])
+        assert await redis.get(queue.PENDING_KEY.format(address="a")) is None
+        assert await redis.get(queue.PENDING_KEY.format(address="b")) == next_batch_id
+        assert await queue.add("b") == (next_batch_id, None)
+        assert (await queue.add("a"))[0] == next_batch_id
+
+    asyncio.run(run())
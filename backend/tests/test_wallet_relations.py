@@ -0,0 +1,257 @@
+"""
+Связанные кошельки из wallet_relation (wallet_relations_updater.build_wallet_relations + GetWalletRelatedWalletsHandler)
+совпадают с прежним поиском по токенам кошелька при запросе (первые сделки кошелька и соседние сделки по токену)
+на одних и тех же свапах
+"""
+
+import asyncio
+import random
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from src.application.handlers.wallet.queries.get_wallet_related_wallets import (  # noqa: E402
+    GetWalletRelatedWalletsHandler,
+    classify_related_wallet_status,
+)
+from src.application.processes.wallet_statistic_updaters import wallet_relations_updater  # noqa: E402
+from src.domain.entities.swap import SwapEventType  # noqa: E402
+from src.domain.entities.wallet import Wallet  # noqa: E402
+
+BASE_TIMESTAMP = datetime(2025, 5, 1, tzinfo=timezone.utc)
+BLOCKS_BEFORE = wallet_relations_updater.BLOCKS_BEFORE
+BLOCKS_AFTER = wallet_relations_updater.BLOCKS_AFTER
+
+
+def make_fixture(seed_value: int) -> tuple[list[dict], dict[uuid.UUID, dict]]:
+    """Свапы кошельков вокруг общих блоков токенов и данные кошельков (статистика, бот)"""
+    rnd = random.Random(seed_value)
+    wallets = {}
+    for i in range(12):
+        wallet_id = uuid.UUID(int=rnd.getrandbits(128))
+        wallets[wallet_id] = {
+            "id": wallet_id,
+            "address": f"wallet-{i}",
+            "is_bot": i == 11,
+            "last_activity_timestamp": BASE_TIMESTAMP + timedelta(hours=i),
+            "total_token_count": rnd.choice([None, 3, 5, 8, 15, 40, 500, 20000]),
+            "total_profit_usd_30d": rnd.choice([None, 10.5, -3.25, 1200.0]),
+            "total_profit_multiplier_30d": rnd.choice([None, 0.5, 2.0, 31.0]),
+        }
+
+    swaps = []
+    microseconds = iter(rnd.sample(range(10**6), 10**5))
+    for token_index in range(25):
+        token_id = uuid.UUID(int=rnd.getrandbits(128))
+        buy_block = 1000 * (token_index + 1)
+        sell_block = buy_block + rnd.randint(5, 50)
+        for wallet_id in rnd.sample(list(wallets), rnd.randint(2, len(wallets))):
+            for event_type, base_block in ((SwapEventType.BUY, buy_block), (SwapEventType.SELL, sell_block)):
+                if rnd.random() < 0.1:
+                    continue  # Кошелек без покупки или без продажи токена
+                for _ in range(rnd.choice([1, 1, 2, 3])):
+                    block_id = base_block + rnd.randint(-BLOCKS_BEFORE - 2, BLOCKS_AFTER + 2)
+                    swaps.append(
+                        {
+                            "wallet_id": wallet_id,
+                            "token_id": token_id,
+                            "event_type": event_type,
+                            "block_id": block_id,
+                            # Уникальное время - порядок сделок в одном блоке однозначен
+                            "timestamp": BASE_TIMESTAMP + timedelta(seconds=block_id, microseconds=next(microseconds)),
+                        }
+                    )
+    return swaps, wallets
+
+
+def first_swap(swaps: list[dict]) -> dict | None:
+    return min(swaps, key=lambda swap: (swap["block_id"], swap["timestamp"]), default=None)
+
+
+def group_swaps(swaps: list[dict]) -> dict[tuple, list[dict]]:
+    swaps_by_key = defaultdict(list)
+    for swap in swaps:
+        swaps_by_key[(swap["wallet_id"], swap["token_id"], swap["event_type"])].append(swap)
+    return dict(swaps_by_key)
+
+
+def tokens_with_buy_and_sell(wallet_id: uuid.UUID, swaps_by_key: dict) -> set[uuid.UUID]:
+    return {
+        token_id
+        for owner_id, token_id, _ in swaps_by_key
+        if owner_id == wallet_id
+        and (wallet_id, token_id, SwapEventType.BUY) in swaps_by_key
+        and (wallet_id, token_id, SwapEventType.SELL) in swaps_by_key
+    }
+
+
+def baseline_related_wallets_map(wallet_id: uuid.UUID, swaps: list[dict]) -> dict:
+    """Прежний поиск при запросе: по каждому токену кошелька с покупкой и продажей - соседние сделки"""
+    swaps_by_key = group_swaps(swaps)
+    related_wallets_map = defaultdict(dict)
+    for token_id in tokens_with_buy_and_sell(wallet_id, swaps_by_key):
+        first_buy = first_swap(swaps_by_key[(wallet_id, token_id, SwapEventType.BUY)])
+        first_sell = first_swap(swaps_by_key[(wallet_id, token_id, SwapEventType.SELL)])
+
+        def get_neighbors(event_type: str, block_id: int) -> list[dict]:
+            neighbors = [
+                swap
+                for swap in swaps
+                if swap["token_id"] == token_id
+                and swap["event_type"] == event_type
+                and block_id - BLOCKS_BEFORE <= swap["block_id"] <= block_id + BLOCKS_AFTER
+                and swap["wallet_id"] != wallet_id
+            ]
+            return sorted(neighbors, key=lambda swap: (swap["block_id"], swap["timestamp"]))
+
+        wallets_map = defaultdict(lambda: {"buy": None, "sell": None})
+        for event, first in (("buy", first_buy), ("sell", first_sell)):
+            for activity in get_neighbors(first["event_type"], first["block_id"]):
+                current = wallets_map[activity["wallet_id"]][event]
+                if current is None or activity["block_id"] < current["block_id"]:
+                    wallets_map[activity["wallet_id"]][event] = activity
+
+        for related_wallet_id, wallet_data in wallets_map.items():
+            if not ((fb := wallet_data["buy"]) and (fs := wallet_data["sell"])):
+                continue
+            buy_status = wallet_relations_updater.compare_transaction_blocks(fb["block_id"], first_buy["block_id"])
+            sell_status = wallet_relations_updater.compare_transaction_blocks(fs["block_id"], first_sell["block_id"])
+            related_wallets_map[related_wallet_id][token_id] = {
+                "status": wallet_relations_updater.classify_token_trade_status(buy_status, sell_status),
+                "sell_timestamp": fs["timestamp"],
+            }
+    return related_wallets_map
+
+
+def baseline_related_wallets(wallet_id: uuid.UUID, swaps: list[dict], wallets: dict) -> list[dict]:
+    """Прежний отбор и расчет связанных кошельков (не меньше 3 общих токенов, без ботов)"""
+    result = []
+    for related_wallet_id, tokens in baseline_related_wallets_map(wallet_id, swaps).items():
+        related_wallet = wallets[related_wallet_id]
+        if len(tokens) < 3 or related_wallet["is_bot"]:
+            continue
+        total_token_count = related_wallet["total_token_count"] or 0
+        if total_token_count and total_token_count >= 20000:
+            continue
+        status_counts = Counter(token["status"] for token in tokens.values())
+        intersected_tokens_count = sum(status_counts.values())
+        wallet_status, color = classify_related_wallet_status(
+            set(status_counts),
+            intersected_tokens_count,
+            total_token_count,
+            status_counts["before"],
+            status_counts["after"],
+        )
+        result.append(
+            {
+                "address": related_wallet["address"],
+                "last_activity_timestamp": related_wallet["last_activity_timestamp"],
+                "last_intersected_tokens_trade_timestamp": max(token["sell_timestamp"] for token in tokens.values()),
+                "total_profit_usd_30d": related_wallet["total_profit_usd_30d"],
+                "total_profit_multiplier_30d": related_wallet["total_profit_multiplier_30d"],
+                "total_token_count": total_token_count,
+                "intersected_tokens_count": intersected_tokens_count,
+                "intersected_tokens_percent": (
+                    round(intersected_tokens_count / total_token_count * 100, 2) if total_token_count else None
+                ),
+                "mixed_count": status_counts["mixed"],
+                "same_count": status_counts["same"],
+                "before_count": status_counts["before"],
+                "after_count": status_counts["after"],
+                "color": color,
+                "wallet_status": wallet_status,
+            }
+        )
+    return sorted(result, key=lambda wallet: wallet["last_intersected_tokens_trade_timestamp"], reverse=True)
+
+
+def first_trades_neighbors(wallet_ids: list[uuid.UUID], swaps: list[dict]) -> list[dict]:
+    """Строки GET_FIRST_TRADES_NEIGHBORS: первая сделка связанного кошелька рядом с первыми сделками кошелька"""
+    swaps_by_key = group_swaps(swaps)
+    neighbors = []
+    for wallet_id in wallet_ids:
+        for token_id in tokens_with_buy_and_sell(wallet_id, swaps_by_key):
+            for event_type in (SwapEventType.BUY, SwapEventType.SELL):
+                anchor_block_id = first_swap(swaps_by_key[(wallet_id, token_id, event_type)])["block_id"]
+                by_wallet = defaultdict(list)
+                for swap in swaps:
+                    if (
+                        swap["token_id"] == token_id
+                        and swap["event_type"] == event_type
+                        and anchor_block_id - BLOCKS_BEFORE <= swap["block_id"] <= anchor_block_id + BLOCKS_AFTER
+                        and swap["wallet_id"] != wallet_id
+                    ):
+                        by_wallet[swap["wallet_id"]].append(swap)
+                for related_wallet_id, related_swaps in by_wallet.items():
+                    neighbor = first_swap(related_swaps)
+                    neighbors.append(
+                        {
+                            "wallet_id": wallet_id,
+                            "token_id": token_id,
+                            "event_type": event_type,
+                            "anchor_block_id": anchor_block_id,
+                            "related_wallet_id": related_wallet_id,
+                            "block_id": neighbor["block_id"],
+                            "timestamp": neighbor["timestamp"],
+                        }
+                    )
+    return neighbors
+
+
+class FakeWalletRepository:
+    """get_related_wallets - строки запроса по wallet_relation со статистикой связанного кошелька"""
+
+    def __init__(self, wallets: dict, relations: list):
+        self._wallets = wallets
+        self._relations = relations
+
+    async def get_by_address(self, address: str) -> Wallet | None:
+        for wallet in self._wallets.values():
+            if wallet["address"] == address:
+                return Wallet(id=wallet["id"], address=address)
+        return None
+
+    async def get_related_wallets(self, wallet_id: uuid.UUID) -> list[dict]:
+        rows = []
+        for relation in self._relations:
+            related_wallet = self._wallets[relation.related_wallet_id]
+            if relation.wallet_id != wallet_id or related_wallet["is_bot"]:
+                continue
+            rows.append(
+                {
+                    "address": related_wallet["address"],
+                    "last_activity_timestamp": related_wallet["last_activity_timestamp"],
+                    "last_intersected_tokens_trade_timestamp": relation.last_intersected_tokens_trade_timestamp,
+                    "total_profit_usd_30d": related_wallet["total_profit_usd_30d"],
+                    "total_profit_multiplier_30d": related_wallet["total_profit_multiplier_30d"],
+                    "total_token_count": related_wallet["total_token_count"],
+                    "before_count": relation.before_count,
+                    "after_count": relation.after_count,
+                    "same_count": relation.same_count,
+                    "mixed_count": relation.mixed_count,
+                }
+            )
+        return sorted(rows, key=lambda row: row["last_intersected_tokens_trade_timestamp"], reverse=True)
+
+
+@pytest.mark.parametrize("seed_value", [1, 2, 3])
+def test_stored_relations_match_per_request_search(seed_value):
+    swaps, wallets = make_fixture(seed_value)
+    relations = wallet_relations_updater.build_wallet_relations(
+        first_trades_neighbors(list(wallets), swaps), BASE_TIMESTAMP
+    )
+    handler = GetWalletRelatedWalletsHandler(FakeWalletRepository(wallets, relations))
+
+    non_empty = 0
+    for wallet_id, wallet in wallets.items():
+        expected = handler._build_response(baseline_related_wallets(wallet_id, swaps, wallets))
+        actual = asyncio.run(handler(wallet["address"]))
+        assert actual == expected, wallet["address"]
+        non_empty += bool(
+            actual.copying_wallets or actual.copied_by_wallets or actual.similar_wallets or actual.undetermined_wallets
+        )
+    assert non_empty
@@ -0,0 +1,193 @@
+import random
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from multiprocessing import get_context
+
+import numpy as np
+import pytest
+
+from src.application.processes.wallet_statistic_updaters import calculations, columnar_calculations
+from src.domain.entities.wallet import (
+    Wallet,
+    WalletStatistic7d,
+    WalletStatistic30d,
+    WalletStatisticAll,
+    WalletToken,
+)
+
+CURRENT_DATETIME = datetime(2025, 5, 1, 12, tzinfo=timezone.utc)
+
+
+def random_amount(rnd: random.Random) -> Decimal:
+    # Небольшой набор значений, чтобы в медианах были одинаковые и неразличимые во float64 значения
+    return rnd.choice(
+        [
+            Decimal(0),
+            Decimal("10"),
+            Decimal("10.000000000000000001"),
+            Decimal("10.000000000000000002"),
+            Decimal(rnd.randint(1, 10**6)) / 1000,
+            Decimal(str(rnd.uniform(0, 5000))),
+        ]
+    )
+
+
+def random_timestamp(rnd: random.Random) -> datetime:
+    return CURRENT_DATETIME - timedelta(seconds=rnd.randint(0, 60 * 86400), microseconds=rnd.randint(0, 999999))
+
+
+def make_wallet_token(rnd: random.Random, wallet_id: uuid.UUID) -> WalletToken:
+    buys_count = rnd.choice([0, 1, 1, 2, 5])
+    sales_count = rnd.choice([0, 0, 1, 3])
+    if not buys_count and not sales_count:
+        buys_count = 1
+    buy_usd = random_amount(rnd) if buys_count else Decimal(0)
+    sell_usd = random_amount(rnd) if sales_count else Decimal(0)
+    first_buy = random_timestamp(rnd) if buys_count else None
+    first_sell = None
+    if sales_count:
+        first_sell = first_buy + timedelta(seconds=rnd.randint(0, 86400 * 3)) if first_buy else random_timestamp(rnd)
+    profit_usd = sell_usd - buy_usd
+    return WalletToken(
+        wallet_id=wallet_id,
+        total_buys_count=buys_count,
+        total_buy_amount_usd=buy_usd,
+        total_buy_amount_token=random_amount(rnd) if buys_count else Decimal(0),
+        first_buy_price_usd=rnd.choice([None, Decimal(0), random_amount(rnd)]) if buys_count else None,
+        first_buy_timestamp=first_buy,
+        total_sales_count=sales_count,
+        total_sell_amount_usd=sell_usd,
+        total_sell_amount_token=random_amount(rnd) if sales_count else Decimal(0),
+        first_sell_timestamp=first_sell,
+        total_profit_usd=profit_usd,
+        total_profit_percent=round(float(profit_usd / buy_usd * 100), 2) if buy_usd else None,
+        first_buy_sell_duration=int((first_sell - first_buy).total_seconds()) if first_buy and first_sell else None,
+        total_swaps_from_txs_with_mt_3_swappers=rnd.choice([0, 0, 0, 1, 2]),
+        total_swaps_from_arbitrage_swap_events=rnd.choice([0, 0, 0, 1]),
+    )
+
+
+def make_wallets(count: int, seed: int) -> list[Wallet]:
+    rnd = random.Random(seed)
+    wallets = []
+    for _ in range(count):
+        wallet_id = uuid.UUID(int=rnd.getrandbits(128))
+        wallets.append(
+            Wallet(
+                id=wallet_id,
+                address=str(wallet_id),
+                stats_7d=WalletStatistic7d(wallet_id=wallet_id),
+                stats_30d=WalletStatistic30d(wallet_id=wallet_id),
+                stats_all=WalletStatisticAll(wallet_id=wallet_id),
+                tokens=[make_wallet_token(rnd, wallet_id) for _ in range(rnd.choice([0, 1, 2, 5, 30, 200]))],
+            )
+        )
+    return wallets
+
+
+def row_stats(wallet: Wallet, period: int) -> dict:
+    stats = WalletStatistic7d()
+    tokens = calculations.filter_period_tokens(wallet.tokens, period, CURRENT_DATETIME)
+    calculations.recalculate_wallet_period_stats(stats, tokens)
+    return {name: getattr(stats, name) for name in calculations.STATS_FINGERPRINT_FIELDS}
+
+
+def vectorized_stats(period_values: dict) -> dict:
+    stats = WalletStatistic7d()
+    for name, value in period_values.items():
+        setattr(stats, name, value)
+    return {name: getattr(stats, name) for name in calculations.STATS_FINGERPRINT_FIELDS}
+
+
+def calculate_columns(wallets: list[Wallet]) -> dict:
+    rows = columnar_calculations.wallet_tokens_to_rows(wallets)
+    return columnar_calculations.wallet_token_rows_to_columns(wallets, rows)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_vectorized_stats_match_row_stats(seed):
+    wallets = make_wallets(40, seed)
+    stats_by_period, next_expiry = columnar_calculations.calculate_columns_stats(
+        calculate_columns(wallets), len(wallets), CURRENT_DATETIME
+    )
+
+    for period, period_stats in stats_by_period.items():
+        for wallet, values in zip(wallets, period_stats):
+            assert vectorized_stats(values) == row_stats(wallet, period), (wallet.address, period)
+    assert next_expiry == [
+        calculations.calculate_next_period_expiry(wallet.tokens, CURRENT_DATETIME) for wallet in wallets
+    ]
+
+
+def test_packed_columns_roundtrip():
+    wallets = make_wallets(30, 10)
+    columns = calculate_columns(wallets)
+    unpacked = columnar_calculations.unpack_columns(columnar_calculations.pack_columns(columns))
+
+    assert unpacked.keys() == columns.keys()
+    for name, values in columns.items():
+        assert unpacked[name].dtype == values.dtype, name
+        np.testing.assert_array_equal(unpacked[name], values, err_msg=name)
+    assert columnar_calculations.calculate_packed_columns_stats(
+        columnar_calculations.pack_columns(columns), len(wallets), CURRENT_DATETIME
+    ) == columnar_calculations.calculate_columns_stats(columns, len(wallets), CURRENT_DATETIME)
+
+
+def test_packed_empty_columns_roundtrip():
+    columns = calculate_columns(make_wallets(3, 11)[:0])
+    unpacked = columnar_calculations.unpack_columns(columnar_calculations.pack_columns(columns))
+    assert unpacked.keys() == columns.keys()
+    assert all(len(values) == 0 for values in unpacked.values())
+
+
+def stats_fingerprints(wallets: list[Wallet]) -> list[int]:
+    return [calculations.calculate_stats_fingerprint(wallet.stats_all) for wallet in wallets]
+
+
+def test_stats_fingerprint():
+    wallets = make_wallets(30, 12)
+    for wallet in wallets:
+        calculations.calculate_wallet_stats(wallet)
+    fingerprints = stats_fingerprints(wallets)
+
+    for wallet, fingerprint in zip(wallets, fingerprints):
+        stats = wallet.stats_all
+        # Служебные поля не входят в отпечаток
+        assert calculations.calculate_stats_fingerprint(replace(stats, updated_at=None, created_at=None)) == fingerprint
+        # Равные значения разных типов дают тот же отпечаток
+        assert calculations.calculate_stats_fingerprint(replace(stats, total_token=Decimal(stats.total_token))) == (
+            fingerprint
+        )
+        assert calculations.calculate_stats_fingerprint(replace(stats, total_token=stats.total_token + 1)) != (
+            fingerprint
+        )
+        assert calculations.calculate_stats_fingerprint(replace(stats, winrate=None)) != fingerprint or (
+            stats.winrate is None
+        )
+        assert calculations.calculate_stats_fingerprint(replace(stats, pnl_gt_5x_percent=0)) != fingerprint or (
+            stats.pnl_gt_5x_percent == 0
+        )
+
+    # Отпечаток не зависит от процесса (хеш строк в каждом процессе свой)
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+        assert executor.submit(stats_fingerprints, wallets).result() == fingerprints
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_next_period_expiry_matches_period_filter(seed):
+    for wallet in make_wallets(40, 20 + seed):
+        expiry = calculations.calculate_next_period_expiry(wallet.tokens, CURRENT_DATETIME)
+        period_tokens = {
+            period: calculations.filter_period_tokens(wallet.tokens, period, CURRENT_DATETIME) for period in (7, 30)
+        }
+        if expiry is None:
+            # Токены уже вне периодов или их нет - набор больше не меняется со временем
+            later = CURRENT_DATETIME + timedelta(days=31)
+            assert all(calculations.filter_period_tokens(wallet.tokens, p, later) == period_tokens[p] for p in (7, 30))
+            continue
+        before = expiry - timedelta(microseconds=1)
+        assert all(calculations.filter_period_tokens(wallet.tokens, p, before) == period_tokens[p] for p in (7, 30))
+        assert any(calculations.filter_period_tokens(wallet.tokens, p, expiry) != period_tokens[p] for p in (7, 30))
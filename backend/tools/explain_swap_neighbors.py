@@ -0,0 +1,155 @@
+"""
+Замер запроса соседних сделок (LATERAL из GET_FIRST_TRADES_NEIGHBORS / get_neighbors_by_token) по самым
+торгуемым токенам: EXPLAIN (ANALYZE, BUFFERS) с индексом idx_swap_token_event_block и без него.
+
+Без индекса запрос выполняется в транзакции с DROP INDEX, которая затем откатывается. DROP INDEX держит
+эксклюзивную блокировку swap до конца транзакции - запускать на копии БД или при остановленном загрузчике.
+
+    python -m tools.explain_swap_neighbors --tokens 20 --anchors 50
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+
+from src.settings import config
+
+INDEX_NAME = "idx_swap_token_event_block"
+
+# Самые торгуемые токены по выборке строк swap (полный подсчет по swap слишком долгий)
+GET_TOP_TOKENS = """
+    SELECT token_id, count(*) AS swaps_count
+    FROM swap TABLESAMPLE SYSTEM (:sample_percent)
+    GROUP BY token_id
+    ORDER BY swaps_count DESC
+    LIMIT :tokens
+"""
+
+# Тот же LATERAL, что и в GET_FIRST_TRADES_NEIGHBORS, для первых покупок кошельков по одному токену
+EXPLAIN_TOKEN_NEIGHBORS = """
+    EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)
+    WITH anchors AS (
+      SELECT wallet_id, token_id, 'buy'::varchar AS event_type, first_buy_block_id AS block_id
+      FROM wallet_token
+      WHERE token_id = :token_id AND first_buy_block_id IS NOT NULL
+      LIMIT :anchors
+    )
+    SELECT a.wallet_id, n.wallet_id AS related_wallet_id, n.block_id, n.timestamp
+    FROM anchors a
+    CROSS JOIN LATERAL (
+      SELECT DISTINCT ON (s.wallet_id) s.wallet_id, s.block_id, s.timestamp
+      FROM swap s
+      WHERE s.token_id = a.token_id
+        AND s.event_type = a.event_type
+        AND s.block_id BETWEEN a.block_id - :blocks_before AND a.block_id + :blocks_after
+        AND s.wallet_id <> a.wallet_id
+      ORDER BY s.wallet_id, s.block_id, s.timestamp
+    ) n
+"""
+
+
+async def explain(connection: AsyncConnection, params: dict, repeat: int) -> dict:
+    """Лучший из repeat прогонов (по времени выполнения) с буферами верхнего узла плана"""
+    runs = []
+    for _ in range(repeat):
+        result = await connection.execute(text(EXPLAIN_TOKEN_NEIGHBORS), params)
+        plan = result.scalar()
+        plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]
+        runs.append(
+            {
+                "time_ms": plan["Execution Time"],
+                "planning_ms": plan["Planning Time"],
+                "shared_hit": plan["Plan"].get("Shared Hit Blocks", 0),
+                "shared_read": plan["Plan"].get("Shared Read Blocks", 0),
+                "rows": plan["Plan"].get("Actual Rows", 0),
+            }
+        )
+    return min(runs, key=lambda run: run["time_ms"])
+
+
+async def explain_tokens(connection: AsyncConnection, tokens: list, args) -> list[dict]:
+    results = []
+    for token_id, _ in tokens:
+        params = {
+            "token_id": token_id,
+            "anchors": args.anchors,
+            "blocks_before": args.blocks_before,
+            "blocks_after": args.blocks_after,
+        }
+        results.append(await explain(connection, params, args.repeat))
+    return results
+
+
+def print_report(tokens: list, with_index: list[dict], without_index: list[dict] | None) -> None:
+    header = f"{'token_id':<38} {'sampled':>8} {'rows':>7} {'with idx, ms':>13} {'hit/read':>15}"
+    if without_index:
+        header += f" {'without idx, ms':>16} {'hit/read':>15} {'speedup':>8}"
+    print(header)
+    for i, (token_id, swaps_count) in enumerate(tokens):
+        run = with_index[i]
+        line = (
+            f"{str(token_id):<38} {swaps_count:>8} {run['rows']:>7} {run['time_ms']:>13.2f}"
+            f" {run['shared_hit']:>7}/{run['shared_read']:<7}"
+        )
+        if without_index:
+            other = without_index[i]
+            speedup = other["time_ms"] / run["time_ms"] if run["time_ms"] else 0
+            line += f" {other['time_ms']:>16.2f} {other['shared_hit']:>7}/{other['shared_read']:<7} {speedup:>7.1f}x"
+        print(line)
+
+    def summary(runs: list[dict]) -> str:
+        times = [run["time_ms"] for run in runs]
+        return f"всего {sum(times):.2f} мс, медиана {statistics.median(times):.2f} мс, макс {max(times):.2f} мс"
+
+    print(f"С индексом: {summary(with_index)}")
+    if without_index:
+        print(f"Без индекса: {summary(without_index)}")
+
+
+async def main(args) -> None:
+    engine = create_async_engine(config.db.url_sa)
+    try:
+        async with engine.connect() as connection:
+            result = await connection.execute(
+                text(GET_TOP_TOKENS), {"sample_percent": args.sample_percent, "tokens": args.tokens}
+            )
+            tokens = result.all()
+            await connection.commit()
+            if not tokens:
+                print("В выборке swap нет строк")
+                return
+
+            with_index = await explain_tokens(connection, tokens, args)
+            await connection.commit()
+
+            without_index = None
+            if not args.skip_without_index:
+                await connection.execute(
+                    text("SELECT set_config('lock_timeout', :lock_timeout, true)"), {"lock_timeout": args.lock_timeout}
+                )
+                await connection.execute(text(f"DROP INDEX {INDEX_NAME}"))
+                try:
+                    without_index = await explain_tokens(connection, tokens, args)
+                finally:
+                    await connection.rollback()  # Индекс возвращается
+    finally:
+        await engine.dispose()
+
+    print_report(tokens, with_index, without_index)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=20, help="Кол-во самых торгуемых токенов")
+    parser.add_argument("--anchors", type=int, default=50, help="Кол-во первых покупок токена (якорей) в запросе")
+    parser.add_argument("--blocks-before", type=int, default=3)
+    parser.add_argument("--blocks-after", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3, help="Прогонов на токен, берется лучший")
+    parser.add_argument("--sample-percent", type=float, default=1, help="Процент страниц swap для выбора токенов")
+    parser.add_argument("--lock-timeout", default="5s", help="Ожидание блокировки swap для DROP INDEX")
+    parser.add_argument("--skip-without-index", action="store_true", help="Только замер с индексом")
+    asyncio.run(main(parser.parse_args()))